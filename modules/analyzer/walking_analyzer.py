@@ -0,0 +1,265 @@
+"""
+batch walking cycle and step analysis of motion libraries
+
+clips are analyzed in worker processes. each worker computes global positions of all joints by one forward kinematics
+and sends back only small per-clip arrays (WalkingClip): foot contact masks, steps, step lengths and distances of
+postures to the first posture of the walking cycle. the end zone search of walking cycles runs on these arrays in
+the calling process, so tables of other end zone sizes are made without reading files or forward kinematics again
+"""
+import concurrent.futures
+import csv
+import hashlib
+import os
+import traceback
+
+import motion.contact as contact
+import motion.gait as gait
+import resource.batch_loader as batch_loader
+import resource.hmc_loader as hmc_loader
+
+DEFAULT_FOOT_LABELS = ('LeftFoot', 'RightFoot')
+DEFAULT_END_ZONE_SIZE = 10
+
+TABLE_COLUMNS = ('clip', 'cycle_start', 'cycle_end', 'step_num', 'step_lengths', 'mean_step_length', 'cadence')
+
+
+class WalkingClip:
+    def __init__(self, clip, fps, frame_num, foot_contacts, steps, step_lengths, cycle_start, rough_cycle_end,
+                 start_distances):
+        """
+        :param clip: path or key of the clip
+        :param fps:
+        :param frame_num:
+        :param foot_contacts: (F, 2) bool contact masks of the left and right foot
+        :param steps: (N, 2) first and last frames of steps. see gait.get_walking_steps
+        :param step_lengths: (N,) horizontal distances of feet landing at the first and last frames of steps
+        :param cycle_start: first frame of the walking cycle. None if the clip has no walking cycle
+        :param rough_cycle_end: see gait.get_rough_walking_cycle
+        :param start_distances: (F,) distances of postures to the posture of cycle_start
+        """
+        self.clip = clip
+        self.fps = fps
+        self.frame_num = frame_num
+        self.foot_contacts = foot_contacts
+        self.steps = steps
+        self.step_lengths = step_lengths
+        self.cycle_start = cycle_start
+        self.rough_cycle_end = rough_cycle_end
+        self.start_distances = start_distances
+
+    def get_cycle(self, end_zone_size=DEFAULT_END_ZONE_SIZE):
+        """
+        :return: [first frame, last frame] of the walking cycle. None if the clip has no walking cycle
+        """
+        if self.cycle_start is None:
+            return None
+        return [self.cycle_start, gait.get_cycle_end_frame(self.start_distances, self.rough_cycle_end, end_zone_size)]
+
+    def get_cadence(self):
+        """
+        :return: steps per minute. nan if the clip has no step
+        """
+        if len(self.steps) == 0 or self.steps[-1, 1] == self.steps[0, 0]:
+            return float('nan')
+        return len(self.steps) * 60. * self.fps / float(self.steps[-1, 1] - self.steps[0, 0])
+
+    def get_row(self, end_zone_size=DEFAULT_END_ZONE_SIZE):
+        """
+        :return: dict of TABLE_COLUMNS -> values
+        """
+        cycle = self.get_cycle(end_zone_size) or [None, None]
+        return {'clip': self.clip,
+                'cycle_start': cycle[0],
+                'cycle_end': cycle[1],
+                'step_num': len(self.steps),
+                'step_lengths': self.step_lengths.tolist(),
+                'mean_step_length': float(self.step_lengths.mean()) if len(self.step_lengths) > 0 else float('nan'),
+                'cadence': self.get_cadence()}
+
+
+class WalkingAnalyzer:
+    def __init__(self, h_ref, v_ref, h_index=1, foot_labels=DEFAULT_FOOT_LABELS, cycle_foot=0, max_workers=None,
+                 read_options=None, **contact_options):
+        """
+        :param h_ref: height threshold of foot contacts. see contact.get_contact_mask
+        :param v_ref: speed threshold of foot contacts
+        :param h_index: index of height direction. if z-up, h_index is 2. if y-up h_index is 1
+        :param foot_labels: labels of the left and right foot joints
+        :param cycle_foot: 0 or 1. walking cycles are found from contacts of the left or right foot
+        :param max_workers: number of worker processes. os.cpu_count() if None. clips are analyzed in this process if 1
+        :param read_options: keyword arguments of the readers such as scale
+        :param contact_options: keyword arguments of contact.get_contact_mask such as min_frames
+        """
+        self.options = {'h_ref': h_ref, 'v_ref': v_ref, 'h_index': h_index, 'foot_labels': tuple(foot_labels),
+                        'cycle_foot': cycle_foot, 'contact_options': contact_options}
+        self.max_workers = max_workers
+        self.read_options = {} if read_options is None else read_options
+        # source key -> WalkingClip or formatted exception. see _get_source_key
+        self.clips = {}
+        self.errors = {}
+
+    def analyze(self, motions_or_paths, progress=None):
+        """
+        clips already analyzed are skipped. files are analyzed again if their modification time or size changed,
+        and motions if their object or contents changed
+        :param motions_or_paths: list of file paths, a directory searched recursively, a glob pattern,
+        a list of JointMotion whose clips are indices or a dict of clip -> JointMotion
+        :param progress: callable(done_num, total_num, clip) called whenever a clip is done
+        :return: dict of clip -> WalkingClip of motions_or_paths, errors
+        errors : dict of clip -> formatted exception of clips which could not be analyzed
+        """
+        sources = _get_sources(motions_or_paths)
+        keys = {clip: _get_source_key(source) for clip, source in sources.items()}
+        todo = [clip for clip in sources if keys[clip] not in self.clips]
+        done = [clip for clip in sources if keys[clip] in self.clips]
+        errors = {}
+
+        def _on_done(_clip, _result, _error):
+            done.append(_clip)
+            if _error is None:
+                self.clips[keys[_clip]] = _result
+                self.errors.pop(keys[_clip], None)
+            else:
+                errors[_clip] = self.errors[keys[_clip]] = _error
+            if progress is not None:
+                progress(len(done), len(sources), _clip)
+
+        if self.max_workers == 1:
+            for clip in todo:
+                _on_done(clip, *_analyze_clip(clip, _get_worker_source(sources[clip]), self.options,
+                                              self.read_options))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(self.max_workers) as executor:
+                # motions are sent as arrays instead of pickled graphs of postures
+                futures = {executor.submit(_analyze_clip, clip, _get_worker_source(sources[clip]), self.options,
+                                           self.read_options): clip
+                           for clip in todo}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        result, error = future.result()
+                    except Exception:
+                        # the worker process died or the result could not be sent back
+                        result, error = None, traceback.format_exc()
+                    _on_done(futures[future], result, error)
+
+        return {clip: self.clips[keys[clip]] for clip in sources if keys[clip] in self.clips}, errors
+
+    def clear(self):
+        self.clips.clear()
+        self.errors.clear()
+
+    def get_table(self, end_zone_size=DEFAULT_END_ZONE_SIZE, clips=None):
+        """
+        :param end_zone_size: see gait.get_cycle_end_frame
+        :param clips: dict of clip -> WalkingClip returned by analyze. all analyzed clips if None
+        :return: list of dicts of TABLE_COLUMNS -> values, one row per clip
+        """
+        walking_clips = self.clips.values() if clips is None else clips.values()
+        return [walking_clip.get_row(end_zone_size) for walking_clip in walking_clips]
+
+    def write_table(self, csv_file_path, end_zone_size=DEFAULT_END_ZONE_SIZE, clips=None):
+        """
+        step_lengths are written as space separated values
+        """
+        with open(csv_file_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, TABLE_COLUMNS)
+            writer.writeheader()
+            for row in self.get_table(end_zone_size, clips):
+                row['step_lengths'] = ' '.join(repr(step_length) for step_length in row['step_lengths'])
+                writer.writerow(row)
+
+
+def analyze_walking(motions_or_paths, h_ref, v_ref, end_zone_size=DEFAULT_END_ZONE_SIZE, **analyzer_options):
+    """
+    :param analyzer_options: keyword arguments of WalkingAnalyzer
+    :return: table, errors. see WalkingAnalyzer.analyze and WalkingAnalyzer.get_table
+    """
+    analyzer = WalkingAnalyzer(h_ref, v_ref, **analyzer_options)
+    clips, errors = analyzer.analyze(motions_or_paths)
+    return analyzer.get_table(end_zone_size, clips), errors
+
+
+def get_walking_clip(clip, joint_motion, h_ref, v_ref, h_index=1, foot_labels=DEFAULT_FOOT_LABELS, cycle_foot=0,
+                     contact_options=None):
+    """
+    :param clip: path or key of the clip
+    :param joint_motion: JointMotion
+    :return: WalkingClip. see WalkingAnalyzer
+    """
+    skeleton = joint_motion.get_skeleton()
+    foot_indices = [skeleton.get_index_by_label(label) for label in foot_labels]
+    positions = joint_motion.get_position_array(False)
+    foot_positions = positions[:, foot_indices]
+    foot_contacts = contact.get_contact_mask(foot_positions, joint_motion.fps, h_ref, v_ref, h_index,
+                                             **(contact_options or {}))
+
+    landing_frames, landing_feet = gait.get_landing_frames(foot_contacts[:, 0], foot_contacts[:, 1])
+    steps = gait.get_walking_steps(foot_contacts[:, 0], foot_contacts[:, 1])
+    step_lengths = gait.get_step_lengths(foot_positions, landing_frames[:len(steps) + 1],
+                                         landing_feet[:len(steps) + 1], h_index)
+
+    try:
+        cycle_start, rough_cycle_end = gait.get_rough_walking_cycle(foot_contacts[:, cycle_foot])
+    except ValueError:
+        cycle_start = rough_cycle_end = start_distances = None
+    else:
+        start_distances = gait.get_relative_position_distances(positions, cycle_start)
+    return WalkingClip(clip, joint_motion.fps, len(joint_motion), foot_contacts, steps, step_lengths, cycle_start,
+                       rough_cycle_end, start_distances)
+
+
+def _get_sources(motions_or_paths):
+    """
+    motions are converted by batch_loader.motion_to_arrays, so they are hashed and sent to worker processes cheaply
+    :return: dict of clip -> path or (id of the motion, result of batch_loader.motion_to_arrays)
+    """
+    if isinstance(motions_or_paths, dict):
+        sources = motions_or_paths
+    elif isinstance(motions_or_paths, str) or all(isinstance(source, str) for source in motions_or_paths):
+        return {path: path for path in batch_loader.find_motion_files(motions_or_paths)}
+    else:
+        sources = dict(enumerate(motions_or_paths))
+    return {clip: (id(source), batch_loader.motion_to_arrays(source, True)) for clip, source in sources.items()}
+
+
+def _get_source_key(source):
+    """
+    :param source: value of _get_sources
+    :return: (absolute path, modification time, size) of files. (id, content hash) of motions
+    """
+    if isinstance(source, str):
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return os.path.abspath(source), None, None
+        return os.path.abspath(source), stat.st_mtime_ns, stat.st_size
+
+    motion_id, (skeleton_header, fps, motion_name, root_positions, local_rs) = source
+    content_hash = hashlib.sha1(repr((skeleton_header, fps, local_rs.shape)).encode('utf-8'))
+    content_hash.update(root_positions.tobytes())
+    content_hash.update(local_rs.tobytes())
+    return motion_id, content_hash.hexdigest()
+
+
+def _get_worker_source(source):
+    """
+    :param source: value of _get_sources
+    :return: path or result of batch_loader.motion_to_arrays
+    """
+    return source if isinstance(source, str) else source[1]
+
+
+def _analyze_clip(clip, source, options, read_options):
+    """
+    run in worker processes
+    :param source: path or result of batch_loader.motion_to_arrays
+    :return: WalkingClip, None or None, formatted exception
+    """
+    try:
+        if isinstance(source, str):
+            joint_motion = hmc_loader.read_source_file(source, True, **read_options)
+        else:
+            joint_motion = batch_loader.arrays_to_motion(source)
+        return get_walking_clip(clip, joint_motion, **options), None
+    except Exception:
+        return None, traceback.format_exc()
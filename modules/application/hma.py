@@ -1,16 +1,16 @@
 import sys
-import os
 import typing
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 import application.hma_ui as hu
 import gui.motion_view as mv
-import hmath.mm_math as mm
 import renderer.renderer as renderer
-import resource.bvh_loader as bl
-import resource.htr_loader as hl
+import resource.motion_loader as motion_loader
 import motion
 
+# read options of formats in the viewer. htr motions get an end effector under the left foot
+VIEWER_READ_OPTIONS = {'htr': {'end_effectors': (('L.Foot', (100., 0., 0.)),)}}
+
 
 class Hma:
     def __init__(self):
@@ -36,23 +36,22 @@ class HmaWindow(QtWidgets.QMainWindow):
         print("file dialog")
         dlg = QtWidgets.QFileDialog()
         dlg.setFileMode(QtWidgets.QFileDialog.AnyFile)
-        dlg.setNameFilters(["motion files (*.htr)", "motion files (*.bvh)", "all files (*.*)"])
+        # only joint motions can be rendered by JointMotionRender
+        extensions = ' '.join('*' + extension for extension in motion_loader.get_extensions(motion_loader.JOINT_MOTION))
+        dlg.setNameFilters(["motion files (%s)" % extensions, "all files (*.*)"])
         dlg.setDirectory("C:/Users/mrl/Research/Motions")
         if dlg.exec_():
             file_path = dlg.selectedFiles()
-            ext = os.path.splitext(file_path[0])[1]
+            motion_format = motion_loader.find_motion_format(file_path[0])
             print("action_import")
-            if ext == ".bvh":
-                joint_motion = bl.read_bvh_file(file_path[0])
-            elif ext == ".htr":
-                #joint_motion = hl.read_htr_file(file_path[0])
-                htr_motion = hl.read_htr_file_as_htr(file_path[0])
-                htr_motion.add_end_effector("L.Foot", mm.seq_to_vec3([100, 0, 0]))
-                joint_motion = htr_motion.to_joint_motion()
-
-            else:
-                print("invalid file extension")
+            if motion_format is None:
+                print("invalid file format")
+                return
+            elif motion_format.kind != motion_loader.JOINT_MOTION:
+                print("%s files cannot be rendered" % motion_format.name)
                 return
+            joint_motion = motion_loader.load_motion(file_path[0], motion_format.name,
+                                                     **VIEWER_READ_OPTIONS.get(motion_format.name, {}))
             self.hma.add_motion(joint_motion)
             self.findChild(mv.MotionView, "motion_view").add_renderer(renderer.JointMotionRender(joint_motion))
 
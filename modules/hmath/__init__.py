@@ -1 +1 @@
-__all__ = ['mm_math', 'ys_differential_equation', 'ys_function_graph', 'ys_probability']
\ No newline at end of file
+__all__ = ['mm_math', 'mm_quaternion', 'ys_differential_equation', 'ys_function_graph', 'ys_probability']
\ No newline at end of file
@@ -242,6 +242,8 @@ def exp(axis, theta=None):
     """
     if theta is None:
         theta = length(axis)
+    if length(axis) == 0.:
+        return _I_SO3.copy()
     axis = normalize(axis)
 
     [x, y, z] = axis
@@ -367,6 +369,117 @@ def numpy_so3_to_tuple_so3(so3):
     return so3[0, 0], so3[0, 1], so3[0, 2], so3[1, 0], so3[1, 1], so3[1, 2], so3[2, 0], so3[2, 1], so3[2, 2]
 
 
+# ===============================================================================
+# batch functions
+# rotation arrays are (..., 3, 3) and rotation vector arrays are (..., 3)
+# ===============================================================================
+def log_so3_batch(so3s):
+    """
+    vectorized log_so3
+    :param so3s: (..., 3, 3)
+    :return: (..., 3) rotation vectors
+    """
+    so3s = np.asarray(so3s, float)
+    cos_thetas = 0.5 * (so3s[..., 0, 0] + so3s[..., 1, 1] + so3s[..., 2, 2] - 1.0)
+    near_pi = cos_thetas < LIE_EPS - 1.0
+
+    thetas = np.arccos(np.clip(cos_thetas, -1.0, 1.0))
+    small = thetas < LIE_EPS
+    sin_thetas = np.where(small, 1.0, np.sin(thetas))
+    cofs = np.where(small, 3.0 / (6.0 - thetas * thetas), thetas / (2.0 * sin_thetas))
+    vecs = cofs[..., np.newaxis] * np.stack((so3s[..., 2, 1] - so3s[..., 1, 2],
+                                             so3s[..., 0, 2] - so3s[..., 2, 0],
+                                             so3s[..., 1, 0] - so3s[..., 0, 1]), -1)
+
+    if np.any(near_pi):
+        rs = so3s[near_pi]
+        diagonals = np.stack((rs[:, 0, 0], rs[:, 1, 1], rs[:, 2, 2]), -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pi_vecs = M_PI_SQRT2 * np.sqrt(np.stack(((rs[:, 1, 0] ** 2 + rs[:, 2, 0] ** 2) / (1.0 - rs[:, 0, 0]),
+                                                     (rs[:, 0, 1] ** 2 + rs[:, 2, 1] ** 2) / (1.0 - rs[:, 1, 1]),
+                                                     (rs[:, 0, 2] ** 2 + rs[:, 1, 2] ** 2) / (1.0 - rs[:, 2, 2])),
+                                                    -1))
+        # same priority as log_so3 : x axis, y axis, z axis, general case
+        on_axes = diagonals > 1.0 - LIE_EPS
+        first_axes = np.argmax(on_axes, -1)
+        axis_rows = np.flatnonzero(np.any(on_axes, -1))
+        pi_vecs[axis_rows] = 0.
+        pi_vecs[axis_rows, first_axes[axis_rows]] = math.pi
+        vecs[near_pi] = pi_vecs
+    return vecs
+
+
+def exp_batch(axes, thetas=None):
+    """
+    vectorized exp
+    :param axes: (..., 3) rotation vectors. if thetas is given, they are used as axes only
+    :param thetas: (...) radians. lengths of axes if None
+    :return: (..., 3, 3) rotation matrices
+    """
+    axes = np.asarray(axes, float)
+    lengths = np.sqrt(np.sum(axes * axes, -1))
+    if thetas is None:
+        thetas = lengths
+    thetas = np.broadcast_to(np.asarray(thetas, float), lengths.shape)
+    zero = lengths == 0.
+    units = axes / np.where(zero, 1.0, lengths)[..., np.newaxis]
+
+    c = np.cos(thetas)[..., np.newaxis, np.newaxis]
+    s = np.sin(thetas)[..., np.newaxis, np.newaxis]
+    x, y, z = units[..., 0], units[..., 1], units[..., 2]
+    o = np.zeros_like(x)
+    cross = np.stack((np.stack((o, -z, y), -1), np.stack((z, o, -x), -1), np.stack((-y, x, o), -1)), -2)
+    outer = units[..., :, np.newaxis] * units[..., np.newaxis, :]
+    rs = c * _I_SO3 + s * cross + (1.0 - c) * outer
+    rs[zero] = _I_SO3
+    return rs
+
+
+def slerp_batch(r1s, r2s, t):
+    """
+    vectorized slerp
+    :param r1s: (..., 3, 3)
+    :param r2s: (..., 3, 3)
+    :param t: scalar or array broadcastable to (...)
+    :return: (..., 3, 3)
+    """
+    r1s = np.asarray(r1s, float)
+    logs = log_so3_batch(np.matmul(np.swapaxes(r1s, -1, -2), r2s))
+    return np.matmul(r1s, exp_batch(np.asarray(t, float)[..., np.newaxis] * logs))
+
+
+def rot_batch(axis_index, thetas):
+    """
+    vectorized rot_x, rot_y, rot_z
+    :param axis_index: 0, 1, 2 for x, y, z axis
+    :param thetas: (...) radians
+    :return: (..., 3, 3) rotation matrices
+    """
+    thetas = np.asarray(thetas, float)
+    c = np.cos(thetas)
+    s = np.sin(thetas)
+    j, k = (axis_index + 1) % 3, (axis_index + 2) % 3
+    rs = np.zeros(thetas.shape + (3, 3))
+    rs[..., axis_index, axis_index] = 1.
+    rs[..., j, j] = c
+    rs[..., j, k] = -s
+    rs[..., k, j] = s
+    rs[..., k, k] = c
+    return rs
+
+
+def rot_x_batch(thetas):
+    return rot_batch(0, thetas)
+
+
+def rot_y_batch(thetas):
+    return rot_batch(1, thetas)
+
+
+def rot_z_batch(thetas):
+    return rot_batch(2, thetas)
+
+
 # ===============================================================================
 # vector projection
 # ===============================================================================
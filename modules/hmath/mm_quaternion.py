@@ -0,0 +1,240 @@
+"""
+batched unit quaternion functions
+quaternions are (..., 4) arrays of (w, x, y, z)
+rotation vectors are (..., 3) arrays of (rotation angle) * (rotation axis), same as mm_math.log_so3 and mm_math.exp
+euler orders are strings of rotation axes such as 'ZXY'. 'ZXY' means (z) (x) (y) as channels of bvh files
+"""
+import numpy as np
+
+QUAT_EPS = 1E-6
+
+_AXIS_INDICES = {'X': 0, 'Y': 1, 'Z': 2}
+
+
+def i_quat(shape=()):
+    q = np.zeros(tuple(shape) + (4,))
+    q[..., 0] = 1.
+    return q
+
+
+def normalize(q):
+    q = np.asarray(q, float)
+    return q / np.sqrt(np.sum(q * q, -1))[..., np.newaxis]
+
+
+def conjugate(q):
+    q = np.array(q, float)
+    q[..., 1:] *= -1.
+    return q
+
+
+def mul(q1, q2):
+    """
+    :param q1: (..., 4)
+    :param q2: (..., 4)
+    :return: q1 q2. rotation of q2 followed by rotation of q1, same as np.dot(R1, R2)
+    """
+    q1 = np.asarray(q1, float)
+    q2 = np.asarray(q2, float)
+    w1, x1, y1, z1 = q1[..., 0], q1[..., 1], q1[..., 2], q1[..., 3]
+    w2, x2, y2, z2 = q2[..., 0], q2[..., 1], q2[..., 2], q2[..., 3]
+    return np.stack((w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+                     w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                     w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+                     w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2), -1)
+
+
+def rotate(q, v):
+    """
+    :param q: (..., 4)
+    :param v: (..., 3)
+    :return: v rotated by q
+    """
+    q = np.asarray(q, float)
+    v = np.asarray(v, float)
+    u = q[..., 1:]
+    t = 2. * np.cross(u, v)
+    return v + q[..., 0:1] * t + np.cross(u, t)
+
+
+def exp(rotation_vectors):
+    """
+    :param rotation_vectors: (..., 3)
+    :return: (..., 4)
+    """
+    rotation_vectors = np.asarray(rotation_vectors, float)
+    thetas = np.sqrt(np.sum(rotation_vectors * rotation_vectors, -1))
+    small = thetas < QUAT_EPS
+    # sin(theta/2)/theta, using its taylor series for small theta
+    cofs = np.where(small, 0.5 - thetas * thetas / 48., np.sin(0.5 * thetas) / np.where(small, 1., thetas))
+    return np.concatenate((np.cos(0.5 * thetas)[..., np.newaxis], cofs[..., np.newaxis] * rotation_vectors), -1)
+
+
+def log(q):
+    """
+    :param q: (..., 4) unit quaternions
+    :return: (..., 3) rotation vectors with rotation angles in [0, pi]
+    """
+    q = np.asarray(q, float)
+    # q and -q are same rotation. choose w >= 0 for the shortest rotation
+    q = np.where(q[..., 0:1] < 0., -q, q)
+    sin_half_thetas = np.sqrt(np.sum(q[..., 1:] * q[..., 1:], -1))
+    half_thetas = np.arctan2(sin_half_thetas, q[..., 0])
+    small = sin_half_thetas < QUAT_EPS
+    cofs = np.where(small, 2. / np.where(small, q[..., 0], 1.),
+                    2. * half_thetas / np.where(small, 1., sin_half_thetas))
+    return cofs[..., np.newaxis] * q[..., 1:]
+
+
+def slerp(q1, q2, t):
+    """
+    :param q1: (..., 4)
+    :param q2: (..., 4)
+    :param t: scalar or array broadcastable to (...)
+    :return: (..., 4) shortest path interpolation
+    """
+    q1 = np.asarray(q1, float)
+    q2 = np.asarray(q2, float)
+    t = np.asarray(t, float)[..., np.newaxis]
+    dots = np.sum(q1 * q2, -1)[..., np.newaxis]
+    q2 = np.where(dots < 0., -q2, q2)
+    dots = np.minimum(np.abs(dots), 1.)
+    thetas = np.arccos(dots)
+    sin_thetas = np.sin(thetas)
+    small = sin_thetas < QUAT_EPS
+    safe_sin_thetas = np.where(small, 1., sin_thetas)
+    w1 = np.where(small, 1. - t, np.sin((1. - t) * thetas) / safe_sin_thetas)
+    w2 = np.where(small, t, np.sin(t * thetas) / safe_sin_thetas)
+    return normalize(w1 * q1 + w2 * q2)
+
+
+def nlerp(q1, q2, t):
+    """
+    normalized linear interpolation. cheaper than slerp but angular velocity is not constant
+    """
+    q1 = np.asarray(q1, float)
+    q2 = np.asarray(q2, float)
+    t = np.asarray(t, float)[..., np.newaxis]
+    q2 = np.where(np.sum(q1 * q2, -1)[..., np.newaxis] < 0., -q2, q2)
+    return normalize((1. - t) * q1 + t * q2)
+
+
+def quat_to_so3(q):
+    """
+    :param q: (..., 4)
+    :return: (..., 3, 3)
+    """
+    q = np.asarray(q, float)
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    xx, yy, zz = x * x, y * y, z * z
+    xy, xz, yz = x * y, x * z, y * z
+    wx, wy, wz = w * x, w * y, w * z
+    return np.stack((np.stack((1. - 2. * (yy + zz), 2. * (xy - wz), 2. * (xz + wy)), -1),
+                     np.stack((2. * (xy + wz), 1. - 2. * (xx + zz), 2. * (yz - wx)), -1),
+                     np.stack((2. * (xz - wy), 2. * (yz + wx), 1. - 2. * (xx + yy)), -1)), -2)
+
+
+def so3_to_quat(so3):
+    """
+    :param so3: (..., 3, 3)
+    :return: (..., 4) with w >= 0
+    """
+    r = np.asarray(so3, float)
+    traces = r[..., 0, 0] + r[..., 1, 1] + r[..., 2, 2]
+    # 4 candidates of 4 * (largest component) ** 2. the largest one is numerically stable
+    candidates = np.stack((1. + traces,
+                           1. + r[..., 0, 0] - r[..., 1, 1] - r[..., 2, 2],
+                           1. - r[..., 0, 0] + r[..., 1, 1] - r[..., 2, 2],
+                           1. - r[..., 0, 0] - r[..., 1, 1] + r[..., 2, 2]), -1)
+    cases = np.argmax(candidates, -1)
+    s = 2. * np.sqrt(np.maximum(np.max(candidates, -1), QUAT_EPS * QUAT_EPS))
+
+    q = np.empty(r.shape[:-2] + (4,))
+    case = cases == 0
+    q[case] = np.stack((0.25 * s[case],
+                        (r[case][..., 2, 1] - r[case][..., 1, 2]) / s[case],
+                        (r[case][..., 0, 2] - r[case][..., 2, 0]) / s[case],
+                        (r[case][..., 1, 0] - r[case][..., 0, 1]) / s[case]), -1)
+    case = cases == 1
+    q[case] = np.stack(((r[case][..., 2, 1] - r[case][..., 1, 2]) / s[case],
+                        0.25 * s[case],
+                        (r[case][..., 0, 1] + r[case][..., 1, 0]) / s[case],
+                        (r[case][..., 0, 2] + r[case][..., 2, 0]) / s[case]), -1)
+    case = cases == 2
+    q[case] = np.stack(((r[case][..., 0, 2] - r[case][..., 2, 0]) / s[case],
+                        (r[case][..., 0, 1] + r[case][..., 1, 0]) / s[case],
+                        0.25 * s[case],
+                        (r[case][..., 1, 2] + r[case][..., 2, 1]) / s[case]), -1)
+    case = cases == 3
+    q[case] = np.stack(((r[case][..., 1, 0] - r[case][..., 0, 1]) / s[case],
+                        (r[case][..., 0, 2] + r[case][..., 2, 0]) / s[case],
+                        (r[case][..., 1, 2] + r[case][..., 2, 1]) / s[case],
+                        0.25 * s[case]), -1)
+    q = np.where(q[..., 0:1] < 0., -q, q)
+    return normalize(q)
+
+
+def axis_angle_to_quat(axis_index, angles):
+    """
+    :param axis_index: 0, 1, 2 for x, y, z axis
+    :param angles: (...) radians
+    :return: (..., 4)
+    """
+    angles = np.asarray(angles, float)
+    q = np.zeros(angles.shape + (4,))
+    q[..., 0] = np.cos(0.5 * angles)
+    q[..., 1 + axis_index] = np.sin(0.5 * angles)
+    return q
+
+
+def euler_to_quat(angles, order='ZXY'):
+    """
+    :param angles: (..., 3) radians related to order
+    :param order: 'ZXY' means (z) (x) (y)
+    :return: (..., 4)
+    """
+    angles = np.asarray(angles, float)
+    axis_indices = _get_axis_indices(order)
+    q = axis_angle_to_quat(axis_indices[0], angles[..., 0])
+    q = mul(q, axis_angle_to_quat(axis_indices[1], angles[..., 1]))
+    return mul(q, axis_angle_to_quat(axis_indices[2], angles[..., 2]))
+
+
+def quat_to_euler(q, order='ZXY'):
+    """
+    :param q: (..., 4)
+    :param order: 'ZXY' means (z) (x) (y)
+    :return: (..., 3) radians related to order
+    """
+    return so3_to_euler(quat_to_so3(q), order)
+
+
+def so3_to_euler(so3, order='ZXY'):
+    """
+    decompose so3 to (a) (b) (c) of order 'abc'
+    :param so3: (..., 3, 3)
+    :param order: 'ZXY' means (z) (x) (y)
+    :return: (..., 3) radians related to order. the middle angle is in [-pi/2, pi/2]
+    """
+    r = np.asarray(so3, float)
+    i, j, k = _get_axis_indices(order)
+    # +1 if (i, j, k) is a cyclic permutation of (0, 1, 2)
+    sign = 1. if (j - i) % 3 == 1 else -1.
+    return np.stack((np.arctan2(-sign * r[..., j, k], r[..., k, k]),
+                     np.arcsin(np.clip(sign * r[..., i, k], -1., 1.)),
+                     np.arctan2(-sign * r[..., i, j], r[..., i, i])), -1)
+
+
+def _get_axis_indices(order):
+    axis_indices = tuple(_AXIS_INDICES[axis] for axis in order.upper())
+    if len(axis_indices) != 3 or len(set(axis_indices)) != 3:
+        raise ValueError("euler order must be a permutation of 'XYZ'")
+    return axis_indices
+
+
+def angle_between(q1, q2):
+    """
+    :return: (...) rotation angles from q1 to q2 in [0, pi]
+    """
+    dots = np.abs(np.sum(np.asarray(q1, float) * np.asarray(q2, float), -1))
+    return 2. * np.arccos(np.minimum(dots, 1.))
@@ -1,5 +1,5 @@
+import numpy as np
 
-import hmath.mm_math as mm
 import motion.motion as mot
 
 
@@ -13,16 +13,16 @@ def get_contact_states(motion: mot.JointMotion, index, h_ref, v_ref, h_index = 2
     :param h_index: index of height direction. if z-up, h_index is 2. if y-up h_index is 1
     :return:
     """
-    contact_states = list()
-    for f in range(len(motion)):
-        pos = motion.get_position(index, f)
-        vel = motion.get_velocity(index, f)
-        if pos[h_index] < h_ref and mm.length(vel) < v_ref:
-            contact_states.append(True)
-        else:
-            contact_states.append(False)
+    positions = get_joint_positions(motion)[:, [index]]
+    return get_contact_mask(positions, motion.fps, h_ref, v_ref, h_index)[:, 0].tolist()
 
-    return contact_states
+
+def get_motion_contact_states(motion: mot.JointMotion, h_ref, v_ref, h_index=2):
+    """
+    :return: dict of joint index -> contact states of joints which have contact at any frame
+    """
+    contact_mask = get_contact_mask(get_joint_positions(motion), motion.fps, h_ref, v_ref, h_index)
+    return {int(index): contact_mask[:, index].tolist() for index in np.flatnonzero(contact_mask.any(0))}
 
 
 def get_contact_timings(contact_states):
@@ -50,3 +50,87 @@ def get_contact_timings(contact_states):
     return start_frames, end_frames
 
 
+# ==================================
+# array functions
+# ==================================
+def get_joint_positions(motion: mot.JointMotion):
+    """
+    :return: (F, J, 3) array of global positions of all joints.
+    computed on every call instead of read from the derivative cache, so postures edited in place are seen
+    """
+    return motion.get_position_array(False)
+
+
+def get_velocities(positions, fps):
+    """
+    central differences of all frames at once. see motion.differentiate
+    :param positions: (F, ..., 3) array
+    :param fps:
+    :return: (F, ..., 3) array
+    """
+    return mot.differentiate(positions, fps)
+
+
+def get_contact_mask(positions, fps, h_refs, v_refs, h_index=2, release_h_refs=None, release_v_refs=None,
+                     min_frames=1, min_gap_frames=1):
+    """
+    a joint starts a contact where its height is lower than h_ref and its speed is lower than v_ref.
+    with hysteresis, the contact continues while its height is lower than release_h_ref and its speed is lower than
+    release_v_ref
+    :param positions: (F, J, 3) array of global positions of joints
+    :param fps:
+    :param h_refs: scalar or (J,) height thresholds
+    :param v_refs: scalar or (J,) speed thresholds
+    :param h_index: index of height direction. if z-up, h_index is 2. if y-up h_index is 1
+    :param release_h_refs: scalar or (J,) height thresholds to end contacts. h_refs if None
+    :param release_v_refs: scalar or (J,) speed thresholds to end contacts. v_refs if None
+    :param min_frames: contacts shorter than min_frames frames are removed
+    :param min_gap_frames: gaps between contacts shorter than min_gap_frames frames are filled
+    :return: (F, J) bool array
+    """
+    positions = np.asarray(positions, float)
+    heights = positions[..., h_index]
+    speeds = np.sqrt(np.sum(get_velocities(positions, fps) ** 2, -1))
+
+    starts = (heights < h_refs) & (speeds < v_refs)
+    if release_h_refs is None and release_v_refs is None:
+        contact_mask = starts
+    else:
+        release_h_refs = h_refs if release_h_refs is None else release_h_refs
+        release_v_refs = v_refs if release_v_refs is None else release_v_refs
+        keeps = starts | ((heights < release_h_refs) & (speeds < release_v_refs))
+        # a frame is in contact if a contact has started since the last frame where it could not be kept
+        frames = np.arange(len(positions))[:, np.newaxis]
+        last_starts = np.maximum.accumulate(np.where(starts, frames, -1), 0)
+        last_breaks = np.maximum.accumulate(np.where(keeps, -1, frames), 0)
+        contact_mask = keeps & (last_starts > last_breaks)
+
+    if min_gap_frames > 1:
+        contact_mask = ~_remove_short_runs(~contact_mask, min_gap_frames, True)
+    if min_frames > 1:
+        contact_mask = _remove_short_runs(contact_mask, min_frames)
+    return contact_mask
+
+
+def _remove_short_runs(mask, min_frames, interior_only=False):
+    """
+    :param mask: (F, J) bool array
+    :param min_frames:
+    :param interior_only: if True, runs touching the first or last frame are kept
+    :return: mask without runs of True shorter than min_frames along frames
+    """
+    frame_num = len(mask)
+    padded = np.zeros((frame_num + 2,) + mask.shape[1:], bool)
+    padded[1:-1] = mask
+    changes = np.diff(padded.astype(np.int8), axis=0)
+    # starts and ends of runs are paired in order because np.nonzero of transposed arrays is sorted by joint
+    start_joints, start_frames = np.nonzero(changes.T == 1)
+    end_frames = np.nonzero(changes.T == -1)[1]
+
+    short = end_frames - start_frames < min_frames
+    if interior_only:
+        short &= (start_frames > 0) & (end_frames < frame_num)
+    marks = np.zeros((frame_num + 1,) + mask.shape[1:], int)
+    np.add.at(marks, (start_frames[short], start_joints[short]), 1)
+    np.add.at(marks, (end_frames[short], start_joints[short]), -1)
+    return mask & (np.cumsum(marks, 0)[:-1] == 0)
@@ -0,0 +1,265 @@
+"""
+biped gait analysis on contact masks
+
+array versions of ysBipedAnalysis. gait states of all frames are classified from the two foot contact masks at once,
+and short stop and jump runs are relabeled on the run-length encoding of the states
+"""
+import numpy as np
+
+import motion.interval as interval
+
+
+class GaitState:
+    STOP = 0
+    LSWING = 1
+    RSWING = 2
+    JUMP = 3
+    text = {STOP: 'STOP', LSWING: 'LSWING', RSWING: 'RSWING', JUMP: 'JUMP'}
+
+
+def classify_biped_gait_states(l_foot_contacts, r_foot_contacts):
+    """
+    :param l_foot_contacts: (F,) bool contact mask of the left foot
+    :param r_foot_contacts: (F,) bool contact mask of the right foot
+    :return: (F,) int array of GaitState without relabeling
+    """
+    l_foot_contacts = np.asarray(l_foot_contacts, bool)
+    r_foot_contacts = np.asarray(r_foot_contacts, bool)
+    return np.select([l_foot_contacts & ~r_foot_contacts, ~l_foot_contacts & r_foot_contacts,
+                      l_foot_contacts & r_foot_contacts], [GaitState.RSWING, GaitState.LSWING, GaitState.STOP],
+                     GaitState.JUMP)
+
+
+def get_biped_gait_timeline(l_foot_contacts, r_foot_contacts, jump_threshold=0, jump_bias=.5, stop_threshold=0,
+                            stop_bias=.5, relabel_edges=False):
+    """
+    stop runs and then jump runs of (last frame - first frame) < threshold are relabeled. frames before
+    (first frame + last frame) * bias get the state before the run, and the other frames get the state after it
+    :param l_foot_contacts: (F,) bool contact mask of the left foot
+    :param r_foot_contacts: (F,) bool contact mask of the right foot
+    :param jump_threshold:
+    :param jump_bias:
+    :param stop_threshold:
+    :param stop_bias:
+    :param relabel_edges: if False, runs at the first or last frame are kept as ysBipedAnalysis.getBipedGaitStates.
+    if True, they get the state of their only neighbor as ysBipedAnalysis.getBipedGaitStates2
+    :return: StateTimeline of GaitState
+    """
+    timeline = interval.StateTimeline.from_states(classify_biped_gait_states(l_foot_contacts, r_foot_contacts))
+    frame_num = len(timeline)
+    # ysMotionAnalysis.states2intervals finds no interval in one frame
+    if frame_num < 2:
+        return timeline
+
+    # runs to relabel are those before relabeling, while neighbor states are read after the previous pass
+    run_starts, run_ends, run_states = timeline.starts, timeline.get_ends() - 1, timeline.states
+    for state, threshold, bias in ((GaitState.STOP, stop_threshold, stop_bias),
+                                   (GaitState.JUMP, jump_threshold, jump_bias)):
+        mask = (run_states == state) & (run_ends - run_starts < threshold)
+        at_first, at_last = run_starts == 0, run_ends == frame_num - 1
+        mask &= ~(at_first & at_last) if relabel_edges else ~(at_first | at_last)
+        starts, ends = run_starts[mask], run_ends[mask]
+
+        prev_frames = np.where(starts > 0, starts - 1, ends + 1)
+        next_frames = np.where(ends < frame_num - 1, ends + 1, starts - 1)
+        prev_states = timeline.get_states_at(prev_frames)
+        next_states = timeline.get_states_at(next_frames)
+        splits = np.clip(np.ceil((starts + ends) * bias), starts, ends + 1).astype(int)
+        timeline = timeline.overwrite(np.concatenate((starts, splits)), np.concatenate((splits, ends + 1)),
+                                      np.concatenate((prev_states, next_states)))
+    return timeline
+
+
+def get_biped_gait_states(l_foot_contacts, r_foot_contacts, jump_threshold=0, jump_bias=.5, stop_threshold=0,
+                          stop_bias=.5, relabel_edges=False):
+    """
+    :return: (F,) int array of GaitState. see get_biped_gait_timeline
+    """
+    return get_biped_gait_timeline(l_foot_contacts, r_foot_contacts, jump_threshold, jump_bias, stop_threshold,
+                                   stop_bias, relabel_edges).to_states()
+
+
+def get_biped_gait_intervals(l_foot_contacts, r_foot_contacts, jump_threshold=0, jump_bias=.5, stop_threshold=0,
+                             stop_bias=.5, relabel_edges=False):
+    """
+    :return: (N, 2) int intervals, (N,) GaitState of runs as ysBipedAnalysis.getBipedGaitIntervals
+    """
+    timeline = get_biped_gait_timeline(l_foot_contacts, r_foot_contacts, jump_threshold, jump_bias, stop_threshold,
+                                       stop_bias, relabel_edges)
+    if len(timeline) < 2:
+        return np.zeros((0, 2), int), timeline.states[:0]
+    return np.ceil(timeline.get_intervals()).astype(int), timeline.states
+
+
+# ===========================================================================
+# walking cycles and steps
+# ===========================================================================
+def get_landing_frames(l_foot_contacts, r_foot_contacts):
+    """
+    :return: (N,) sorted frames where either foot starts a contact, (N,) 0 for the left foot and 1 for the right foot.
+    same frames as ysMotionAnalysis.getTakingLandingFrames of both feet
+    """
+    contacts = np.stack((np.asarray(l_foot_contacts, bool), np.asarray(r_foot_contacts, bool)), 1)
+    frames, feet = np.nonzero(contacts[1:] & ~contacts[:-1])
+    order = np.argsort(frames, kind='stable')
+    return frames[order] + 1, feet[order]
+
+
+def get_walking_steps(l_foot_contacts, r_foot_contacts, include_first_last_steps=False, overlap=True):
+    """
+    :param l_foot_contacts: (F,) bool contact mask of the left foot
+    :param r_foot_contacts: (F,) bool contact mask of the right foot
+    :param include_first_last_steps: if True, a step from frame 0 is added. otherwise the last landing is dropped
+    :param overlap: if False, steps after the first one start a frame after the previous landing
+    :return: (N, 2) int array of first and last frames of steps as ysBipedAnalysis.getWalkingSteps
+    """
+    landing_frames = get_landing_frames(l_foot_contacts, r_foot_contacts)[0]
+    landing_frames = np.insert(landing_frames, 0, 0) if include_first_last_steps else landing_frames[:-1]
+    steps = np.stack((landing_frames[:-1], landing_frames[1:]), 1)
+    if not overlap:
+        steps[1:, 0] += 1
+    return steps
+
+
+def get_step_lengths(foot_positions, landing_frames, landing_feet, h_index=2):
+    """
+    :param foot_positions: (F, 2, 3) global positions of the left and right foot
+    :param landing_frames: (N,) result of get_landing_frames
+    :param landing_feet: (N,) result of get_landing_frames
+    :param h_index: index of height direction. if z-up, h_index is 2. if y-up h_index is 1
+    :return: (N - 1,) horizontal distances between positions of consecutive landing feet at their landing frames
+    """
+    positions = np.delete(np.asarray(foot_positions, float)[landing_frames, landing_feet], h_index, -1)
+    return np.sqrt(np.sum(np.diff(positions, axis=0) ** 2, -1))
+
+
+def get_rough_walking_cycle(one_foot_contacts):
+    """
+    :param one_foot_contacts: (F,) bool contact mask of one foot
+    :return: first frame of the middle interval of contact states and last frame of the next one.
+    get_walking_cycle refines the last frame
+    """
+    intervals = interval.StateTimeline.from_states(np.asarray(one_foot_contacts, bool)).get_intervals()
+    if len(intervals) < 3:
+        raise ValueError("walking cycle needs at least 3 intervals of contact states.")
+    half_1st_index = (len(intervals) - 1) // 2 - 1
+    return int(np.ceil(intervals[half_1st_index, 0])), int(np.floor(intervals[half_1st_index + 1, 1]))
+
+
+def get_relative_position_distances(positions, frame, root_index=0):
+    """
+    :param positions: (F, J, 3) global positions of joints
+    :param frame:
+    :param root_index:
+    :return: (F,) ysMotionAnalysis.distanceByRelPos between the posture of frame and postures of all frames
+    """
+    positions = np.asarray(positions, float)
+    relative_positions = positions - positions[:, [root_index]]
+    return np.sum(np.sqrt(np.sum((relative_positions - relative_positions[frame]) ** 2, -1)), -1)
+
+
+def get_cycle_end_frame(start_distances, rough_end_frame, end_zone_size=10):
+    """
+    :param start_distances: (F,) result of get_relative_position_distances of the first frame of a cycle
+    :param rough_end_frame:
+    :param end_zone_size: frames [rough_end_frame - end_zone_size, rough_end_frame + end_zone_size) are searched.
+    unlike ysBipedAnalysis.getWalkingCycle, frames out of the motion are not searched
+    :return: searched frame of the nearest posture to the first frame. the earliest one of ties
+    """
+    first_frame = max(rough_end_frame - end_zone_size, 0)
+    last_frame = min(rough_end_frame + end_zone_size, len(start_distances))
+    if first_frame >= last_frame:
+        raise ValueError("no frame to search for the end of walking cycle.")
+    return first_frame + int(np.argmin(start_distances[first_frame:last_frame]))
+
+
+def get_walking_cycle(positions, one_foot_contacts, end_zone_size=10, root_index=0):
+    """
+    :param positions: (F, J, 3) global positions of joints
+    :param one_foot_contacts: (F,) bool contact mask of one foot
+    :param end_zone_size:
+    :param root_index:
+    :return: [first frame, last frame] of a walking cycle as ysBipedAnalysis.getWalkingCycle
+    """
+    start_frame, rough_end_frame = get_rough_walking_cycle(one_foot_contacts)
+    start_distances = get_relative_position_distances(positions, start_frame, root_index)
+    return [start_frame, get_cycle_end_frame(start_distances, rough_end_frame, end_zone_size)]
+
+
+if __name__ == '__main__':
+    # run in modules directory : python -m motion.gait
+    import math
+    import os
+    import re
+    import timeit
+    import types
+
+    def _load_legacy_functions(file_name, names, namespace):
+        """
+        legacy modules import modules of the old package layout, so only the functions to compare are executed
+        :return: namespace having the functions
+        """
+        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ys_motion', file_name)
+        with open(file_path) as file:
+            source = file.read()
+        for name in names:
+            exec(re.search(r'^def %s\(.*?(?=^def |^class |^pass|^if __name__|\Z)' % name, source,
+                           re.S | re.M).group(0), namespace)
+        return namespace
+
+    def _load_legacy_biped_analysis():
+        """
+        :return: dict of name -> function of ysBipedAnalysis
+        """
+        yma = types.SimpleNamespace(**_load_legacy_functions(
+            'ysMotionAnalysis.py', ('states2intervals', 'intIntervalInner', 'intIntervalUp', 'getIntervalsWithState'),
+            {'math': math}))
+        return _load_legacy_functions('ysBipedAnalysis.py', ('getBipedGaitStates', 'getBipedGaitStates2',
+                                                             'getBipedGaitIntervals', 'getBipedGaitIntervals2'),
+                                      {'yma': yma, 'GaitState': GaitState})
+
+    def _make_contacts(frame_num, rng):
+        # runs of random lengths like contact masks of motions
+        return np.repeat(rng.random(frame_num) < .6, rng.integers(1, 6, frame_num))[:frame_num]
+
+    def check_legacy_equivalence():
+        legacy = _load_legacy_biped_analysis()
+        rng = np.random.default_rng(0)
+        checked_num = 0
+        for trial in range(1000):
+            frame_num = int(rng.integers(2, 60))
+            l_foot_contacts, r_foot_contacts = _make_contacts(frame_num, rng), _make_contacts(frame_num, rng)
+            thresholds = (int(rng.integers(0, 6)), float(rng.random()), int(rng.integers(0, 6)), float(rng.random()))
+            for relabel_edges, states_name, intervals_name in ((False, 'getBipedGaitStates', 'getBipedGaitIntervals'),
+                                                               (True, 'getBipedGaitStates2', 'getBipedGaitIntervals2')):
+                try:
+                    legacy_states = legacy[states_name](l_foot_contacts.tolist(), r_foot_contacts.tolist(),
+                                                        *thresholds)
+                    legacy_intervals, legacy_interval_states = legacy[intervals_name](
+                        l_foot_contacts.tolist(), r_foot_contacts.tolist(), *thresholds)
+                except IndexError:
+                    # legacy functions read out of frames for some runs at the first or last frame
+                    continue
+                intervals, interval_states = get_biped_gait_intervals(l_foot_contacts, r_foot_contacts, *thresholds,
+                                                                      relabel_edges=relabel_edges)
+                assert get_biped_gait_states(l_foot_contacts, r_foot_contacts, *thresholds,
+                                             relabel_edges=relabel_edges).tolist() == legacy_states
+                assert intervals.tolist() == legacy_intervals
+                assert interval_states.tolist() == legacy_interval_states
+                checked_num += 1
+        print('same as ysBipedAnalysis : %d pairs of contact masks' % checked_num)
+
+    def profile_get_biped_gait_states():
+        legacy = _load_legacy_biped_analysis()
+        rng = np.random.default_rng(0)
+        l_foot_contacts, r_foot_contacts = _make_contacts(3000, rng), _make_contacts(3000, rng)
+        l_foot_states, r_foot_states = l_foot_contacts.tolist(), r_foot_contacts.tolist()
+        number = 3
+
+        print('3000 frames, getBipedGaitStates    : %.4fs' % (timeit.timeit(lambda: legacy['getBipedGaitStates'](
+            l_foot_states, r_foot_states, 3, .5, 3, .5), number=number) / number))
+        print('3000 frames, get_biped_gait_states : %.4fs' % (timeit.timeit(lambda: get_biped_gait_states(
+            l_foot_contacts, r_foot_contacts, 3, .5, 3, .5), number=number) / number))
+
+    check_legacy_equivalence()
+    profile_get_biped_gait_states()
@@ -0,0 +1,270 @@
+"""
+run-length encoded timelines of per-frame states
+
+a StateTimeline stores runs of equal states as arrays of start frames and states, so a state or interval of any
+number of (float) frames is found by one searchsorted. set operations work on run boundaries instead of frames
+
+intervals of runs follow ysMotionAnalysis: a run of frames [a, b] is the interval [a - .5, b + .5],
+clamped to [0, frame_num - 1]. a float frame belongs to its nearest frame, and .5 rounds up
+"""
+import numpy as np
+
+
+class StateTimeline:
+    def __init__(self, frame_num, starts, states):
+        """
+        :param frame_num:
+        :param starts: (R,) int array of start frames of runs. starts[0] is 0 and starts increase
+        :param states: (R,) array of states of runs
+        """
+        self.frame_num = frame_num
+        self.starts, self.states = _compress(frame_num, np.asarray(starts, int), np.asarray(states))
+
+    @classmethod
+    def from_states(cls, frame_states):
+        """
+        :param frame_states: (F,) states of frames such as contact states
+        """
+        frame_states = np.asarray(frame_states)
+        if len(frame_states) == 0:
+            return cls(0, np.zeros(0, int), frame_states)
+        starts = np.concatenate(([0], np.flatnonzero(frame_states[1:] != frame_states[:-1]) + 1))
+        return cls(len(frame_states), starts, frame_states[starts])
+
+    @classmethod
+    def from_intervals(cls, frame_num, starts, ends, state=True, default=False):
+        """
+        :param frame_num:
+        :param starts: (N,) int array of first frames of intervals
+        :param ends: (N,) int array of frames after last frames of intervals. intervals may overlap
+        :param state: state of frames in intervals
+        :param default: state of other frames
+        """
+        starts = np.clip(np.asarray(starts, int), 0, frame_num)
+        ends = np.clip(np.asarray(ends, int), 0, frame_num)
+        valid = starts < ends
+        order = np.argsort(starts[valid], kind='stable')
+        starts, ends = starts[valid][order], ends[valid][order]
+
+        # merge overlapping or touching intervals
+        max_ends = np.maximum.accumulate(ends) if len(ends) > 0 else ends
+        new_groups = np.concatenate(([True], starts[1:] > max_ends[:-1])) if len(starts) > 0 else starts.astype(bool)
+        merged_starts = starts[new_groups]
+        merged_ends = max_ends[np.concatenate((np.flatnonzero(new_groups)[1:] - 1, [len(starts) - 1]))] \
+            if len(starts) > 0 else ends
+
+        run_starts = np.concatenate(([0], np.stack((merged_starts, merged_ends), 1).ravel()))
+        run_states = np.array([default] + [state, default] * len(merged_starts))
+        return cls(frame_num, run_starts, run_states)
+
+    def __len__(self):
+        return self.frame_num
+
+    def to_states(self):
+        """
+        :return: (F,) array of states of frames
+        """
+        return np.repeat(self.states, self.get_lengths())
+
+    def get_ends(self):
+        """
+        :return: (R,) frames after last frames of runs
+        """
+        return np.append(self.starts[1:], self.frame_num)
+
+    def get_lengths(self):
+        return self.get_ends() - self.starts
+
+    # ===========================================================================
+    # queries
+    # ===========================================================================
+    def get_run_indices_at(self, frames):
+        """
+        :param frames: float frame or array of float frames
+        :return: index or array of indices of runs containing nearest frames
+        """
+        frames = np.clip(np.floor(np.asarray(frames, float) + .5).astype(int), 0, self.frame_num - 1)
+        return np.searchsorted(self.starts, frames, 'right') - 1
+
+    def get_states_at(self, frames):
+        """
+        :param frames: float frame or array of float frames
+        :return: state or array of states. same as ysMotionAnalysis.getStateFromStates for each frame
+        """
+        return self.states[self.get_run_indices_at(frames)]
+
+    def get_intervals_at(self, frames):
+        """
+        :param frames: float frame or array of float frames
+        :return: (2,) or (N, 2) float intervals of runs containing frames.
+        same as ysMotionAnalysis.getIntervalFromStates for each frame
+        """
+        return self.get_intervals()[self.get_run_indices_at(frames)]
+
+    def get_intervals(self, state=None):
+        """
+        :param state: intervals of runs of all states if None
+        :return: (N, 2) float intervals of runs. same as ysMotionAnalysis.states2intervals and getIntervalsWithState
+        """
+        intervals = np.stack((self.starts - .5, self.get_ends() - .5), 1)
+        if len(intervals) > 0:
+            intervals[0, 0] = 0.
+            intervals[-1, 1] = self.frame_num - 1
+        return intervals if state is None else intervals[self.states == state]
+
+    def get_runs(self, state):
+        """
+        :return: (N,) start frames, (N,) frames after last frames of runs of state
+        """
+        mask = self.states == state
+        return self.starts[mask], self.get_ends()[mask]
+
+    # ===========================================================================
+    # operations
+    # ===========================================================================
+    def combine(self, other, func):
+        """
+        :param other: StateTimeline of same number of frames
+        :param func: vectorized function(states of self, states of other) -> states such as np.logical_or
+        :return: StateTimeline of func of states of each frame
+        """
+        if other.frame_num != self.frame_num:
+            raise ValueError("timelines must have same number of frames")
+        starts = _union(self.starts, other.starts)
+        states = func(self.states[np.searchsorted(self.starts, starts, 'right') - 1],
+                      other.states[np.searchsorted(other.starts, starts, 'right') - 1])
+        return StateTimeline(self.frame_num, starts, states)
+
+    def union(self, other):
+        return self.combine(other, np.logical_or)
+
+    def intersection(self, other):
+        return self.combine(other, np.logical_and)
+
+    def difference(self, other):
+        return self.combine(other, lambda states, other_states: np.logical_and(states, np.logical_not(other_states)))
+
+    def invert(self):
+        return StateTimeline(self.frame_num, self.starts, np.logical_not(self.states))
+
+    def overwrite(self, starts, ends, states):
+        """
+        :param starts: (N,) int array of first frames of intervals. intervals must not overlap
+        :param ends: (N,) int array of frames after last frames of intervals
+        :param states: (N,) states of frames in intervals
+        :return: StateTimeline whose frames in intervals are states. other frames are kept
+        """
+        starts, ends, states = np.asarray(starts, int), np.asarray(ends, int), np.asarray(states)
+        valid = starts < ends
+        order = np.argsort(starts[valid], kind='stable')
+        starts, ends, states = starts[valid][order], ends[valid][order], states[valid][order]
+
+        frames = _union(self.starts, starts, ends[ends < self.frame_num])
+        new_states = self.states[np.searchsorted(self.starts, frames, 'right') - 1]
+        if len(starts) > 0:
+            indices = np.maximum(np.searchsorted(starts, frames, 'right') - 1, 0)
+            inside = (frames >= starts[indices]) & (frames < ends[indices])
+            new_states = np.where(inside, states[indices], new_states)
+        return StateTimeline(self.frame_num, frames, new_states)
+
+    def grow(self, frames, state=True):
+        """
+        :param frames: runs of state are extended by frames on both sides
+        :param state:
+        :return: StateTimeline
+        """
+        starts, ends = self.get_runs(state)
+        grown = StateTimeline.from_intervals(self.frame_num, starts - frames, ends + frames)
+        return self.combine(grown, lambda states, in_grown: np.where(in_grown, state, states))
+
+    def shrink(self, frames, state=True, fill=None):
+        """
+        :param frames: runs of state are cut by frames on both sides. runs shorter than 2 * frames disappear
+        :param state:
+        :param fill: state of cut frames. not state if None
+        :return: StateTimeline
+        """
+        fill = np.logical_not(state) if fill is None else fill
+        starts, ends = self.get_runs(state)
+        removed = self.combine(StateTimeline.from_intervals(self.frame_num, starts + frames, ends - frames),
+                               lambda states, in_shrunk: (states == state) & np.logical_not(in_shrunk))
+        return self.combine(removed, lambda states, is_removed: np.where(is_removed, fill, states))
+
+
+def _union(*frame_arrays):
+    """
+    :return: sorted unique frames. faster than np.union1d for sorted int arrays of runs
+    """
+    frames = np.sort(np.concatenate(frame_arrays), kind='stable')
+    return frames[np.concatenate(([True], frames[1:] != frames[:-1]))] if len(frames) > 0 else frames
+
+
+def _compress(frame_num, starts, states):
+    """
+    :return: starts, states without empty runs, runs out of frames and adjacent runs of same state
+    """
+    if frame_num == 0 or len(starts) == 0:
+        return np.zeros(0, int), states[:0]
+    # a later run overrides an empty run of same start
+    keep = (starts < frame_num) & np.append(starts[1:] != starts[:-1], True)
+    starts, states = starts[keep], states[keep]
+    keep = np.concatenate(([True], states[1:] != states[:-1]))
+    return starts[keep], states[keep]
+
+
+if __name__ == '__main__':
+    # run in modules directory : python -m motion.interval
+    import math
+    import os
+    import re
+    import timeit
+
+    def _load_legacy_functions(names):
+        """
+        ysMotionAnalysis imports modules of the old package layout, so only the functions to compare are executed
+        :return: dict of name -> function of ysMotionAnalysis
+        """
+        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ys_motion', 'ysMotionAnalysis.py')
+        with open(file_path) as file:
+            source = file.read()
+        namespace = {'math': math}
+        for name in names:
+            exec(re.search(r'^def %s\(.*?(?=^def |^class |^pass|^if __name__|\Z)' % name, source,
+                           re.S | re.M).group(0), namespace)
+        return namespace
+
+    def check_legacy_equivalence():
+        legacy = _load_legacy_functions(('getStateFromStates', 'getIntervalFromStates', 'states2intervals',
+                                         'getIntervalsWithState'))
+        rng = np.random.default_rng(0)
+        for trial in range(500):
+            frame_num = int(rng.integers(2, 50))
+            frame_states = rng.integers(0, 3, frame_num).tolist()
+            timeline = StateTimeline.from_states(frame_states)
+            frames = rng.random(20) * (frame_num - 1)
+
+            assert timeline.to_states().tolist() == frame_states
+            assert timeline.get_states_at(frames).tolist() == \
+                [legacy['getStateFromStates'](frame, frame_states) for frame in frames]
+            assert np.allclose(timeline.get_intervals_at(frames),
+                               [legacy['getIntervalFromStates'](frame, frame_states) for frame in frames])
+            intervals, states = legacy['states2intervals'](frame_states)
+            assert np.allclose(timeline.get_intervals(), intervals) and timeline.states.tolist() == states
+            assert np.allclose(timeline.get_intervals(states[0]).reshape(-1),
+                               np.reshape(legacy['getIntervalsWithState'](states[0], intervals, states), -1))
+        print('same as ysMotionAnalysis : %d timelines' % (trial + 1))
+
+    def profile_get_intervals_at():
+        legacy = _load_legacy_functions(('getStateFromStates', 'getIntervalFromStates'))
+        frame_states = (np.random.random(10000) < .5).tolist()
+        timeline = StateTimeline.from_states(frame_states)
+        frames = np.random.random(1000) * (len(frame_states) - 1)
+        number = 3
+
+        print('1000 frames of 10000, getIntervalFromStates : %.4fs' % (timeit.timeit(lambda: [legacy[
+            'getIntervalFromStates'](frame, frame_states) for frame in frames], number=number) / number))
+        print('1000 frames of 10000, get_intervals_at      : %.4fs' % (timeit.timeit(lambda: timeline.get_intervals_at(
+            frames), number=number) / number))
+
+    check_legacy_equivalence()
+    profile_get_intervals_at()
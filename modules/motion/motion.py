@@ -2,9 +2,17 @@ import numpy as np
 import operator as op
 
 import hmath.mm_math as mm
+import hmath.mm_quaternion as mq
 
 DEFAULT_FPS = 30
 
+# methods of derivatives of motions. see differentiate
+CENTRAL_DIFFERENCE = 'central'
+FORWARD_DIFFERENCE = 'forward'
+SAVGOL_DIFFERENCE = 'savgol'
+DEFAULT_SAVGOL_WINDOW = 7
+DEFAULT_SAVGOL_ORDER = 3
+
 
 # ==================================
 # Motion
@@ -15,12 +23,14 @@ class Motion(list):
         self._frame = 0
         self.fps = DEFAULT_FPS
         self.motion_name = 'no name'
+        self._derivatives = {}  # cache of get_*_array. cleared when frames are edited
 
     def __getitem__(self, key):
         if isinstance(key, slice):
             motion = self.__class__(super(Motion, self).__getitem__(key))
             motion.__dict__.update(self.__dict__)
             motion._frame = 0
+            motion._derivatives = {}
             return motion
         if isinstance(key, float):
             floor = int(key)
@@ -34,11 +44,41 @@ class Motion(list):
     def __add__(self, next_motion):
         motion = self.__class__(super(Motion, self).__add__(next_motion))
         motion.__dict__.update(self.__dict__)
+        motion._derivatives = {}
         return motion
 
+    def __setitem__(self, key, posture):
+        self.invalidate_derivatives()
+        super(Motion, self).__setitem__(key, posture)
+
+    def __delitem__(self, key):
+        self.invalidate_derivatives()
+        super(Motion, self).__delitem__(key)
+
+    def append(self, posture):
+        self.invalidate_derivatives()
+        super(Motion, self).append(posture)
+
+    def extend(self, postures):
+        self.invalidate_derivatives()
+        super(Motion, self).extend(postures)
+
+    def insert(self, index, posture):
+        self.invalidate_derivatives()
+        super(Motion, self).insert(index, posture)
+
+    def pop(self, index=-1):
+        self.invalidate_derivatives()
+        return super(Motion, self).pop(index)
+
+    def remove(self, posture):
+        self.invalidate_derivatives()
+        super(Motion, self).remove(posture)
+
     def copy(self):
         motion = self.__class__(super(Motion, self).copy())
         motion.__dict__.update(self.__dict__)
+        motion._derivatives = {}
         return motion
 
     def get_frame(self):
@@ -76,6 +116,63 @@ class Motion(list):
     def get_accelerations(self, frame0, frame1=None):
         return self._get_derivatives(frame0, frame1, self.get_velocities, op.sub)
 
+    # ===========================================================================
+    # derivative cache
+    # arrays of all frames are computed on first access and cached until frames are edited.
+    # returned arrays are shared by later calls, so do not modify them.
+    # per-frame getters such as get_velocity do not use the cache, so they see postures edited in place
+    # ===========================================================================
+    def invalidate_derivatives(self):
+        """
+        clear cached arrays. call this after modifying postures in place, which motions cannot detect
+        except for array motions
+        """
+        if self._derivatives:
+            self._derivatives.clear()
+
+    def _get_cached(self, key, compute_func):
+        value = self._derivatives.get(key)
+        if value is None:
+            value = self._derivatives[key] = compute_func()
+        return value
+
+    def get_position_array(self, use_cache=True):
+        """
+        :param use_cache: if False, positions are computed from postures again and not cached,
+        so postures edited in place are seen
+        :return: (F, J, 3) array of positions of all frames
+        """
+        if not use_cache:
+            return self._compute_position_array()
+        return self._get_cached(('position',), self._compute_position_array)
+
+    def _compute_position_array(self):
+        if len(self) == 0:
+            return np.zeros((0, 0, 3))
+        return np.array([posture.get_positions() for posture in self], float).reshape(len(self), -1, 3)
+
+    def get_velocity_array(self, method=CENTRAL_DIFFERENCE, window=DEFAULT_SAVGOL_WINDOW, order=DEFAULT_SAVGOL_ORDER):
+        """
+        :param method: CENTRAL_DIFFERENCE, FORWARD_DIFFERENCE or SAVGOL_DIFFERENCE. see differentiate
+        :param window: window of SAVGOL_DIFFERENCE
+        :param order: polynomial order of SAVGOL_DIFFERENCE
+        :return: (F, J, 3) array of velocities of all frames
+        """
+        return self._get_cached(('velocity',) + _get_method_key(method, window, order),
+                                lambda: differentiate(self.get_position_array(), self.fps, method, window, order))
+
+    def get_acceleration_array(self, method=CENTRAL_DIFFERENCE, window=DEFAULT_SAVGOL_WINDOW,
+                               order=DEFAULT_SAVGOL_ORDER):
+        """
+        differences of velocities, or the second derivative of smoothing polynomials of positions for SAVGOL_DIFFERENCE
+        :return: (F, J, 3) array of accelerations of all frames
+        """
+        def _compute():
+            if method == SAVGOL_DIFFERENCE:
+                return differentiate(self.get_position_array(), self.fps, method, window, order, 2)
+            return differentiate(self.get_velocity_array(method), self.fps, method)
+        return self._get_cached(('acceleration',) + _get_method_key(method, window, order), _compute)
+
     def _get_finite_difference_frames(self, frame):
         prev_frame = frame - 1 if frame > 0 else frame
         next_frame = frame + 1 if frame < len(self) - 1 else frame
@@ -113,11 +210,452 @@ class JointMotion(Motion):
     def get_skeleton(self):
         return self[0].get_skeleton() if len(self) > 0 else None
 
+    def _get_global_ts_array(self):
+        """
+        :return: (F, J, 4, 4) array of global transformations of all frames
+        """
+        return np.array([posture.get_global_ts() for posture in self], float).reshape(len(self), -1, 4, 4)
+
+    def _compute_position_array(self):
+        return self._get_global_ts_array()[..., :3, 3].copy()
+
+    def get_angular_velocity_array(self, method=CENTRAL_DIFFERENCE, window=DEFAULT_SAVGOL_WINDOW,
+                                   order=DEFAULT_SAVGOL_ORDER):
+        """
+        angular velocities of global rotations in the global frame.
+        for SAVGOL_DIFFERENCE, angular velocities of CENTRAL_DIFFERENCE are smoothed by Savitzky-Golay filter
+        :return: (F, J, 3) array of angular velocities of all frames
+        """
+        def _compute():
+            if method == SAVGOL_DIFFERENCE:
+                return differentiate(self.get_angular_velocity_array(), self.fps, method, window, order, 0)
+            return _get_angular_velocities(mq.so3_to_quat(self._get_global_ts_array()[..., :3, :3]), self.fps, method)
+        return self._get_cached(('angular_velocity',) + _get_method_key(method, window, order), _compute)
+
+    def get_angular_acceleration_array(self, method=CENTRAL_DIFFERENCE, window=DEFAULT_SAVGOL_WINDOW,
+                                       order=DEFAULT_SAVGOL_ORDER):
+        """
+        differences of angular velocities. for SAVGOL_DIFFERENCE, the first derivative of smoothing polynomials of
+        angular velocities of CENTRAL_DIFFERENCE
+        :return: (F, J, 3) array of angular accelerations of all frames
+        """
+        def _compute():
+            if method == SAVGOL_DIFFERENCE:
+                return differentiate(self.get_angular_velocity_array(), self.fps, method, window, order)
+            return differentiate(self.get_angular_velocity_array(method), self.fps, method)
+        return self._get_cached(('angular_acceleration',) + _get_method_key(method, window, order), _compute)
+
+    def update_global_ts(self, frames=None):
+        """
+        update global transformation matrices of postures at frames at once by forward_kinematics.
+        postures compute them lazily one by one if this is not called
+        :param frames: all frames if None
+        :return:
+        """
+        self.invalidate_derivatives()
+        postures = list(self) if frames is None else [self[frame] for frame in frames]
+        if len(postures) == 0:
+            return
+        global_ts = forward_kinematics(self.get_skeleton(), [posture.get_root_position() for posture in postures],
+                                       [posture.get_local_rs() for posture in postures])
+        for posture, posture_global_ts in zip(postures, global_ts):
+            posture.set_local_rs(posture.get_local_rs(), posture_global_ts)
+
+
+def _as_float_array(a):
+    """
+    :return: a as a float array. floating point arrays such as float32 arrays or memmaps are not copied
+    """
+    a = np.asarray(a)
+    return a if a.dtype.kind == 'f' else a.astype(float)
+
+
+class ArrayJointMotion(JointMotion):
+    """
+    JointMotion whose frame data are stored in contiguous arrays (structure of arrays)
+    root positions : (F, 3) array
+    local rotations : (F, J, 3, 3) array of SO3, or (F, J, 4) array of unit quaternions if use_quaternion is True
+    floating point arrays given to the constructor are used as they are, so float32 arrays or memmaps are kept
+    read-only arrays are shared with other motions and copied before the first modification (copy-on-write)
+    global transformations : (F, J, 4, 4) array of SE3, allocated and updated per frame when they are queried
+    each item of the list is an ArrayJointPosture, a lightweight view into one frame row of the arrays
+    list mutators such as del, insert and extend resize the arrays and rebind views to their new frames
+    """
+    def __init__(self, skeleton=None, root_positions=None, local_rs=None, use_quaternion=False, is_quaternion=None):
+        """
+        :param skeleton:
+        :param root_positions: (F, 3) array
+        :param local_rs: (F, J, 3, 3) array of SO3, (F, J, 4, 4) array of SE3 or (F, J, 4) array of quaternions
+        :param use_quaternion: store local rotations as unit quaternions, which take a quarter of memory of SE3
+        :param is_quaternion: True if local_rs are quaternions, False if they are matrices. use_quaternion if None
+        """
+        self._skeleton = skeleton
+        self._use_quaternion = use_quaternion
+        len_nodes = 0 if skeleton is None else skeleton.get_len_nodes()
+        if root_positions is None:
+            root_positions = np.zeros((0 if local_rs is None else len(local_rs), 3))
+        if local_rs is None:
+            local_rs, is_quaternion = np.tile(mm.i_so3(), (len(root_positions), len_nodes, 1, 1)), False
+        is_quaternion = use_quaternion if is_quaternion is None else is_quaternion
+        local_rs = _as_float_array(local_rs)
+        if is_quaternion and (local_rs.ndim != 3 or local_rs.shape[2] != 4):
+            raise ValueError("local_rs of quaternions must be (F, J, 4) array")
+        if not is_quaternion and (local_rs.ndim != 4 or local_rs.shape[2:] not in ((3, 3), (4, 4))):
+            raise ValueError("local_rs of matrices must be (F, J, 3, 3) or (F, J, 4, 4) array")
+        if local_rs.shape[1] != len_nodes:
+            raise IndexError("length of local_rs must be same to length of skeleton's nodes")
+        self._root_positions = _as_float_array(root_positions)
+        self._local_rs = self._to_storage(local_rs, is_quaternion)
+        if len(self._root_positions) != len(self._local_rs):
+            raise IndexError("root_positions and local_rs must have same number of frames")
+        self._global_ts = None  # allocated when global transformations are queried
+        self._updated = np.zeros(len(self._local_rs), bool)  # per frame. if false, _global_ts of frame must be updated
+        super(ArrayJointMotion, self).__init__([ArrayJointPosture(self, f) for f in range(len(self._local_rs))])
+
+    @classmethod
+    def from_joint_motion(cls, joint_motion, use_quaternion=False):
+        if len(joint_motion) == 0:
+            array_motion = cls(joint_motion.get_skeleton(), use_quaternion=use_quaternion)
+        else:
+            root_positions = [posture.get_root_position() for posture in joint_motion]
+            local_rs = [[local_r[:3, :3] for local_r in posture.get_local_rs()] for posture in joint_motion]
+            array_motion = cls(joint_motion.get_skeleton(), root_positions, local_rs, use_quaternion, False)
+        array_motion.fps = joint_motion.fps
+        array_motion.motion_name = joint_motion.motion_name
+        return array_motion
+
+    def to_joint_motion(self):
+        joint_motion = JointMotion()
+        for f in range(len(self)):
+            joint_posture = JointPosture(self._skeleton)
+            joint_posture.set_root_position(self._root_positions[f].copy())
+            joint_posture.set_local_rs([mm.so3_to_se3(local_r) for local_r in self._get_local_rs_at(f)])
+            joint_motion.append(joint_posture)
+        joint_motion.fps = self.fps
+        joint_motion.motion_name = self.motion_name
+        return joint_motion
+
+    def _new_motion(self, root_positions, local_rs):
+        motion = self.__class__(self._skeleton, root_positions, local_rs, self._use_quaternion)
+        motion.fps = self.fps
+        motion.motion_name = self.motion_name
+        return motion
+
+    def _to_storage(self, local_rs, is_quaternion=False):
+        """
+        convert local rotations to the storage format of this motion
+        :param local_rs: (..., 3, 3) SO3 or (..., 4, 4) SE3, or (..., 4) quaternions if is_quaternion is True
+        :param is_quaternion:
+        :return:
+        """
+        local_rs = _as_float_array(local_rs)
+        if self._use_quaternion:
+            return local_rs if is_quaternion else mq.so3_to_quat(local_rs[..., :3, :3])
+        return mq.quat_to_so3(local_rs) if is_quaternion else local_rs[..., :3, :3]
+
+    def _to_so3(self, stored_rs):
+        return mq.quat_to_so3(stored_rs) if self._use_quaternion else stored_rs
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._new_motion(self._root_positions[key].copy(), self._local_rs[key].copy())
+        return super(ArrayJointMotion, self).__getitem__(key)
+
+    def __setitem__(self, key, posture):
+        if isinstance(key, slice):
+            raise TypeError("slice assignment is not supported by ArrayJointMotion")
+        frame = range(len(self))[key]
+        self._set_root_position_at(frame, posture.get_root_position())
+        self._set_local_rs_at(frame, slice(None), [local_r[:3, :3] for local_r in posture.get_local_rs()])
+
+    def __add__(self, next_motion):
+        if not isinstance(next_motion, ArrayJointMotion):
+            next_motion = ArrayJointMotion.from_joint_motion(JointMotion(next_motion))
+        next_local_rs = self._to_storage(next_motion._local_rs, next_motion._use_quaternion)
+        return self._new_motion(np.concatenate((self._root_positions, next_motion._root_positions)),
+                                np.concatenate((self._local_rs, next_local_rs)))
+
+    def __delitem__(self, key):
+        frames = range(len(self))[key]
+        keep = np.ones(len(self), bool)
+        keep[frames if isinstance(frames, range) else [frames]] = False
+        self._take_frames(np.flatnonzero(keep))
+
+    def __iadd__(self, postures):
+        self.extend(postures)
+        return self
+
+    def __imul__(self, n):
+        raise TypeError("repetition is not supported by ArrayJointMotion")
+
+    def append(self, posture):
+        self._insert_frames(len(self), [posture])
+
+    def extend(self, postures):
+        self._insert_frames(len(self), list(postures))
+
+    def insert(self, index, posture):
+        # same index rule as list.insert
+        index = min(max(index + len(self), 0) if index < 0 else index, len(self))
+        self._insert_frames(index, [posture])
+
+    def pop(self, index=-1):
+        """
+        :return: JointPosture copied from the removed frame, because views are bound to frames of this motion
+        """
+        frame = range(len(self))[index]
+        joint_posture = JointPosture(self._skeleton, self._root_positions[frame].copy(),
+                                     [mm.so3_to_se3(local_r) for local_r in self._get_local_rs_at(frame)])
+        del self[frame]
+        return joint_posture
+
+    def remove(self, posture):
+        for frame, frame_posture in enumerate(self):
+            if frame_posture is posture:
+                del self[frame]
+                return
+        raise ValueError("posture is not in this motion")
+
+    def clear(self):
+        del self[:]
+
+    def reverse(self):
+        self._take_frames(np.arange(len(self))[::-1])
+
+    def sort(self, *args, **kwargs):
+        raise TypeError("sorting is not supported by ArrayJointMotion")
+
+    def _insert_frames(self, frame, postures):
+        """
+        insert new frame rows copied from postures before frame and shift views of later frames
+        """
+        if len(postures) == 0:
+            return
+        len_nodes = self._local_rs.shape[1]
+        root_positions = np.array([posture.get_root_position() for posture in postures], float).reshape(-1, 3)
+        local_rs = np.array([[local_r[:3, :3] for local_r in posture.get_local_rs()] for posture in postures], float)
+        if local_rs.shape[1:] != (len_nodes, 3, 3):
+            raise IndexError("length of local_rs must be same to length of skeleton's nodes")
+        frames = np.full(len(postures), frame)
+        self._root_positions = np.insert(self._root_positions, frames, root_positions, 0)
+        self._local_rs = np.insert(self._local_rs, frames, self._to_storage(local_rs), 0)
+        if self._global_ts is not None:
+            self._global_ts = np.insert(self._global_ts, frames, np.zeros((len(postures), len_nodes, 4, 4)), 0)
+        self._updated = np.insert(self._updated, frames, False)
+        views = list(self)
+        views[frame:frame] = [ArrayJointPosture(self, 0) for _ in postures]
+        self._set_views(views)
+
+    def _take_frames(self, frames):
+        """
+        keep frame rows of frames in order and their views. views of other frames are dropped
+        """
+        self._root_positions = self._root_positions[frames]
+        self._local_rs = self._local_rs[frames]
+        if self._global_ts is not None:
+            self._global_ts = self._global_ts[frames]
+        self._updated = self._updated[frames]
+        views = list(self)
+        self._set_views([views[frame] for frame in frames])
+
+    def _set_views(self, views):
+        for frame, view in enumerate(views):
+            view._frame = frame
+        self.invalidate_derivatives()
+        list.__setitem__(self, slice(None), views)
+
+    def copy(self):
+        return self._new_motion(self._root_positions.copy(), self._local_rs.copy())
+
+    def get_skeleton(self):
+        return self._skeleton
+
+    def set_skeleton(self, skeleton):
+        self._skeleton = skeleton
+        self._root_positions = np.zeros((len(self), 3))
+        self._local_rs = self._to_storage(np.tile(mm.i_so3(), (len(self), skeleton.get_len_nodes(), 1, 1)))
+        self._global_ts = None
+        self._updated[:] = False
+        self.invalidate_derivatives()
+
+    def is_quaternion_used(self):
+        return self._use_quaternion
+
+    def get_root_positions(self, writeable=True):
+        """
+        :param writeable: if False, an array shared with other motions is returned without copying. only read it
+        :return: (F, 3) array of root positions. modifying it modifies the motion; call update_global_ts after that
+        """
+        if writeable:
+            self._make_writeable()
+        return self._root_positions
+
+    def get_local_rs(self, writeable=True):
+        """
+        :param writeable: if False, an array shared with other motions is returned without copying. only read it
+        :return: (F, J, 3, 3) array of local rotations. modifying it modifies the motion; call update_global_ts after that
+        if quaternions are used, it is a converted copy and modifying it does not modify the motion
+        """
+        if writeable and not self._use_quaternion:
+            self._make_writeable()
+        return self._to_so3(self._local_rs)
+
+    def get_local_qs(self, writeable=True):
+        """
+        :param writeable: if False, an array shared with other motions is returned without copying. only read it
+        :return: (F, J, 4) array of local rotations as unit quaternions (w, x, y, z)
+        if quaternions are used, modifying it modifies the motion; call update_global_ts after that
+        otherwise it is a converted copy
+        """
+        if writeable and self._use_quaternion:
+            self._make_writeable()
+        return self._local_rs if self._use_quaternion else mq.so3_to_quat(self._local_rs)
+
+    def _make_writeable(self):
+        """
+        copy arrays shared with other motions before they are modified
+        """
+        if not self._root_positions.flags.writeable:
+            self._root_positions = self._root_positions.copy()
+        if not self._local_rs.flags.writeable:
+            self._local_rs = self._local_rs.copy()
+
+    def _get_root_position_at(self, frame):
+        return self._root_positions[frame]
+
+    def _set_root_position_at(self, frame, root_position):
+        self._make_writeable()
+        self._root_positions[frame] = root_position
+        self._updated[frame] = False
+        self.invalidate_derivatives()
+
+    def _get_local_rs_at(self, frame, index=slice(None)):
+        return self._to_so3(self._local_rs[frame, index])
+
+    def _set_local_rs_at(self, frame, index, local_rs):
+        self._make_writeable()
+        self._local_rs[frame, index] = self._to_storage(local_rs)
+        self._updated[frame] = False
+        self.invalidate_derivatives()
+
+    def get_global_ts(self):
+        """
+        :return: (F, J, 4, 4) array of global transformations of all frames
+        """
+        self._update_global_ts(np.flatnonzero(~self._updated))
+        return self._global_ts
+
+    def update_global_ts(self, frames=None):
+        """
+        update global transformation matrices of frames at once by forward_kinematics
+        :param frames: all frames if None
+        :return:
+        """
+        self.invalidate_derivatives()
+        self._update_global_ts(np.arange(len(self)) if frames is None else np.asarray(frames, int))
+
+    def _invalidate_global_ts_at(self, frame):
+        self._updated[frame] = False
+        self.invalidate_derivatives()
+
+    def _get_global_ts_array(self):
+        return self.get_global_ts()
+
+    def _get_global_ts_at(self, frame):
+        if not self._updated[frame]:
+            self._update_global_ts([frame])
+        return self._global_ts[frame]
+
+    def _update_global_ts(self, frames):
+        if len(frames) == 0:
+            return
+        if self._global_ts is None:
+            self._global_ts = np.empty(self._local_rs.shape[:2] + (4, 4))
+        self._global_ts[frames] = forward_kinematics(self._skeleton, self._root_positions[frames],
+                                                     self._to_so3(self._local_rs[frames]))
+        self._updated[frames] = True
+
 
 class PointMotion(Motion):
     pass
 
 
+class ArrayPointMotion(PointMotion):
+    """
+    PointMotion whose point positions are stored in a (F, M, 3) array. positions of missing points are NaN
+    each item of the list is an ArrayPointPosture, a lightweight view into one frame row of the array
+    """
+    def __init__(self, point_names=None, positions=None):
+        """
+        :param point_names: list of M names of points
+        :param positions: (F, M, 3) array
+        """
+        self._point_names = list() if point_names is None else list(point_names)
+        if positions is None:
+            positions = np.zeros((0, len(self._point_names), 3))
+        self._positions = _as_float_array(positions)
+        if self._positions.shape[1:] != (len(self._point_names), 3):
+            raise IndexError("positions must be (F, M, 3) array for M point names")
+        super(ArrayPointMotion, self).__init__([ArrayPointPosture(self, f) for f in range(len(self._positions))])
+
+    def _new_motion(self, positions):
+        motion = self.__class__(self._point_names, positions)
+        motion.fps = self.fps
+        motion.motion_name = self.motion_name
+        return motion
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._new_motion(self._positions[key].copy())
+        return super(ArrayPointMotion, self).__getitem__(key)
+
+    def __setitem__(self, key, posture):
+        if isinstance(key, slice):
+            raise TypeError("slice assignment is not supported by ArrayPointMotion")
+        self._positions[range(len(self))[key]] = posture.get_positions()
+        self.invalidate_derivatives()
+
+    def __add__(self, next_motion):
+        if isinstance(next_motion, ArrayPointMotion):
+            next_positions = next_motion.get_point_positions()
+        else:
+            next_positions = np.array([posture.get_positions() for posture in next_motion], float)
+        next_positions = next_positions.reshape(-1, len(self._point_names), 3)
+        return self._new_motion(np.concatenate((self._positions, next_positions)))
+
+    def append(self, posture):
+        frame = len(self)
+        self._positions = np.concatenate((self._positions, np.reshape(posture.get_positions(), (1, -1, 3))))
+        super(ArrayPointMotion, self).append(ArrayPointPosture(self, frame))
+
+    def copy(self):
+        return self._new_motion(self._positions.copy())
+
+    def get_point_names(self):
+        return self._point_names
+
+    def get_index_by_label(self, label):
+        try:
+            return self._point_names.index(label)
+        except ValueError:
+            raise ValueError("no point has this label.")
+
+    def get_point_positions(self):
+        """
+        :return: (F, M, 3) array of point positions. modifying it modifies the motion
+        """
+        return self._positions
+
+    def _compute_position_array(self):
+        return self._positions.copy()
+
+    def get_valid_mask(self):
+        """
+        :return: (F, M) bool array. False where the point is missing
+        """
+        return ~np.any(np.isnan(self._positions), -1)
+
+
 # ==================================
 # Posture
 # ==================================
@@ -136,14 +674,28 @@ class Posture:
 
 
 class JointPosture(Posture):
-    def __init__(self, skeleton=None):
+    def __init__(self, skeleton=None, root_position=None, local_rs=None, global_ts=None):
+        """
+        :param skeleton:
+        :param root_position: vec3. zero vector if None
+        :param local_rs: local rotation matrices : SE3. identity matrices if None
+        :param global_ts: global transformation matrices of local_rs precomputed by forward_kinematics.
+        computed from local_rs if None
+        """
         super(JointPosture, self).__init__()
         self._skeleton = skeleton
         self._root_position = None  # root position : vec3
         self._local_rs = []  # local rotation matrices : SE3
-        self._global_ts = []  # global transformation matrices : SE3
-        self._updated = []  # boolean list for _global_ts. if false, related _global_t must be updated
-        self.initialize()
+        self._global_ts = None  # global transformation matrices : SE3. None until they are queried
+        self._updated = None  # boolean list for _global_ts. if false, related _global_t must be updated
+        self._invalid_range = None  # (start, end) of joints to be updated in depth-first order. None if all are valid
+        if local_rs is None:
+            self.initialize()
+            if root_position is not None:
+                self.set_root_position(root_position)
+        else:
+            self._root_position = mm.o_vec3() if root_position is None else root_position
+            self.set_local_rs(local_rs, global_ts)
 
     def initialize(self):
         self._root_position = mm.o_vec3()
@@ -153,29 +705,83 @@ class JointPosture(Posture):
         return self._root_position
 
     def set_root_position(self, root_position):
+        offset = np.asarray(root_position, float) - self._root_position
         self._root_position = root_position
+        if self._global_ts is None:
+            return
         for index in range(len(self._global_ts)):
-            self._global_ts[index] = np.dot(mm.vec3_to_se3(self._root_position), self._global_ts[index])
+            if self._global_ts[index] is not None:
+                global_t = self._global_ts[index].copy()
+                global_t[:3, 3] += offset
+                self._global_ts[index] = global_t
 
     def get_local_rs(self):
         return self._local_rs
 
-    def set_local_rs(self, local_rs):
+    def set_local_rs(self, local_rs, global_ts=None):
+        """
+        :param local_rs: local rotation matrices : SE3
+        :param global_ts: global transformation matrices of local_rs precomputed by forward_kinematics.
+        computed from local_rs when they are queried if None
+        :return:
+        """
         if len(local_rs) != self._skeleton.get_len_nodes():
             raise IndexError("length of local_rs must be same to length of skeleton's nodes")
         self._local_rs = local_rs
-        self._updated = [False for _ in self._local_rs]
-        self._global_ts = [None for _ in self._local_rs]
-        self._update_global_ts()
+        self._invalid_range = None
+        if global_ts is None:
+            self._updated = None
+            self._global_ts = None
+        else:
+            if len(global_ts) != len(local_rs):
+                raise IndexError("length of global_ts must be same to length of local_rs")
+            self._updated = [True for _ in self._local_rs]
+            self._global_ts = list(global_ts)
 
     def get_local_r(self, index):
         return self._local_rs[index]
 
     def set_local_r(self, index, local_r):
         self._local_rs[index] = local_r
-        for i in self._skeleton.get_descendant_indices_at(index):
+        self._invalidate_descendants(index)
+
+    def set_local_rs_partial(self, indices, local_rs):
+        """
+        set local rotations of some joints. global transformation matrices of their subtrees are updated once
+        :param indices: joint indices
+        :param local_rs: local rotation SE3s related to indices
+        :return:
+        """
+        if len(indices) != len(local_rs):
+            raise IndexError("length of local_rs must be same to length of indices")
+        for index, local_r in zip(indices, local_rs):
+            self._local_rs[index] = local_r
+            self._invalidate_descendants(index)
+
+    def _invalidate_descendants(self, index):
+        """
+        invalidate global transformation matrices of descendants including index.
+        they are updated when one of global transformation matrices is queried
+        :param index:
+        :return:
+        """
+        if self._global_ts is None:
+            return
+        start, end = self._skeleton.get_descendant_range_at(index)
+        for i in self._skeleton.get_dfs_order()[start:end]:
             self._updated[i] = False
-        self._update_global_ts()
+        if self._invalid_range is not None:
+            start, end = min(start, self._invalid_range[0]), max(end, self._invalid_range[1])
+        self._invalid_range = (start, end)
+
+    def _validate_global_ts(self):
+        if self._global_ts is None:
+            self._global_ts = [None for _ in self._local_rs]
+            self._updated = [False for _ in self._local_rs]
+            self._invalid_range = (0, len(self._local_rs))
+        if self._invalid_range is not None:
+            self._update_global_ts(*self._invalid_range)
+            self._invalid_range = None
 
     def set_local_r_without_update(self, index, local_r):
         """
@@ -188,16 +794,18 @@ class JointPosture(Posture):
         self._local_rs[index] = local_r
 
     def get_local_p(self, index):
-        return self._skeleton.get_parent_node_at(index).get_translation()
+        return self.get_skeleton().get_parent_node_at(index).get_translation()
 
     def get_global_ts(self):
+        self._validate_global_ts()
         return self._global_ts
 
     def get_global_t(self, index):
+        self._validate_global_ts()
         return self._global_ts[index]
 
     def get_global_r(self, index):
-        return mm.t_to_r(self._global_ts[index])
+        return mm.t_to_r(self.get_global_t(index))
 
     def set_global_r(self, index, global_r):
         """
@@ -213,34 +821,48 @@ class JointPosture(Posture):
         # Gin = Gp * Lin
         # Lin = Gp.transpose() * Gin
         """
-        parent = self._skeleton.get_parent_node_at(index)
+        parent = self.get_skeleton().get_parent_node_at(index)
         if parent is None:
             gp = mm.i_se3()
         else:
-            gp = mm.p_to_rt(self._global_ts[self._skeleton.get_index(parent)])
+            gp = mm.p_to_rt(self.get_global_t(self.get_skeleton().get_index(parent)))
         self.set_local_r(index, np.dot(gp.transpose(), global_r))
 
     def get_global_p(self, index):
-        return mm.t_to_p(self._global_ts[index])
+        return mm.t_to_p(self.get_global_t(index))
 
-    def _update_global_ts(self):
-        for i in range(len(self._updated)):
+    def _update_global_ts(self, start=0, end=None):
+        """
+        update invalidated global transformation matrices of joints in get_dfs_order()[start:end] of skeleton.
+        depth-first order makes parents updated before their children,
+        and global transformation matrices of joints out of the range must be valid
+        :param start:
+        :param end:
+        :return:
+        """
+        parent_indices = self._skeleton.get_parent_indices()
+        for i in self._skeleton.get_dfs_order()[start:end]:
             if self._updated[i] is False:
-                parent = self._skeleton.get_parent_node_at(i)
-                global_t = mm.vec3_to_se3(self._root_position) if parent is None \
-                    else self._global_ts[self._skeleton.get_parent_index_at(i)]
+                parent_index = parent_indices[i]
+                global_t = mm.vec3_to_se3(self._root_position) if parent_index < 0 \
+                    else self._global_ts[parent_index]
                 local_p = mm.vec3_to_se3(self._skeleton.get_node_at(i).get_translation())
                 self._global_ts[i] = np.dot(np.dot(global_t, local_p), self._local_rs[i])
                 self._updated[i] = True
 
     def update_global_ts(self):
-        for i in range(len(self._updated)):
-            self._updated[i] = False
-        self._update_global_ts()
+        self._global_ts = None
+        self._validate_global_ts()
+
+    def is_global_ts_materialized(self):
+        """
+        :return: False if global transformation matrices have not been computed since local_rs were set
+        """
+        return self._global_ts is not None
 
     def get_tpose(self, initial_rs=None):
-        tpose = JointPosture(self._skeleton)
-        tpose.set_root_position(self._root_position.copy())
+        tpose = JointPosture(self.get_skeleton())
+        tpose.set_root_position(self.get_root_position().copy())
         if initial_rs is not None:
             tpose.set_local_rs(initial_rs)
         return tpose
@@ -253,20 +875,113 @@ class JointPosture(Posture):
         self.initialize()
 
     def blend(self, posture, t):
-        blended_posture = JointPosture(self._skeleton)
-        blended_posture.set_root_position(mm.linearInterpol(self._root_position, posture.get_root_position(), t))
-        blended_local_rs = list()
-        for i in range(len(self._local_rs)):
-            blended_local_rs.append(mm.so3_to_se3(mm.slerp(mm.se3_to_so3(self._local_rs[i]),
-                                                           mm.se3_to_so3(posture.get_local_r(i)), t)))
-        blended_posture.set_local_rs(blended_local_rs)
+        blended_posture = JointPosture(self.get_skeleton())
+        blended_posture.set_root_position(mm.linearInterpol(self.get_root_position(), posture.get_root_position(), t))
+        blended_local_rs = np.zeros((self.get_skeleton().get_len_nodes(), 4, 4))
+        blended_local_rs[:, :3, :3] = mm.slerp_batch(np.asarray(self.get_local_rs())[:, :3, :3],
+                                                     np.asarray(posture.get_local_rs())[:, :3, :3], t)
+        blended_local_rs[:, 3, 3] = 1.
+        blended_posture.set_local_rs(list(blended_local_rs))
         return blended_posture
 
     def get_position(self, index):
-        return mm.t_to_p(self._global_ts[index])
+        return mm.t_to_p(self.get_global_t(index))
 
     def get_positions(self):
-        return [mm.t_to_p(t) for t in self._global_ts]
+        return [mm.t_to_p(t) for t in self.get_global_ts()]
+
+
+class ArrayJointPosture(JointPosture):
+    """
+    lightweight view into a frame row of ArrayJointMotion
+    the posture does not own any data. reading and writing go to the arrays of the motion
+    get_root_position returns a copy, and get_local_r and get_local_rs return copies in SE3,
+    so use set_root_position and set_local_r to modify them
+    """
+    def __init__(self, array_joint_motion, frame):
+        Posture.__init__(self)
+        self._motion = array_joint_motion
+        self._frame = frame
+
+    def initialize(self):
+        self._motion._set_root_position_at(self._frame, 0.)
+        self._motion._set_local_rs_at(self._frame, slice(None), mm.i_so3())
+
+    def get_root_position(self):
+        return self._motion._get_root_position_at(self._frame).copy()
+
+    def set_root_position(self, root_position):
+        self._motion._set_root_position_at(self._frame, root_position)
+
+    def get_local_rs(self):
+        return [mm.so3_to_se3(local_r) for local_r in self._motion._get_local_rs_at(self._frame)]
+
+    def set_local_rs(self, local_rs, global_ts=None):
+        if len(local_rs) != self.get_skeleton().get_len_nodes():
+            raise IndexError("length of local_rs must be same to length of skeleton's nodes")
+        self._motion._set_local_rs_at(self._frame, slice(None), [local_r[:3, :3] for local_r in local_rs])
+
+    def get_local_r(self, index):
+        return mm.so3_to_se3(self._motion._get_local_rs_at(self._frame, index))
+
+    def set_local_r(self, index, local_r):
+        self._motion._set_local_rs_at(self._frame, index, local_r[:3, :3])
+
+    def set_local_rs_partial(self, indices, local_rs):
+        if len(indices) != len(local_rs):
+            raise IndexError("length of local_rs must be same to length of indices")
+        self._motion._set_local_rs_at(self._frame, list(indices), [local_r[:3, :3] for local_r in local_rs])
+
+    def set_local_r_without_update(self, index, local_r):
+        self.set_local_r(index, local_r)
+
+    def get_local_qs(self):
+        """
+        :return: (J, 4) array of local rotations as unit quaternions
+        """
+        local_qs = self._motion._local_rs[self._frame]
+        return local_qs if self._motion.is_quaternion_used() else mq.so3_to_quat(local_qs)
+
+    def blend(self, posture, t):
+        if not (self._motion.is_quaternion_used() and isinstance(posture, ArrayJointPosture)):
+            return super(ArrayJointPosture, self).blend(posture, t)
+        blended_posture = JointPosture(self.get_skeleton())
+        blended_posture.set_root_position(mm.linearInterpol(self.get_root_position(), posture.get_root_position(), t))
+        blended_local_rs = np.zeros((self.get_skeleton().get_len_nodes(), 4, 4))
+        blended_local_rs[:, :3, :3] = mq.quat_to_so3(mq.slerp(self.get_local_qs(), posture.get_local_qs(), t))
+        blended_local_rs[:, 3, 3] = 1.
+        blended_posture.set_local_rs(list(blended_local_rs))
+        return blended_posture
+
+    def get_global_ts(self):
+        return self._motion._get_global_ts_at(self._frame)
+
+    def get_global_t(self, index):
+        return self.get_global_ts()[index]
+
+    def get_global_r(self, index):
+        return mm.t_to_r(self.get_global_t(index))
+
+    def get_global_p(self, index):
+        return mm.t_to_p(self.get_global_t(index))
+
+    def update_global_ts(self):
+        self._motion.update_global_ts([self._frame])
+
+    def is_global_ts_materialized(self):
+        return bool(self._motion._updated[self._frame])
+
+    def get_skeleton(self):
+        return self._motion.get_skeleton()
+
+    def set_skeleton(self, skeleton):
+        raise TypeError("skeleton of ArrayJointPosture is shared. use ArrayJointMotion.set_skeleton")
+
+    def get_position(self, index):
+        return mm.t_to_p(self.get_global_t(index))
+
+    def get_positions(self):
+        return [mm.t_to_p(t) for t in self.get_global_ts()]
 
 
 class PointPosture(Posture):
@@ -280,6 +995,40 @@ class PointPosture(Posture):
         raise NotImplementedError
 
 
+class ArrayPointPosture(PointPosture):
+    """
+    lightweight view into a frame row of ArrayPointMotion
+    """
+    def __init__(self, array_point_motion, frame):
+        super(ArrayPointPosture, self).__init__()
+        self._motion = array_point_motion
+        self._frame = frame
+
+    def blend(self, posture, t):
+        """
+        :return: ArrayPointPosture of a new one frame ArrayPointMotion. a point missing in either posture is missing
+        """
+        positions = mm.linearInterpol(np.asarray(self.get_positions()), np.asarray(posture.get_positions()), t)
+        blended_motion = ArrayPointMotion(self._motion.get_point_names(), positions[np.newaxis])
+        return blended_motion[0]
+
+    def get_point_names(self):
+        return self._motion.get_point_names()
+
+    def get_position(self, index):
+        return self._motion.get_point_positions()[self._frame, index].copy()
+
+    def get_positions(self):
+        return list(self._motion.get_point_positions()[self._frame].copy())
+
+    def set_position(self, index, position):
+        self._motion.get_point_positions()[self._frame, index] = position
+        self._motion.invalidate_derivatives()
+
+    def is_valid(self, index):
+        return not np.any(np.isnan(self._motion.get_point_positions()[self._frame, index]))
+
+
 # ==================================
 # Tree
 # ==================================
@@ -315,9 +1064,69 @@ class Node:
         self._children.remove(child)
 
 
+class TreeTopology:
+    """
+    immutable index tables of a tree built from the node list of Tree
+    node_indices : node -> index
+    label_indices : label -> index of the first node having the label
+    parent_indices : (J,) index of the parent of each node. -1 for the root
+    depths : (J,) number of ancestors of each node
+    children_offsets, children_indices : children of node i are children_indices[children_offsets[i]:children_offsets[i+1]]
+    dfs_order : (J,) node indices in depth-first (pre)order
+    dfs_positions : (J,) position of each node in dfs_order
+    descendant_ends : (J,) descendants of node i including itself are dfs_order[dfs_positions[i]:descendant_ends[i]]
+    """
+    def __init__(self, nodes):
+        self.node_indices = {node: i for i, node in enumerate(nodes)}
+        self.label_indices = {}
+        for i, node in enumerate(nodes):
+            self.label_indices.setdefault(node.label, i)
+
+        len_nodes = len(nodes)
+        parent_indices = np.full(len_nodes, -1, int)
+        children_offsets = np.zeros(len_nodes + 1, int)
+        children_indices = list()
+        for i, node in enumerate(nodes):
+            if node.has_parent():
+                parent_indices[i] = self.node_indices[node.get_parent()]
+            children_indices.extend(self.node_indices[child] for child in node.get_children())
+            children_offsets[i + 1] = len(children_indices)
+
+        depths = np.zeros(len_nodes, int)
+        dfs_order = np.zeros(len_nodes, int)
+        descendant_ends = np.zeros(len_nodes, int)
+        position = 0
+        stack = [(0, 0)] if len_nodes > 0 else []
+        while len(stack) > 0:
+            index, depth = stack.pop()
+            if index < 0:
+                descendant_ends[-index - 1] = position
+                continue
+            depths[index] = depth
+            dfs_order[position] = index
+            position += 1
+            stack.append((-index - 1, depth))
+            children = children_indices[children_offsets[index]:children_offsets[index + 1]]
+            stack.extend((child, depth + 1) for child in reversed(children))
+        dfs_positions = np.zeros(len_nodes, int)
+        dfs_positions[dfs_order] = np.arange(len_nodes)
+
+        self.parent_indices = parent_indices
+        self.depths = depths
+        self.children_offsets = children_offsets
+        self.children_indices = np.array(children_indices, int)
+        self.dfs_order = dfs_order
+        self.dfs_positions = dfs_positions
+        self.descendant_ends = descendant_ends
+        for table in (self.parent_indices, self.depths, self.children_offsets, self.children_indices,
+                      self.dfs_order, self.dfs_positions, self.descendant_ends):
+            table.flags.writeable = False
+
+
 class Tree:
     def __init__(self, root=None):
         self._nodes = list([root])
+        self._topology = None  # TreeTopology cache. built on demand and cleared when nodes are added or removed
 
     def __str__(self):
         if self.is_empty():
@@ -339,6 +1148,7 @@ class Tree:
 
     def set_root(self, root):
         self._nodes = list([root])
+        self._topology = None
 
     def get_len_nodes(self):
         return len(self._nodes)
@@ -349,17 +1159,28 @@ class Tree:
     def get_node_at(self, index):
         return self._nodes[index]
 
+    def get_topology(self):
+        """
+        :return: TreeTopology of current nodes. it is rebuilt only after nodes are added or removed
+        """
+        if self._topology is None:
+            self._topology = TreeTopology(list() if self.is_empty() else self._nodes)
+        return self._topology
+
     def get_node_by_label(self, label):
-        for node in self._nodes:
-            if node.label == label:
-                return node
-        raise ValueError("no node has this label.")
+        return self._nodes[self.get_index_by_label(label)]
 
     def get_index(self, node):
-        return self._nodes.index(node)
+        try:
+            return self.get_topology().node_indices[node]
+        except KeyError:
+            raise ValueError("node is not in this tree.")
 
     def get_index_by_label(self, label):
-        return self._nodes.index(self.get_node_by_label(label))
+        try:
+            return self.get_topology().label_indices[label]
+        except KeyError:
+            raise ValueError("no node has this label.")
 
     def get_label_by_index(self, index):
         return self._nodes[index].label
@@ -368,28 +1189,65 @@ class Tree:
         return self._nodes[index].get_parent()
 
     def get_parent_index_at(self, index):
-        return self._nodes.index(self.get_parent_node_at(index))
+        parent_index = self.get_topology().parent_indices[index]
+        if parent_index < 0:
+            raise ValueError("root of tree has no parent.")
+        return int(parent_index)
+
+    def get_parent_indices(self):
+        """
+        :return: (J,) array of parent indices. -1 for the root
+        """
+        return self.get_topology().parent_indices
+
+    def get_depths(self):
+        """
+        :return: (J,) array of depths. 0 for the root
+        """
+        return self.get_topology().depths
+
+    def get_children_indices_at(self, index):
+        topology = self.get_topology()
+        return topology.children_indices[topology.children_offsets[index]:topology.children_offsets[index + 1]]
+
+    def get_descendant_range_at(self, index):
+        """
+        :param index:
+        :return: start, end. descendants including self are get_dfs_order()[start:end]
+        """
+        topology = self.get_topology()
+        return int(topology.dfs_positions[index]), int(topology.descendant_ends[index])
+
+    def get_dfs_order(self):
+        """
+        :return: (J,) array of node indices in depth-first order
+        """
+        return self.get_topology().dfs_order
 
     def get_descendant_indices_at(self, index):
         """
         :param index:
         :return: descendant's indices including self index
         """
-        result = list([index])
-        for node in self._nodes[index].get_children():
-            result.extend(self.get_descendant_indices_at(self.get_index(node)))
-        return result
+        start, end = self.get_descendant_range_at(index)
+        return self.get_topology().dfs_order[start:end].tolist()
 
     def get_ancestor_indices_at(self, index):
         """
         :param index:
         :return: ancestor's indices including self index
         """
-        return [0] if index == 0 else self.get_ancestor_indices_at(self.get_parent_index_at(index)).append(index)
+        parent_indices = self.get_topology().parent_indices
+        result = list([index])
+        while parent_indices[result[-1]] >= 0:
+            result.append(int(parent_indices[result[-1]]))
+        result.reverse()
+        return result
 
     def add_node(self, node, parent):
         parent.add_child(node)
         self._nodes.append(node)
+        self._topology = None
 
     def remove_node(self, node):
         def _remove_node(_node):
@@ -400,6 +1258,7 @@ class Tree:
             raise ValueError("can't remove. this node is root of tree.")
         _remove_node(node)
         node.get_parent().remove_child(node)
+        self._topology = None
 
     def remove_node_at(self, index):
         self.remove_node(self._nodes[index])
@@ -426,3 +1285,163 @@ class JointNode(Node):
 
 class PointNode(Node):
     pass
+
+
+# ==================================
+# Kinematics
+# ==================================
+def forward_kinematics(skeleton, root_positions, local_rs):
+    """
+    computes global transformations of all frames at once.
+    joints of same depth are updated together by one stacked matrix multiplication over all frames
+    global_t of joint i = (global_t of parent) (translation of joint i) (local_r of joint i)
+    global_t of root = (root_position) (translation of root) (local_r of root)
+    :param skeleton:
+    :param root_positions: (F, 3) array
+    :param local_rs: (F, J, 3, 3) array of SO3 or (F, J, 4, 4) array of SE3
+    :return: (F, J, 4, 4) array of global transformations
+    """
+    root_positions = np.asarray(root_positions, float)
+    local_rs = np.asarray(local_rs, float)[..., :3, :3]
+    nodes = skeleton.get_nodes()
+    parent_indices = skeleton.get_parent_indices()
+    depths = skeleton.get_depths()
+    translations = np.array([node.get_translation() for node in nodes], float).reshape(-1, 3)
+
+    global_rs = np.empty_like(local_rs)
+    global_ps = np.empty(local_rs.shape[:2] + (3,))
+    for depth in range(depths.max() + 1 if len(depths) > 0 else 0):
+        indices = np.flatnonzero(depths == depth)
+        if depth == 0:
+            global_rs[:, indices] = local_rs[:, indices]
+            global_ps[:, indices] = root_positions[:, np.newaxis, :] + translations[indices]
+        else:
+            parents = parent_indices[indices]
+            parent_rs = global_rs[:, parents]
+            global_rs[:, indices] = np.matmul(parent_rs, local_rs[:, indices])
+            global_ps[:, indices] = global_ps[:, parents] + np.einsum('fjab,jb->fja', parent_rs, translations[indices])
+
+    global_ts = np.zeros(local_rs.shape[:2] + (4, 4))
+    global_ts[..., :3, :3] = global_rs
+    global_ts[..., :3, 3] = global_ps
+    global_ts[..., 3, 3] = 1.
+    return global_ts
+
+
+# ==================================
+# Finite differences
+# ==================================
+def differentiate(values, fps, method=CENTRAL_DIFFERENCE, window=DEFAULT_SAVGOL_WINDOW, order=DEFAULT_SAVGOL_ORDER,
+                  deriv=1):
+    """
+    derivatives of values of all frames at once
+    CENTRAL_DIFFERENCE : (v[f+1] - v[f-1]) / 2dt. first and last frames use one-sided differences as Motion.get_velocity
+    FORWARD_DIFFERENCE : (v[f+1] - v[f]) / dt. the last frame uses the backward difference
+    SAVGOL_DIFFERENCE : derivative of Savitzky-Golay smoothing polynomials of window frames and order
+    :param values: (F, ...) array
+    :param fps:
+    :param method:
+    :param window: odd number of frames. shrunk if motion is shorter
+    :param order: polynomial order
+    :param deriv: order of the derivative. differences are applied deriv times
+    :return: (F, ...) array
+    """
+    values = np.asarray(values, float)
+    frame_num = len(values)
+    if method == SAVGOL_DIFFERENCE:
+        window = min(window, frame_num - (frame_num + 1) % 2)
+        if window < 1 or (deriv > 0 and window < 2):
+            return np.zeros_like(values)
+        # scipy.signal takes long to import, so it is imported only here
+        import scipy.signal
+        return scipy.signal.savgol_filter(values, window, min(order, window - 1), deriv, 1. / fps, 0, 'interp')
+    if method not in (CENTRAL_DIFFERENCE, FORWARD_DIFFERENCE):
+        raise ValueError("unknown difference method '%s'" % method)
+
+    for _ in range(deriv):
+        derivatives = np.zeros_like(values)
+        if frame_num >= 2:
+            if method == CENTRAL_DIFFERENCE:
+                derivatives[1:-1] = (values[2:] - values[:-2]) * (fps / 2.)
+                derivatives[0] = (values[1] - values[0]) * fps
+            else:
+                derivatives[:-1] = (values[1:] - values[:-1]) * fps
+            derivatives[-1] = (values[-1] - values[-2]) * fps
+        values = derivatives
+    return values
+
+
+def _get_angular_velocities(global_qs, fps, method):
+    """
+    :param global_qs: (F, J, 4) global rotations
+    :return: (F, J, 3) angular velocities in the global frame by differences of rotations of adjacent frames
+    """
+    frame_num = len(global_qs)
+    if frame_num < 2:
+        return np.zeros(global_qs.shape[:-1] + (3,))
+    frames = np.arange(frame_num)
+    if method == CENTRAL_DIFFERENCE:
+        frames0 = np.maximum(frames - 1, 0)
+        frames1 = np.minimum(frames + 1, frame_num - 1)
+    elif method == FORWARD_DIFFERENCE:
+        frames0 = np.minimum(frames, frame_num - 2)
+        frames1 = frames0 + 1
+    else:
+        raise ValueError("unknown difference method '%s'" % method)
+    delta_qs = mq.mul(global_qs[frames1], mq.conjugate(global_qs[frames0]))
+    return mq.log(delta_qs) * (fps / (frames1 - frames0))[:, np.newaxis, np.newaxis]
+
+
+def _get_method_key(method, window, order):
+    return (method, window, order) if method == SAVGOL_DIFFERENCE else (method,)
+
+
+if __name__ == '__main__':
+    # run in modules directory : python -m motion.motion
+    import timeit
+
+    def _make_binary_skeleton(depth):
+        skeleton = Skeleton(JointNode('root', mm.seq_to_vec3([0., 1., 0.])))
+
+        def _add_children(_parent, _depth):
+            if _depth == depth:
+                return
+            for k in range(2):
+                child = JointNode('%s_%d' % (_parent.label, k), mm.seq_to_vec3([0.1 * k, 1., 0.]))
+                skeleton.add_node(child, _parent)
+                _add_children(child, _depth + 1)
+        _add_children(skeleton.get_root(), 0)
+        return skeleton
+
+    def profile_set_local_r():
+        skeleton = _make_binary_skeleton(6)
+        posture = JointPosture(skeleton)
+        leaf = skeleton.get_len_nodes() - 1
+        leaf_parents = skeleton.get_ancestor_indices_at(leaf)[-4:]
+        local_r = mm.so3_to_se3(mm.rot_x(0.1))
+        number = 1000
+
+        def _full_update():
+            posture.set_local_r_without_update(leaf, local_r)
+            posture.update_global_ts()
+
+        def _subtree_update():
+            posture.set_local_r(leaf, local_r)
+            posture.get_global_t(leaf)
+
+        def _per_joint_update():
+            for index in leaf_parents:
+                posture.set_local_r(index, local_r)
+                posture.get_global_t(leaf)
+
+        def _partial_update():
+            posture.set_local_rs_partial(leaf_parents, [local_r] * len(leaf_parents))
+            posture.get_global_t(leaf)
+
+        print('joints : %d, iterations : %d' % (skeleton.get_len_nodes(), number))
+        print('leaf joint, full update   : %.4fs' % timeit.timeit(_full_update, number=number))
+        print('leaf joint, subtree update: %.4fs' % timeit.timeit(_subtree_update, number=number))
+        print('4 joints, set_local_r     : %.4fs' % timeit.timeit(_per_joint_update, number=number))
+        print('4 joints, partial update  : %.4fs' % timeit.timeit(_partial_update, number=number))
+
+    profile_set_local_r()
@@ -0,0 +1,124 @@
+"""
+linear blend skinning on cpu
+
+skin data are fixed-width (V, K) arrays of joint indices and weights. vertices of a frame or a batch of frames are
+deformed by one gather of skinning matrices and one einsum, so skinned meshes of whole clips can be baked
+without a gpu
+"""
+import numpy as np
+
+import motion.motion as motion
+
+DEFAULT_MAX_INFLUENCES = 4
+# budget of gathered (frames, V, K, 3, 4) skinning matrices of one chunk of deform
+DEFAULT_CHUNK_BYTES = 1 << 26
+
+
+def get_skin_arrays(vertex_bone_weights, max_influences=DEFAULT_MAX_INFLUENCES):
+    """
+    :param vertex_bone_weights: list of lists of (joint index, weight) of each vertex
+    :param max_influences: K. only K largest weights of a vertex are kept
+    :return: joint_indices, joint_weights
+    joint_indices : (V, K) int array. unused slots are 0
+    joint_weights : (V, K) array sorted in descending order in each row. unused slots are 0. rows sum to 1,
+    or 0 for vertices without weights
+    """
+    vertex_num = len(vertex_bone_weights)
+    counts = np.array([len(bone_weights) for bone_weights in vertex_bone_weights], int)
+    pairs = np.array([pair for bone_weights in vertex_bone_weights for pair in bone_weights], float).reshape(-1, 2)
+    if np.any(pairs[:, 0] < 0):
+        raise ValueError("joint indices of vertex bone weights must not be negative")
+    vertices = np.repeat(np.arange(vertex_num), counts)
+
+    # rank of each pair in its vertex by descending weight
+    order = np.lexsort((-pairs[:, 1], vertices))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ranks = np.arange(len(order)) - np.repeat(starts, counts)
+    kept = ranks < max_influences
+    order, ranks = order[kept], ranks[kept]
+
+    joint_indices = np.zeros((vertex_num, max_influences), int)
+    joint_weights = np.zeros((vertex_num, max_influences))
+    joint_indices[vertices[order], ranks] = pairs[order, 0].astype(int)
+    joint_weights[vertices[order], ranks] = pairs[order, 1]
+
+    sums = joint_weights.sum(1, keepdims=True)
+    np.divide(joint_weights, sums, out=joint_weights, where=sums > 0.)
+    return joint_indices, joint_weights
+
+
+class LinearBlendSkin:
+    def __init__(self, rest_positions, joint_indices, joint_weights, bind_global_ts):
+        """
+        :param rest_positions: (V, 3) vertex positions at the binding pose
+        :param joint_indices: (V, K) int array from get_skin_arrays
+        :param joint_weights: (V, K) array from get_skin_arrays. vertices whose weights are all 0 keep rest positions
+        :param bind_global_ts: (J, 4, 4) global transformations of joints at the binding pose
+        """
+        self.rest_positions = np.asarray(rest_positions, float).reshape(-1, 3)
+        self.joint_indices = np.asarray(joint_indices, int)
+        self.joint_weights = np.asarray(joint_weights, float)
+        self.inv_bind_global_ts = np.linalg.inv(np.asarray(bind_global_ts, float))
+        if self.joint_indices.size > 0 and (self.joint_indices.min() < 0 or
+                                            self.joint_indices.max() >= len(self.inv_bind_global_ts)):
+            raise ValueError("joint indices must be in [0, number of joints)")
+        self._unbound_vertices = np.flatnonzero(self.joint_weights.sum(1) <= 0.)
+
+    @classmethod
+    def from_posture(cls, rest_positions, joint_indices, joint_weights, bind_posture):
+        return cls(rest_positions, joint_indices, joint_weights, bind_posture.get_global_ts())
+
+    def get_vertex_num(self):
+        return len(self.rest_positions)
+
+    def get_skin_ts(self, global_ts):
+        """
+        :param global_ts: (..., J, 4, 4) global transformations of joints
+        :return: (..., J, 4, 4) transformations from the binding pose
+        """
+        return np.matmul(global_ts, self.inv_bind_global_ts)
+
+    def deform(self, global_ts, chunk=None):
+        """
+        :param global_ts: (J, 4, 4) global transformations of a posture or (F, J, 4, 4) of frames
+        :param chunk: number of frames deformed at once. limited by DEFAULT_CHUNK_BYTES if None
+        :return: (V, 3) or (F, V, 3) deformed vertex positions
+        """
+        global_ts = np.asarray(global_ts, float)
+        if global_ts.ndim == 3:
+            return self._deform(global_ts[np.newaxis])[0]
+
+        if chunk is None:
+            chunk = max(1, DEFAULT_CHUNK_BYTES // max(1, self.joint_indices.size * 12 * 8))
+        positions = np.empty((len(global_ts), self.get_vertex_num(), 3))
+        for start in range(0, len(global_ts), chunk):
+            positions[start:start + chunk] = self._deform(global_ts[start:start + chunk])
+        return positions
+
+    def _deform(self, global_ts):
+        skin_ts = self.get_skin_ts(global_ts)[..., :3, :]
+        # (F, V, K, 3, 4) -> (F, V, 3, 4)
+        blended_ts = np.einsum('fvkab,vk->fvab', skin_ts[:, self.joint_indices], self.joint_weights)
+        positions = np.einsum('fvab,vb->fva', blended_ts[..., :3], self.rest_positions) + blended_ts[..., 3]
+        positions[:, self._unbound_vertices] = self.rest_positions[self._unbound_vertices]
+        return positions
+
+    def deform_posture(self, posture):
+        """
+        :param posture: JointPosture
+        :return: (V, 3) deformed vertex positions
+        """
+        return self.deform(posture.get_global_ts())
+
+    def deform_motion(self, joint_motion, chunk=None):
+        """
+        :param joint_motion: JointMotion. global transformations of an ArrayJointMotion are computed at once
+        :param chunk: see deform
+        :return: (F, V, 3) deformed vertex positions of all frames
+        """
+        if isinstance(joint_motion, motion.ArrayJointMotion):
+            global_ts = joint_motion.get_global_ts()
+        else:
+            global_ts = np.array([posture.get_global_ts() for posture in joint_motion]).reshape(
+                -1, len(self.inv_bind_global_ts), 4, 4)
+        return self.deform(global_ts, chunk)
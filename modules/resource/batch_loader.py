@@ -0,0 +1,137 @@
+"""
+parallel reading of many motion files
+
+files are parsed in worker processes. each worker sends back a skeleton header and frame arrays instead of
+a pickled graph of postures, and the motions are rebuilt as ArrayJointMotion in the calling process.
+files already in the default MotionCache of the process are not sent to workers
+"""
+import concurrent.futures
+import glob
+import os
+import traceback
+
+import motion.motion as motion
+import resource.hmc_loader as hmc_loader
+import resource.motion_cache as motion_cache
+
+
+def read_motion_files(paths_or_pattern, max_workers=None, progress=None, use_quaternion=False, use_cache=True,
+                      **read_options):
+    """
+    :param paths_or_pattern: list of file paths, a directory searched recursively or a glob pattern
+    :param max_workers: number of worker processes. os.cpu_count() if None. files are read in this process if 1
+    :param progress: callable(done_num, total_num, path) called whenever a file is done
+    :param use_quaternion: see ArrayJointMotion. quaternions also reduce data sent from workers
+    :param use_cache: if True, files in the default MotionCache of this process are not read again,
+    and files read by workers are added to it
+    :param read_options: keyword arguments of the readers such as scale
+    :return: motions, errors
+    motions : dict of path -> ArrayJointMotion in order of paths
+    errors : dict of path -> formatted exception of files which could not be read
+    """
+    paths = find_motion_files(paths_or_pattern)
+    cache = motion_cache.get_default_cache() if use_cache else None
+    motions = {}
+    errors = {}
+
+    def _on_done(_path, _joint_motion, _error):
+        if _error is None:
+            motions[_path] = _joint_motion
+        else:
+            errors[_path] = _error
+        if progress is not None:
+            progress(len(motions) + len(errors), len(paths), _path)
+
+    def _on_read(_path, _result, _error):
+        _joint_motion = None
+        if _error is None:
+            _joint_motion = arrays_to_motion(_result)
+            if cache is not None:
+                _joint_motion = cache.put(_path, _joint_motion, use_quaternion, **read_options)
+        _on_done(_path, _joint_motion, _error)
+
+    todo = []
+    for path in paths:
+        joint_motion = None
+        if cache is not None:
+            try:
+                joint_motion = cache.get(path, use_quaternion, **read_options)
+            except OSError:
+                # the error is reported by reading the file
+                pass
+        if joint_motion is None:
+            todo.append(path)
+        else:
+            _on_done(path, joint_motion, None)
+
+    if max_workers == 1:
+        for path in todo:
+            _on_read(path, *_read_motion_arrays(path, use_quaternion, read_options))
+    elif len(todo) > 0:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            futures = {executor.submit(_read_motion_arrays, path, use_quaternion, read_options): path
+                       for path in todo}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    result, error = future.result()
+                except Exception:
+                    # the worker process died or the result could not be sent back
+                    result, error = None, traceback.format_exc()
+                _on_read(futures[future], result, error)
+
+    return {path: motions[path] for path in paths if path in motions}, errors
+
+
+def find_motion_files(paths_or_pattern):
+    """
+    :param paths_or_pattern: list of file paths, a directory searched recursively or a glob pattern
+    :return: sorted list of paths of files of hmc_loader.SOURCE_FORMAT_NAMES by their extensions
+    """
+    if not isinstance(paths_or_pattern, str):
+        return list(paths_or_pattern)
+    if os.path.isdir(paths_or_pattern):
+        paths = [os.path.join(directory, file_name)
+                 for directory, _, file_names in os.walk(paths_or_pattern) for file_name in file_names]
+    else:
+        paths = glob.glob(paths_or_pattern, recursive=True)
+    return sorted(path for path in paths if hmc_loader.get_source_format(path, False) is not None)
+
+
+def _read_motion_arrays(path, use_quaternion, read_options):
+    """
+    run in worker processes
+    :return: (skeleton header, fps, motion name, root positions, local rotations), None
+    or None, formatted exception
+    """
+    try:
+        return motion_to_arrays(hmc_loader.read_source_file(path, use_quaternion, **read_options)), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def motion_to_arrays(joint_motion, use_quaternion=False):
+    """
+    :param joint_motion: JointMotion
+    :param use_quaternion: see ArrayJointMotion. ignored if joint_motion is an ArrayJointMotion
+    :return: (skeleton header, fps, motion name, root positions, local rotations) which are cheap to pickle
+    """
+    if not isinstance(joint_motion, motion.ArrayJointMotion):
+        joint_motion = motion.ArrayJointMotion.from_joint_motion(joint_motion, use_quaternion)
+    # arrays are only read, so shared arrays such as those of cache hits are not copied
+    use_quaternion = joint_motion.is_quaternion_used()
+    local_rs = joint_motion.get_local_qs(False) if use_quaternion else joint_motion.get_local_rs(False)
+    return (hmc_loader.skeleton_to_header(joint_motion.get_skeleton()), joint_motion.fps,
+            joint_motion.motion_name, joint_motion.get_root_positions(False), local_rs)
+
+
+def arrays_to_motion(arrays):
+    """
+    :param arrays: result of motion_to_arrays
+    :return: ArrayJointMotion
+    """
+    skeleton_header, fps, motion_name, root_positions, local_rs = arrays
+    joint_motion = motion.ArrayJointMotion(hmc_loader.header_to_skeleton(skeleton_header), root_positions, local_rs,
+                                           local_rs.ndim == 3)
+    joint_motion.fps = fps
+    joint_motion.motion_name = motion_name
+    return joint_motion
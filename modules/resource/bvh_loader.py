@@ -1,26 +1,65 @@
+import itertools
+import re
+
 import numpy
 
 import hmath.mm_math as mm
+import hmath.mm_quaternion as mq
 import motion.motion as motion
 
 
-def read_bvh_file(bvh_file_path, scale=1.0, apply_root_offset=False):
+def read_bvh_file(bvh_file_path, scale=1.0, apply_root_offset=False, lazy=False):
     bvh = Bvh()
     bvh.parse_bvh_file(bvh_file_path)
-    joint_motion = bvh.to_joint_motion(scale, apply_root_offset)
+    joint_motion = bvh.to_joint_motion(scale, apply_root_offset, lazy)
     return joint_motion
 
 
+def read_bvh_file_as_array_motion(bvh_file_path, scale=1.0, apply_root_offset=False, use_quaternion=False):
+    """
+    read a bvh file into ArrayJointMotion without making posture objects
+    :return: ArrayJointMotion whose global transformations are computed lazily
+    """
+    bvh = Bvh()
+    bvh.parse_bvh_file(bvh_file_path)
+    return bvh.to_array_joint_motion(scale, apply_root_offset, use_quaternion)
+
+
 def read_bvh_file_as_bvh(bvh_file_path):
     bvh = Bvh()
     bvh.parse_bvh_file(bvh_file_path)
     return bvh
 
 
-def write_bvh_file(bvh_file_path, joint_motion):
+def iter_bvh_frames(bvh_file_path, chunk=4096, as_motion=False, scale=1.0, apply_root_offset=False):
+    """
+    read a bvh file chunk by chunk. the hierarchy is parsed once and at most chunk frames are in memory at a time
+    :param bvh_file_path:
+    :param chunk: max number of frames of each yielded block
+    :param as_motion: if False, yield (frames, total_channel_count) arrays of channel values.
+    if True, yield ArrayJointMotion of the frames with global transformations computed. they share a skeleton
+    :param scale: used if as_motion is True
+    :param apply_root_offset: used if as_motion is True
+    :return: generator of frame blocks
+    """
+    bvh = Bvh()
+    with open(bvh_file_path) as file:
+        if bvh.parse_bvh_header(file) is None:
+            return
+        skeleton = bvh.to_joint_skeleton(scale, apply_root_offset) if as_motion else None
+        for channel_values in bvh.iter_bvh_motion(file, chunk):
+            if not as_motion:
+                yield channel_values
+                continue
+            joint_motion = bvh.channel_values_to_array_joint_motion(skeleton, channel_values, scale)
+            joint_motion.update_global_ts()
+            yield joint_motion
+
+
+def write_bvh_file(bvh_file_path, joint_motion, precision=6):
     bvh = Bvh()
     bvh.from_joint_motion(joint_motion)
-    bvh.write_bvh_file(bvh_file_path)
+    bvh.write_bvh_file(bvh_file_path, precision)
 
 
 class Bvh:
@@ -36,6 +75,9 @@ class Bvh:
     """
     CHANNEL_6DOF = ['XPOSITION', 'YPOSITION', 'ZPOSITION', 'ZROTATION', 'XROTATION', 'YROTATION']
     CHANNEL_3DOF = ['ZROTATION', 'XROTATION', 'YROTATION']
+    POSITION_AXES = {'XPOSITION': 0, 'YPOSITION': 1, 'ZPOSITION': 2}
+    ROTATION_AXES = {'XROTATION': 0, 'YROTATION': 1, 'ZROTATION': 2}
+    MOTION_PATTERN = re.compile(r'^\s*MOTION\b', re.MULTILINE | re.IGNORECASE)
 
     class Joint:
         def __init__(self, name):
@@ -97,12 +139,17 @@ class Bvh:
         else:
             file = filepath_or_fileobject
 
-        tokens = file.read().split()
+        text = file.read()
+
+        # only the small hierarchy section is tokenized. the motion section is parsed in bulk
+        motion_match = Bvh.MOTION_PATTERN.search(text)
+        motion_start = len(text) if motion_match is None else motion_match.start()
+        tokens = text[:motion_start].split()
         tokens.reverse()
 
         self.total_channel_count = 0
         self.parse_bvh_hierarchy(tokens)
-        self.parse_bvh_motion(tokens)
+        self.parse_bvh_motion(text[motion_start:])
 
         if isinstance(filepath_or_fileobject, str):
             file.close()
@@ -152,7 +199,34 @@ class Bvh:
                 return None
         return bvh_joint
 
-    def parse_bvh_motion(self, tokens):
+    def parse_bvh_motion(self, text):
+        """
+        parse the motion section into self.motion_list, a (frame_num, total_channel_count) array
+        :param text: text of the motion section starting from 'MOTION'
+        :return:
+        """
+        # MOTION / Frames: / frame_num / Frame / Time: / frame_time / channel values
+        tokens = text.split(None, 6)
+        tokens.reverse()
+        if self.parse_bvh_motion_header(tokens) is None:
+            return None
+
+        channel_values = numpy.fromstring(tokens.pop(), sep=' ') if len(tokens) > 0 else numpy.zeros(0)
+        if len(channel_values) < self.frame_num * self.total_channel_count:
+            print("channel values of %d frames missing" % self.frame_num)
+            return None
+        self.motion_list = channel_values[:self.frame_num * self.total_channel_count].reshape(
+            self.frame_num, self.total_channel_count)
+
+    def parse_bvh_motion_header(self, tokens):
+        """
+        parse MOTION, frame_num and frame_time
+        :param tokens: reversed tokens starting from 'MOTION'
+        :return: True, or None if the header is invalid
+        """
+        if len(tokens) < 6:
+            print("MOTION header missing")
+            return None
         if tokens.pop().upper() != 'MOTION':
             print("MOTION missing")
             return None
@@ -165,26 +239,81 @@ class Bvh:
                 print("FRAME TIME: missing")
                 return None
         self.frame_time = float(tokens.pop())
+        return True
 
-        self.motion_list = [None] * self.frame_num
-        for i in range(self.frame_num):
-            self.motion_list[i] = [None] * self.total_channel_count
+    # ===========================================================================
+    # streaming read functions
+    # ===========================================================================
+    def parse_bvh_header(self, file):
+        """
+        parse the hierarchy and the motion header, reading file line by line up to the 'Frame Time:' line
+        :param file: file object opened in text mode
+        :return: True, or None if the header is invalid
+        """
+        lines = []
+        motion_line = None
+        for line in file:
+            if Bvh.MOTION_PATTERN.match(line):
+                motion_line = line
+                break
+            lines.append(line)
+        tokens = ''.join(lines).split()
+        tokens.reverse()
+        self.total_channel_count = 0
+        self.parse_bvh_hierarchy(tokens)
+        if motion_line is None:
+            print("MOTION missing")
+            return None
 
-        for i in range(self.frame_num):
-            for j in range(self.total_channel_count):
-                self.motion_list[i][j] = float(tokens.pop())
+        # MOTION, Frames: frame_num, Frame Time: frame_time
+        lines = [motion_line]
+        for line in file:
+            lines.append(line)
+            if len(''.join(lines).split()) >= 6:
+                break
+        tokens = ''.join(lines).split()
+        tokens.reverse()
+        return self.parse_bvh_motion_header(tokens)
+
+    def iter_bvh_motion(self, file, chunk=4096):
+        """
+        parse channel values following the motion header chunk by chunk
+        :param file: file object positioned after the motion header by parse_bvh_header
+        :param chunk: max number of frames of each yielded block
+        :return: generator of (frames, total_channel_count) arrays
+        """
+        channel_count = self.total_channel_count
+        remaining_frame_num = self.frame_num
+        rest_values = numpy.zeros(0)
+        while remaining_frame_num > 0:
+            # a frame is usually a line, but values of a frame may be split over lines
+            lines = list(itertools.islice(file, chunk))
+            if len(lines) == 0:
+                print("channel values of %d frames missing" % remaining_frame_num)
+                return
+            values = numpy.concatenate((rest_values, numpy.fromstring(''.join(lines), sep=' ')))
+            frame_num = min(len(values) // channel_count, remaining_frame_num)
+            rest_values = values[frame_num * channel_count:]
+            remaining_frame_num -= frame_num
+            if frame_num > 0:
+                yield values[:frame_num * channel_count].reshape(frame_num, channel_count)
 
     # ===========================================================================
     # write functions
     # ===========================================================================
-    def write_bvh_file(self, filepath_or_fileobject):
+    def write_bvh_file(self, filepath_or_fileobject, precision=6):
+        """
+        :param filepath_or_fileobject:
+        :param precision: number of digits after the decimal point of channel values
+        :return:
+        """
         if isinstance(filepath_or_fileobject, str):
             file = open(filepath_or_fileobject, 'w')
         else:
             file = filepath_or_fileobject
 
         self.write_bvh_hierarchy(file)
-        self.write_bvh_motion(file)
+        self.write_bvh_motion(file, precision)
 
         if isinstance(filepath_or_fileobject, str):
             file.close()
@@ -230,32 +359,76 @@ class Bvh:
         # end JOINT
         file.write('%s}\n' % indent_joint)
 
-    def write_bvh_motion(self, file):
+    def write_bvh_motion(self, file, precision=6):
         file.write('MOTION\n')
         file.write('Frames: %d\n' % self.frame_num)
         file.write('Frame Time: %f\n' % self.frame_time)
 
-        for i in range(self.frame_num):
-            for j in range(self.total_channel_count):
-                file.write('%s ' % self.motion_list[i][j])
-            file.write('\n')
+        if self.frame_num > 0:
+            channel_values = numpy.asarray(self.motion_list, float).reshape(self.frame_num, self.total_channel_count)
+            numpy.savetxt(file, channel_values, '%%.%df' % precision)
 
     # ===========================================================================
     # Bvh -> JointMotion
     # ===========================================================================
-    def to_joint_motion(self, scale=1.0, apply_root_offset=False):
+    def to_joint_motion(self, scale=1.0, apply_root_offset=False, lazy=False):
+        """
+        :param scale:
+        :param apply_root_offset:
+        :param lazy: if True, global transformations are not computed here but when each posture is queried,
+        or at once by JointMotion.update_global_ts
+        :return: JointMotion
+        """
         skeleton = self.to_joint_skeleton(scale, apply_root_offset)
 
+        frame_num = len(self.motion_list)
+        channel_values = numpy.asarray(self.motion_list, float).reshape(frame_num, self.total_channel_count)
+        root_positions, local_rs = self._channel_values_to_local_rs(skeleton, channel_values, scale)
+        global_ts = [None] * frame_num if lazy else motion.forward_kinematics(skeleton, root_positions, local_rs)
+
         joint_motion = motion.JointMotion()
-        for i in range(len(self.motion_list)):
-            joint_posture = motion.JointPosture(skeleton)
-            self._set_local_r_from_bvh_joint(joint_posture, self.joints[0], self.motion_list[i], scale)
-            joint_posture.update_global_ts()
-            joint_motion.append(joint_posture)
+        for i in range(frame_num):
+            joint_motion.append(motion.JointPosture(skeleton, root_positions[i], list(local_rs[i]), global_ts[i]))
+
+        joint_motion.fps = 1. / self.frame_time
+        return joint_motion
 
+    def to_array_joint_motion(self, scale=1.0, apply_root_offset=False, use_quaternion=False):
+        """
+        :param scale:
+        :param apply_root_offset:
+        :param use_quaternion: see ArrayJointMotion
+        :return: ArrayJointMotion whose global transformations are computed lazily
+        """
+        skeleton = self.to_joint_skeleton(scale, apply_root_offset)
+        frame_num = len(self.motion_list)
+        channel_values = numpy.asarray(self.motion_list, float).reshape(frame_num, self.total_channel_count)
+        return self.channel_values_to_array_joint_motion(skeleton, channel_values, scale, use_quaternion)
+
+    def channel_values_to_array_joint_motion(self, skeleton, channel_values, scale=1.0, use_quaternion=False):
+        """
+        :param skeleton: skeleton built by to_joint_skeleton
+        :param channel_values: (F, total_channel_count) array
+        :param scale:
+        :param use_quaternion: see ArrayJointMotion
+        :return: ArrayJointMotion whose global transformations are computed lazily
+        """
+        root_positions, local_rs = self._channel_values_to_local_rs(skeleton, channel_values, scale, mm.i_so3())
+        joint_motion = motion.ArrayJointMotion(skeleton, root_positions, local_rs, use_quaternion, False)
         joint_motion.fps = 1. / self.frame_time
         return joint_motion
 
+    def _channel_values_to_local_rs(self, skeleton, channel_values, scale, identity=mm.i_se3()):
+        """
+        :param identity: mm.i_se3() for SE3 or mm.i_so3() for SO3 local rotations
+        :return: (F, 3) root positions, (F, J, 4, 4) or (F, J, 3, 3) local rotations
+        """
+        frame_num = len(channel_values)
+        root_positions = numpy.zeros((frame_num, 3))
+        local_rs = numpy.tile(identity, (frame_num, skeleton.get_len_nodes(), 1, 1))
+        self._set_local_rs_from_bvh_joint(root_positions, local_rs, skeleton, self.joints[0], channel_values, scale)
+        return root_positions, local_rs
+
     def to_joint_skeleton(self, scale=1.0, apply_root_offset=False):
         skeleton = motion.Skeleton()
         self._add_joint_from_bvh_joint(skeleton, self.joints[0].name, self.joints[0], None, scale, apply_root_offset)
@@ -275,30 +448,31 @@ class Bvh:
             self._add_joint_from_bvh_joint(skeleton, bvh_joint.children[i].name, bvh_joint.children[i], joint, scale,
                                            True)
 
-    def _set_local_r_from_bvh_joint(self, joint_posture, bvh_joint, channel_values, scale=1.0):
-        local_r = mm.i_se3()
+    def _set_local_rs_from_bvh_joint(self, root_positions, local_rs, skeleton, bvh_joint, channel_values, scale=1.0):
+        """
+        set root positions and local rotations of bvh_joint and its descendants for all frames at once
+        :param root_positions: (F, 3) output
+        :param local_rs: (F, J, 4, 4) or (F, J, 3, 3) output
+        :param skeleton:
+        :param bvh_joint:
+        :param channel_values: (F, C) channel values of all frames
+        :param scale:
+        :return:
+        """
+        local_r = None
         for channel in bvh_joint.channels:
-            if channel.channel_type == 'XPOSITION':
-                joint_posture.get_root_position()[0] = channel_values[channel.channel_index] * scale
-            elif channel.channel_type == 'YPOSITION':
-                joint_posture.get_root_position()[1] = channel_values[channel.channel_index] * scale
-            elif channel.channel_type == 'ZPOSITION':
-                joint_posture.get_root_position()[2] = channel_values[channel.channel_index] * scale
-            elif channel.channel_type == 'XROTATION':
-                local_r = numpy.dot(local_r, mm.so3_to_se3(mm.rot_x(mm.RAD * channel_values[channel.channel_index]),
-                                                           mm.o_vec3()))
-            elif channel.channel_type == 'YROTATION':
-                local_r = numpy.dot(local_r, mm.so3_to_se3(mm.rot_y(mm.RAD * channel_values[channel.channel_index]),
-                                                           mm.o_vec3()))
-            elif channel.channel_type == 'ZROTATION':
-                local_r = numpy.dot(local_r, mm.so3_to_se3(mm.rot_z(mm.RAD * channel_values[channel.channel_index]),
-                                                           mm.o_vec3()))
-
-        joint_posture.set_local_r_without_update(joint_posture.get_skeleton().get_index_by_label(bvh_joint.name), local_r)
+            values = channel_values[:, channel.channel_index]
+            if channel.channel_type in Bvh.POSITION_AXES:
+                root_positions[:, Bvh.POSITION_AXES[channel.channel_type]] = values * scale
+            elif channel.channel_type in Bvh.ROTATION_AXES:
+                r = mm.rot_batch(Bvh.ROTATION_AXES[channel.channel_type], mm.RAD * values)
+                local_r = r if local_r is None else numpy.matmul(local_r, r)
 
-        for child in bvh_joint.children:
-            self._set_local_r_from_bvh_joint(joint_posture, child, channel_values)
+        if local_r is not None:
+            local_rs[:, skeleton.get_index_by_label(bvh_joint.name), :3, :3] = local_r
 
+        for child in bvh_joint.children:
+            self._set_local_rs_from_bvh_joint(root_positions, local_rs, skeleton, child, channel_values, scale)
 
     # ===========================================================================
     # JointMotion -> Bvh
@@ -308,9 +482,18 @@ class Bvh:
         self._from_joint_skeleton(skeleton)
 
         self.frame_num = len(joint_motion)
-        self.motion_list = [[None] * self.total_channel_count for _ in range(self.frame_num)]
-        for i in range(self.frame_num):
-            self._joint_value_to_channel_value(joint_motion[i], self.motion_list[i], skeleton, self.joints[0])
+        if isinstance(joint_motion, motion.ArrayJointMotion):
+            root_positions = joint_motion.get_root_positions(False)
+            local_rs = joint_motion.get_local_rs(False)
+        else:
+            root_positions = numpy.array([posture.get_root_position() for posture in joint_motion], float)
+            local_rs = numpy.array([posture.get_local_rs() for posture in joint_motion], float)
+        root_positions = root_positions.reshape(self.frame_num, 3)
+        local_rs = local_rs.reshape(self.frame_num, skeleton.get_len_nodes(), local_rs.shape[-2], local_rs.shape[-1])
+
+        self.motion_list = numpy.zeros((self.frame_num, self.total_channel_count))
+        for bvh_joint in self.joints:
+            self._set_channel_values_from_joint(self.motion_list, root_positions, local_rs, skeleton, bvh_joint)
 
         self.frame_time = 1. / joint_motion.fps
 
@@ -329,12 +512,12 @@ class Bvh:
         bvh_joint = Bvh.Joint(joint.label)
         bvh_joint_dict[joint.label] = bvh_joint
 
-        bvh_joint.offset = joint.get_translation
+        bvh_joint.offset = joint.get_translation()
 
         # channels
-        if joint.get_parent is None:
+        if joint.get_parent() is None:
             channel_types = Bvh.CHANNEL_6DOF
-        elif len(joint.children) == 0:
+        elif len(joint.get_children()) == 0:
             channel_types = []
         else:
             channel_types = Bvh.CHANNEL_3DOF
@@ -347,25 +530,80 @@ class Bvh:
 
         return bvh_joint
 
-    # joint_posture : input
-    # channel_values : output
-    def _joint_value_to_channel_value(self, joint_posture, channel_values, joint_skeleton, bvh_joint):
-        z_angle, x_angle, y_angle = mm.r_to_zxy(joint_posture.get_local_r(joint_skeleton.get_index_by_label(bvh_joint.
-                                                                                                            name)))
+    def _set_channel_values_from_joint(self, channel_values, root_positions, local_rs, joint_skeleton, bvh_joint):
+        """
+        set channel values of bvh_joint for all frames at once
+        :param channel_values: (F, C) output
+        :param root_positions: (F, 3)
+        :param local_rs: (F, J, 3, 3) or (F, J, 4, 4)
+        :param joint_skeleton:
+        :param bvh_joint:
+        :return:
+        """
+        rotation_channels = [channel for channel in bvh_joint.channels if channel.channel_type in Bvh.ROTATION_AXES]
+        if len(rotation_channels) == 3:
+            order = ''.join(channel.channel_type[0] for channel in rotation_channels)
+            local_r = local_rs[:, joint_skeleton.get_index_by_label(bvh_joint.name), :3, :3]
+            angles = mq.so3_to_euler(local_r, order) * mm.DEG
+            for i, channel in enumerate(rotation_channels):
+                channel_values[:, channel.channel_index] = angles[:, i]
 
         for channel in bvh_joint.channels:
-            if channel.channel_type == 'XPOSITION':
-                channel_values[channel.channel_index] = joint_posture.root_pos[0]
-            elif channel.channel_type == 'YPOSITION':
-                channel_values[channel.channel_index] = joint_posture.root_pos[1]
-            elif channel.channel_type == 'ZPOSITION':
-                channel_values[channel.channel_index] = joint_posture.root_pos[2]
-            elif channel.channel_type == 'XROTATION':
-                channel_values[channel.channel_index] = z_angle * mm.DEG
-            elif channel.channel_type == 'YROTATION':
-                channel_values[channel.channel_index] = x_angle * mm.DEG
-            elif channel.channel_type == 'ZROTATION':
-                channel_values[channel.channel_index] = y_angle * mm.DEG
-
-        for child in bvh_joint.children:
-            self._joint_value_to_channel_value(joint_posture, channel_values, joint_skeleton, child)
+            if channel.channel_type in Bvh.POSITION_AXES:
+                channel_values[:, channel.channel_index] = root_positions[:, Bvh.POSITION_AXES[channel.channel_type]]
+
+
+if __name__ == '__main__':
+    # run in modules directory : python -m resource.bvh_loader
+    import io
+    import timeit
+
+    def _make_bvh_text(frame_num, joint_num):
+        """
+        :return: text of a bvh file of a chain of joint_num joints with random channel values
+        """
+        lines = ['HIERARCHY']
+        for i in range(joint_num):
+            indent = '  ' * i
+            lines.append('%s%s joint_%d' % (indent, 'ROOT' if i == 0 else 'JOINT', i))
+            lines.append('%s{' % indent)
+            lines.append('%s  OFFSET 0.0 1.0 0.0' % indent)
+            if i == 0:
+                lines.append('%s  CHANNELS 6 Xposition Yposition Zposition Zrotation Xrotation Yrotation' % indent)
+            else:
+                lines.append('%s  CHANNELS 3 Zrotation Xrotation Yrotation' % indent)
+        lines.extend('%s}' % ('  ' * i) for i in reversed(range(joint_num)))
+        lines.extend(['MOTION', 'Frames: %d' % frame_num, 'Frame Time: %f' % (1. / 30.)])
+        channel_values = numpy.random.uniform(-180., 180., (frame_num, 3 + 3 * joint_num))
+        lines.extend(' '.join('%f' % value for value in row) for row in channel_values)
+        return '\n'.join(lines) + '\n'
+
+    def _parse_bvh_motion_per_token(bvh, text):
+        # previous implementation, a float() call per channel value
+        tokens = text.split()
+        tokens.reverse()
+        for _ in range(6):
+            tokens.pop()
+        motion_list = [[None] * bvh.total_channel_count for _ in range(bvh.frame_num)]
+        for i in range(bvh.frame_num):
+            for j in range(bvh.total_channel_count):
+                motion_list[i][j] = float(tokens.pop())
+        return motion_list
+
+    def profile_parse_bvh_file():
+        frame_num, joint_num = 20000, 60
+        text = _make_bvh_text(frame_num, joint_num)
+        bvh = Bvh()
+        bvh.parse_bvh_file(io.StringIO(text))
+        motion_text = text[Bvh.MOTION_PATTERN.search(text).start():]
+        number = 3
+
+        print('frames : %d, channels : %d, size : %.1fMB' % (frame_num, bvh.total_channel_count, len(text) / 1e6))
+        print('motion section, per token : %.4fs' % (timeit.timeit(lambda: _parse_bvh_motion_per_token(
+            bvh, motion_text), number=number) / number))
+        print('motion section, bulk      : %.4fs' % (timeit.timeit(lambda: bvh.parse_bvh_motion(motion_text),
+                                                                   number=number) / number))
+        print('whole file, parse_bvh_file: %.4fs' % (timeit.timeit(lambda: Bvh().parse_bvh_file(io.StringIO(text)),
+                                                                   number=number) / number))
+
+    profile_parse_bvh_file()
@@ -0,0 +1,199 @@
+"""
+hmc (hma motion cache) : binary container of a joint motion
+
+layout
+    magic (8 bytes) | header size (uint64, little endian) | header (json, utf-8) | frame arrays
+header
+    version, fps, motion_name, dtype of frame arrays, rotation ('so3' or 'quaternion'),
+    skeleton (labels, parent_indices, translations) and arrays (offset from the start of frame arrays and shape)
+frame arrays
+    root_positions : (F, 3), local_rs : (F, J, 3, 3) or (F, J, 4). each array starts at a multiple of HMC_ALIGN bytes
+
+frame arrays are contiguous, so read_hmc_file maps them by numpy.memmap and only touched frames are paged in
+"""
+import hashlib
+import json
+import os
+import struct
+
+import numpy
+
+import motion.motion as motion
+import resource.motion_loader as motion_loader
+
+HMC_MAGIC = b'HMC\x00\x00\x00\x00\x01'
+HMC_VERSION = 1
+HMC_ALIGN = 64
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hma', 'motion')
+
+# motion_loader formats of joint motion files which are converted to ArrayJointMotion by read_source_file
+SOURCE_FORMAT_NAMES = ('bvh', 'htr')
+
+
+def read_hmc_file(hmc_file_path, mmap=True):
+    """
+    :param hmc_file_path:
+    :param mmap: if True, frame arrays are memory-mapped copy-on-write. modifying the motion does not modify the file
+    :return: ArrayJointMotion
+    """
+    with open(hmc_file_path, 'rb') as file:
+        header, data_offset = _read_hmc_header(file)
+        dtype = numpy.dtype(header['dtype'])
+        arrays = {}
+        for name, layout in header['arrays'].items():
+            shape = tuple(layout['shape'])
+            offset = data_offset + layout['offset']
+            if mmap and numpy.prod(shape) > 0:
+                arrays[name] = numpy.memmap(hmc_file_path, dtype, 'c', offset, shape)
+            else:
+                file.seek(offset)
+                arrays[name] = numpy.fromfile(file, dtype, int(numpy.prod(shape))).reshape(shape)
+
+    skeleton = header_to_skeleton(header['skeleton'])
+    joint_motion = motion.ArrayJointMotion(skeleton, arrays['root_positions'], arrays['local_rs'],
+                                           header['rotation'] == 'quaternion')
+    joint_motion.fps = header['fps']
+    joint_motion.motion_name = header['motion_name']
+    return joint_motion
+
+
+def write_hmc_file(hmc_file_path, joint_motion, dtype=numpy.float32):
+    """
+    :param hmc_file_path:
+    :param joint_motion: JointMotion. local rotations are stored as quaternions if it is an ArrayJointMotion using them
+    :param dtype: numpy.float32 or numpy.float64
+    :return:
+    """
+    if not isinstance(joint_motion, motion.ArrayJointMotion):
+        joint_motion = motion.ArrayJointMotion.from_joint_motion(joint_motion)
+    use_quaternion = joint_motion.is_quaternion_used()
+    dtype = numpy.dtype(dtype).newbyteorder('<')
+    arrays = [('root_positions', joint_motion.get_root_positions(False)),
+              ('local_rs', joint_motion.get_local_qs(False) if use_quaternion else joint_motion.get_local_rs(False))]
+
+    layouts = {}
+    offset = 0
+    for name, array in arrays:
+        layouts[name] = {'offset': offset, 'shape': list(array.shape)}
+        offset = _align(offset + array.size * dtype.itemsize)
+
+    header = {'version': HMC_VERSION,
+              'fps': joint_motion.fps,
+              'motion_name': joint_motion.motion_name,
+              'dtype': dtype.str,
+              'rotation': 'quaternion' if use_quaternion else 'so3',
+              'skeleton': skeleton_to_header(joint_motion.get_skeleton()),
+              'arrays': layouts}
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_offset = _align(len(HMC_MAGIC) + 8 + len(header_bytes))
+    header_bytes += b' ' * (data_offset - len(HMC_MAGIC) - 8 - len(header_bytes))
+
+    with open(hmc_file_path, 'wb') as file:
+        file.write(HMC_MAGIC)
+        file.write(struct.pack('<Q', len(header_bytes)))
+        file.write(header_bytes)
+        for name, array in arrays:
+            file.seek(data_offset + layouts[name]['offset'])
+            numpy.ascontiguousarray(array, dtype).tofile(file)
+        file.truncate(data_offset + offset)
+
+
+def read_motion_file_cached(motion_file_path, cache_dir=None, dtype=numpy.float64, mmap=True, **read_options):
+    """
+    read a motion file through a hmc file cache.
+    the cache file is keyed on the path, modification time and size of the motion file and read_options,
+    so it is rebuilt when the motion file changes
+    :param motion_file_path: bvh or htr file path
+    :param cache_dir: DEFAULT_CACHE_DIR if None
+    :param dtype: dtype of frame arrays of the cache file
+    :param mmap: see read_hmc_file
+    :param read_options: keyword arguments of the reader of the motion file such as scale
+    :return: ArrayJointMotion
+    """
+    if get_source_format(motion_file_path) is None:
+        raise ValueError("no source reader for '%s'." % motion_file_path)
+    if cache_dir is None:
+        cache_dir = DEFAULT_CACHE_DIR
+
+    cache_file_path = get_cache_file_path(motion_file_path, cache_dir, dtype, **read_options)
+    if not os.path.exists(cache_file_path):
+        joint_motion = read_source_file(motion_file_path, **read_options)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # write to a temporary file and rename it, so readers never see a partially written cache file
+        temp_file_path = '%s.%d.tmp' % (cache_file_path, os.getpid())
+        write_hmc_file(temp_file_path, joint_motion, dtype)
+        os.replace(temp_file_path, cache_file_path)
+    return read_hmc_file(cache_file_path, mmap)
+
+
+def get_cache_file_path(motion_file_path, cache_dir, dtype=numpy.float64, **read_options):
+    stat = os.stat(motion_file_path)
+    key = repr((os.path.abspath(motion_file_path), stat.st_mtime_ns, stat.st_size, numpy.dtype(dtype).str,
+                sorted(read_options.items()), HMC_VERSION))
+    return os.path.join(cache_dir, '%s.%s.hmc' % (os.path.basename(motion_file_path),
+                                                  hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]))
+
+
+def get_source_format(motion_file_path, use_magic=True):
+    """
+    :param motion_file_path:
+    :param use_magic: see motion_loader.find_motion_format
+    :return: motion_loader.MotionFormat if it is one of SOURCE_FORMAT_NAMES. otherwise None
+    """
+    motion_format = motion_loader.find_motion_format(motion_file_path, use_magic)
+    if motion_format is None or motion_format.name not in SOURCE_FORMAT_NAMES:
+        return None
+    return motion_format
+
+
+def read_source_file(motion_file_path, use_quaternion=False, **read_options):
+    """
+    :param motion_file_path: file of one of SOURCE_FORMAT_NAMES
+    :param use_quaternion: see ArrayJointMotion
+    :param read_options: keyword arguments of the reader such as scale
+    :return: ArrayJointMotion
+    """
+    motion_format = get_source_format(motion_file_path)
+    if motion_format is None:
+        raise ValueError("no source reader for '%s'." % motion_file_path)
+    # frame arrays are read without posture objects, and global transformations are not computed
+    return motion_format.get_array_reader()(motion_file_path, use_quaternion=use_quaternion, **read_options)
+
+
+def skeleton_to_header(skeleton):
+    nodes = skeleton.get_nodes()
+    return {'labels': [node.label for node in nodes],
+            'parent_indices': [int(parent_index) for parent_index in skeleton.get_parent_indices()],
+            'translations': [[float(value) for value in node.get_translation()] for node in nodes]}
+
+
+def header_to_skeleton(skeleton_header):
+    # parents always precede their children in the node list, because nodes are appended by Tree.add_node
+    nodes = [motion.JointNode(label, numpy.array(translation, float))
+             for label, translation in zip(skeleton_header['labels'], skeleton_header['translations'])]
+    skeleton = motion.Skeleton()
+    for node, parent_index in zip(nodes, skeleton_header['parent_indices']):
+        if parent_index < 0:
+            skeleton.set_root(node)
+        else:
+            skeleton.add_node(node, nodes[parent_index])
+    return skeleton
+
+
+def _read_hmc_header(file):
+    """
+    :return: header, offset of frame arrays
+    """
+    if file.read(len(HMC_MAGIC)) != HMC_MAGIC:
+        raise ValueError("not a hmc file.")
+    header_size, = struct.unpack('<Q', file.read(8))
+    header = json.loads(file.read(header_size).decode('utf-8'))
+    if header['version'] != HMC_VERSION:
+        raise ValueError("hmc version %d is not supported." % header['version'])
+    return header, len(HMC_MAGIC) + 8 + header_size
+
+
+def _align(offset):
+    return (offset + HMC_ALIGN - 1) // HMC_ALIGN * HMC_ALIGN
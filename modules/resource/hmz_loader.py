@@ -0,0 +1,232 @@
+"""
+hmz (hma motion zipped) : compressed archive of a joint motion
+
+layout
+    magic (8 bytes) | header size (uint64, little endian) | header (json, utf-8) | compressed chunks
+header
+    version, fps, motion_name, frame_num, skeleton (see hmc_loader.skeleton_to_header), compression ('zlib' or 'lzma'),
+    chunk_frames, quantization (position_step, rotation_step, rotation_mins) and
+    chunks (offset from the start of compressed chunks, size and dtype of each chunk)
+chunk
+    frames [i * chunk_frames, (i + 1) * chunk_frames) of
+    root positions : (n, 3) fixed-point integers of position_step
+    local rotations : (n, J, 4) quaternions quantized per joint and component to integers of rotation_step from
+                      rotation_mins
+    both are delta-encoded along frames from the first frame of the chunk and stored as one array of the chunk dtype
+
+chunks are decoded independently, so reading a frame range decompresses only the chunks overlapping it
+"""
+import json
+import lzma
+import struct
+import zlib
+
+import numpy
+
+import motion.motion as motion
+import resource.hmc_loader as hmc_loader
+
+HMZ_MAGIC = b'HMZ\x00\x00\x00\x00\x01'
+HMZ_VERSION = 1
+
+DEFAULT_CHUNK_FRAMES = 256
+# radians of rotation and units of position
+DEFAULT_MAX_ROTATION_ERROR = 1e-4
+DEFAULT_MAX_POSITION_ERROR = 1e-3
+
+COMPRESSORS = {'zlib': (lambda data: zlib.compress(data, 9), zlib.decompress),
+               'lzma': (lzma.compress, lzma.decompress)}
+
+
+def read_hmz_file(hmz_file_path, start=0, stop=None):
+    """
+    :param hmz_file_path:
+    :param start: first frame to read
+    :param stop: frame after the last frame to read. the number of frames if None
+    :return: ArrayJointMotion using quaternions
+    """
+    with HmzReader(hmz_file_path) as reader:
+        return reader.read_motion(start, stop)
+
+
+def write_hmz_file(hmz_file_path, joint_motion, max_rotation_error=DEFAULT_MAX_ROTATION_ERROR,
+                   max_position_error=DEFAULT_MAX_POSITION_ERROR, chunk_frames=DEFAULT_CHUNK_FRAMES,
+                   compression='zlib', verify=True):
+    """
+    :param hmz_file_path:
+    :param joint_motion: JointMotion
+    :param max_rotation_error: bound of the rotation angle between a local rotation and its decoded one in radians
+    :param max_position_error: bound of the distance of each coordinate of root positions and their decoded ones
+    :param chunk_frames: number of frames of each compressed chunk. smaller chunks make random access faster
+    :param compression: 'zlib' or 'lzma'
+    :param verify: if True, decoded values are compared with the motion and ValueError is raised if errors exceed bounds
+    :return: max rotation error, max position error of decoded values. None, None if verify is False
+    """
+    if compression not in COMPRESSORS:
+        raise ValueError("compression must be one of %s." % sorted(COMPRESSORS))
+    if not isinstance(joint_motion, motion.ArrayJointMotion):
+        joint_motion = motion.ArrayJointMotion.from_joint_motion(joint_motion, True)
+    root_positions = numpy.asarray(joint_motion.get_root_positions(False), float)
+    local_qs = _make_continuous(numpy.asarray(joint_motion.get_local_qs(False), float))
+    frame_num, joint_num = local_qs.shape[:2]
+
+    # rounding errors are at most half of steps. the error of a quaternion normalized after decoding is at most
+    # twice its error, and a rotation angle is about twice the distance of quaternions
+    position_step = max_position_error
+    rotation_step = max_rotation_error / 4.
+    rotation_mins = local_qs.min(0) if frame_num > 0 else numpy.zeros((joint_num, 4))
+    position_ints = numpy.round(root_positions / position_step).astype(numpy.int64)
+    rotation_ints = numpy.round((local_qs - rotation_mins) / rotation_step).astype(numpy.int64)
+
+    rotation_error = position_error = None
+    if verify:
+        rotation_error, position_error = _get_errors(root_positions, local_qs, position_ints * position_step,
+                                                     _decode_rotations(rotation_ints, rotation_mins, rotation_step))
+        if rotation_error > max_rotation_error or position_error > max_position_error:
+            raise ValueError("quantization errors %g rad, %g exceed bounds %g rad, %g."
+                             % (rotation_error, position_error, max_rotation_error, max_position_error))
+
+    compress = COMPRESSORS[compression][0]
+    chunks = []
+    layouts = []
+    offset = 0
+    for start in range(0, frame_num, chunk_frames):
+        ints = numpy.concatenate((position_ints[start:start + chunk_frames],
+                                  rotation_ints[start:start + chunk_frames].reshape(-1, joint_num * 4)), 1)
+        ints[1:] = numpy.diff(ints, axis=0)
+        dtype = _get_int_dtype(ints)
+        chunk = compress(ints.astype(dtype).tobytes())
+        chunks.append(chunk)
+        layouts.append({'offset': offset, 'size': len(chunk), 'dtype': dtype.str})
+        offset += len(chunk)
+
+    header = {'version': HMZ_VERSION,
+              'fps': joint_motion.fps,
+              'motion_name': joint_motion.motion_name,
+              'frame_num': frame_num,
+              'skeleton': hmc_loader.skeleton_to_header(joint_motion.get_skeleton()),
+              'compression': compression,
+              'chunk_frames': chunk_frames,
+              'position_step': position_step,
+              'rotation_step': rotation_step,
+              'rotation_mins': rotation_mins.tolist(),
+              'chunks': layouts}
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    with open(hmz_file_path, 'wb') as file:
+        file.write(HMZ_MAGIC)
+        file.write(struct.pack('<Q', len(header_bytes)))
+        file.write(header_bytes)
+        for chunk in chunks:
+            file.write(chunk)
+    return rotation_error, position_error
+
+
+class HmzReader:
+    """
+    reads frame ranges of a hmz file decompressing only chunks overlapping them
+    """
+    def __init__(self, hmz_file_path):
+        self._file = open(hmz_file_path, 'rb')
+        if self._file.read(len(HMZ_MAGIC)) != HMZ_MAGIC:
+            self._file.close()
+            raise ValueError("not a hmz file.")
+        header_size, = struct.unpack('<Q', self._file.read(8))
+        self.header = json.loads(self._file.read(header_size).decode('utf-8'))
+        if self.header['version'] != HMZ_VERSION:
+            self._file.close()
+            raise ValueError("hmz version %d is not supported." % self.header['version'])
+        self._data_offset = len(HMZ_MAGIC) + 8 + header_size
+        self._skeleton = hmc_loader.header_to_skeleton(self.header['skeleton'])
+        self._rotation_mins = numpy.array(self.header['rotation_mins'], float).reshape(-1, 4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self):
+        return self.header['frame_num']
+
+    def get_skeleton(self):
+        return self._skeleton
+
+    def read_frames(self, start=0, stop=None):
+        """
+        :param start: first frame
+        :param stop: frame after the last frame. the number of frames if None
+        :return: (n, 3) root positions, (n, J, 4) local rotations as unit quaternions
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        stop = max(start, stop)
+        joint_num = len(self._rotation_mins)
+        chunk_frames = self.header['chunk_frames']
+        decompress = COMPRESSORS[self.header['compression']][1]
+
+        chunk_ints = []
+        first_chunk = start // chunk_frames
+        for layout in self.header['chunks'][first_chunk:(stop + chunk_frames - 1) // chunk_frames]:
+            self._file.seek(self._data_offset + layout['offset'])
+            data = decompress(self._file.read(layout['size']))
+            ints = numpy.frombuffer(data, layout['dtype']).reshape(-1, 3 + joint_num * 4)
+            chunk_ints.append(numpy.cumsum(ints, 0, dtype=numpy.int64))
+        ints = numpy.concatenate(chunk_ints) if chunk_ints else numpy.zeros((0, 3 + joint_num * 4), numpy.int64)
+        ints = ints[start - first_chunk * chunk_frames:stop - first_chunk * chunk_frames]
+
+        root_positions = ints[:, :3] * self.header['position_step']
+        local_qs = _decode_rotations(ints[:, 3:].reshape(-1, joint_num, 4), self._rotation_mins,
+                                     self.header['rotation_step'])
+        return root_positions, local_qs
+
+    def read_motion(self, start=0, stop=None):
+        """
+        :return: ArrayJointMotion using quaternions of frames [start, stop)
+        """
+        root_positions, local_qs = self.read_frames(start, stop)
+        joint_motion = motion.ArrayJointMotion(self._skeleton, root_positions, local_qs, True)
+        joint_motion.fps = self.header['fps']
+        joint_motion.motion_name = self.header['motion_name']
+        return joint_motion
+
+
+def _make_continuous(qs):
+    """
+    flip signs of quaternions so that each one is in the hemisphere of that of the previous frame,
+    which keeps deltas of frames small
+    """
+    if len(qs) < 2:
+        return qs
+    flips = numpy.sum(qs[1:] * qs[:-1], -1) < 0.
+    signs = numpy.concatenate((numpy.ones((1,) + qs.shape[1:-1]), numpy.cumprod(numpy.where(flips, -1., 1.), 0)))
+    return qs * signs[..., numpy.newaxis]
+
+
+def _decode_rotations(rotation_ints, rotation_mins, rotation_step):
+    qs = rotation_ints * rotation_step + rotation_mins
+    lengths = numpy.sqrt(numpy.sum(qs * qs, -1))[..., numpy.newaxis]
+    return qs / numpy.where(lengths > 0., lengths, 1.)
+
+
+def _get_errors(root_positions, local_qs, decoded_root_positions, decoded_local_qs):
+    """
+    :return: max rotation angle between rotations, max distance of coordinates of positions
+    """
+    if len(local_qs) == 0:
+        return 0., 0.
+    # the rotation angle is 4 arcsin(d / 2) for the distance d of unit quaternions in the same hemisphere
+    distances = numpy.sqrt(numpy.sum((local_qs - decoded_local_qs) ** 2, -1))
+    rotation_error = 4. * numpy.arcsin(numpy.minimum(distances.max() / 2., 1.))
+    position_error = numpy.abs(root_positions - decoded_root_positions).max()
+    return float(rotation_error), float(position_error)
+
+
+def _get_int_dtype(ints):
+    bound = numpy.abs(ints).max() if ints.size > 0 else 0
+    for dtype in (numpy.int8, numpy.int16, numpy.int32):
+        if bound <= numpy.iinfo(dtype).max:
+            return numpy.dtype(dtype).newbyteorder('<')
+    return numpy.dtype(numpy.int64).newbyteorder('<')
@@ -1,16 +1,34 @@
+import re
+
 import numpy as np
 
 import hmath.mm_math as mm
 import motion.motion as motion
 
 
-def read_htr_file(htr_file_path, scale=1.0):
+def read_htr_file(htr_file_path, scale=1.0, lazy=False, end_effectors=()):
+    """
+    :param end_effectors: (joint name, translation) pairs. see Htr.add_end_effector
+    """
     htr = Htr()
     htr.parse_htr_file(htr_file_path)
-    joint_motion = htr.to_joint_motion(scale)
+    htr.add_end_effectors(end_effectors)
+    joint_motion = htr.to_joint_motion(scale, lazy)
     return joint_motion
 
 
+def read_htr_file_as_array_motion(htr_file_path, scale=1.0, use_quaternion=False, end_effectors=()):
+    """
+    read a htr file into ArrayJointMotion without making posture objects
+    :param end_effectors: (joint name, translation) pairs. see Htr.add_end_effector
+    :return: ArrayJointMotion whose global transformations are computed lazily
+    """
+    htr = Htr()
+    htr.parse_htr_file(htr_file_path)
+    htr.add_end_effectors(end_effectors)
+    return htr.to_array_joint_motion(scale, use_quaternion)
+
+
 def read_htr_file_as_htr(htr_file_path):
     htr = Htr()
     htr.parse_htr_file(htr_file_path)
@@ -25,6 +43,9 @@ def write_htr_file(htr_file_path, joint_motion):
 
 class Htr:
     KEYWORDS = ["[Head]", "[SegmentNames&Hierarchy]", "[BasePosition]", "#Beginning of Data.", "#Beginning of Data"]
+    DATA_PATTERN = re.compile(r'^#Beginning of Data\.?[ \t\r]*$', re.MULTILINE)
+    SEGMENT_PATTERN = re.compile(r'^[ \t]*\[([^\]\n]*)\][ \t\r]*$', re.MULTILINE)
+    DATA_NAMES_PATTERN = re.compile(r'^[ \t]*#(.*)$', re.MULTILINE)
 
     class Joint:
         def __init__(self, name="no name"):
@@ -33,10 +54,10 @@ class Htr:
             self.base_translation = mm.o_vec3()
             self.base_euler_rotation = mm.o_vec3()
             self.base_bone_length = None
-            # the data per frame of the joint
-            self.translations = []
-            self.euler_rotations = []
-            self.sfs = []
+            # the data per frame of the joint : (F, 3), (F, 3), (F,) arrays
+            self.translations = np.zeros((0, 3))
+            self.euler_rotations = np.zeros((0, 3))
+            self.sfs = np.zeros(0)
             # the data name order of the data per frame
             self.data_names = []
 
@@ -63,7 +84,12 @@ class Htr:
         else:
             file = filepath_or_fileobject
 
-        lines = file.read().split("\n")
+        text = file.read()
+
+        # the data section is parsed in bulk by parse_htr_data. the other sections are parsed line by line
+        data_match = Htr.DATA_PATTERN.search(text)
+        data_start = len(text) if data_match is None else data_match.start()
+        lines = text[:data_start].splitlines()
         lines.reverse()
 
         while len(lines) > 0:
@@ -132,50 +158,51 @@ class Htr:
                                 joint.base_euler_rotation[2] = tokens[i]
                             elif self.base_position_names[i] == "BoneLength":
                                 joint.base_bone_length = tokens[i]
-            elif line == "#Beginning of Data." or line == "#Beginning of Data":
-                joint = None
-                while len(lines) > 0:
-                    line = lines.pop()
-                    if Htr._is_htr_keyword(line):
-                        lines.append(line)
-                        break
-                    tokens = line.split()
-                    if len(tokens) < 1:
-                        continue
-                    elif tokens[0][0] == "[" and tokens[0][-1] == "]":
-                        try:
-                            joint = self.joint_dict[tokens[0][1:-1]]
-                        except KeyError:
-                            raise KeyError("undefined joint data")
-                    elif joint is not None:
-                        if line[0] == "#":
-                            joint.data_names = line[1:].split()
-                        else:
-                            translation = mm.o_vec3()
-                            euler_rotation = mm.o_vec3()
-                            sf = 1.0
-                            for i in range(len(joint.data_names)):
-                                if joint.data_names[i] == "Tx":
-                                    translation[0] = tokens[i]
-                                elif joint.data_names[i] == "Ty":
-                                    translation[1] = tokens[i]
-                                elif joint.data_names[i] == "Tz":
-                                    translation[2] = tokens[i]
-                                elif joint.data_names[i] == "Rx":
-                                    euler_rotation[0] = tokens[i]
-                                elif joint.data_names[i] == "Ry":
-                                    euler_rotation[1] = tokens[i]
-                                elif joint.data_names[i] == "Rz":
-                                    euler_rotation[2] = tokens[i]
-                                elif joint.data_names[i] == "SF":
-                                    sf = float(tokens[i])
-                            joint.translations.append(translation)
-                            joint.euler_rotations.append(euler_rotation)
-                            joint.sfs.append(sf)
+
+        if data_match is not None:
+            self.parse_htr_data(text[data_match.end():])
 
         if isinstance(filepath_or_fileobject, str):
             file.close()
 
+    def parse_htr_data(self, text):
+        """
+        parse data blocks of segments. each block is read into a (F, len(data_names)) array at once
+        :param text: text of the data section following '#Beginning of Data'
+        :return:
+        """
+        # [text before the first segment, name, block, name, block, ...]
+        segments = Htr.SEGMENT_PATTERN.split(text)
+        for name, block in zip(segments[1::2], segments[2::2]):
+            if name.upper() == "ENDOFFILE":
+                break
+            try:
+                joint = self.joint_dict[name]
+            except KeyError:
+                raise KeyError("undefined joint data")
+            data_names_match = Htr.DATA_NAMES_PATTERN.search(block)
+            if data_names_match is not None:
+                joint.data_names = data_names_match.group(1).split()
+                block = block[data_names_match.end():]
+            if len(joint.data_names) < 1:
+                raise ValueError("the order of joint data is not defined")
+            data = np.fromstring(block, sep=" ")
+            data = data[:len(data) // len(joint.data_names) * len(joint.data_names)].reshape(-1, len(joint.data_names))
+            joint.translations = Htr._get_data_columns(data, joint.data_names, ["Tx", "Ty", "Tz"], 0.)
+            joint.euler_rotations = Htr._get_data_columns(data, joint.data_names, ["Rx", "Ry", "Rz"], 0.)
+            joint.sfs = Htr._get_data_columns(data, joint.data_names, ["SF"], 1.)[:, 0]
+
+    @staticmethod
+    def _get_data_columns(data, data_names, column_names, default_value):
+        """
+        :return: (F, len(column_names)) array of the columns. columns not in data_names are filled with default_value
+        """
+        columns = np.full((len(data), len(column_names)), default_value)
+        for i, column_name in enumerate(column_names):
+            if column_name in data_names:
+                columns[:, i] = data[:, data_names.index(column_name)]
+        return columns
+
     @staticmethod
     def _is_htr_keyword(keyword):
         for htr_keyword in Htr.KEYWORDS:
@@ -205,31 +232,66 @@ class Htr:
         child_joint.base_bone_length = 1.0
 
         total_frames = self.get_num_frame()
-        child_joint.translations = [translation] * total_frames
-        child_joint.euler_rotations = [mm.o_vec3()] * total_frames
-        child_joint.sfs = [1.0] * total_frames
+        child_joint.translations = np.tile(translation, (total_frames, 1))
+        child_joint.euler_rotations = np.zeros((total_frames, 3))
+        child_joint.sfs = np.ones(total_frames)
 
         child_joint.data_names = joint.data_names.copy()
 
+    def add_end_effectors(self, end_effectors):
+        """
+        :param end_effectors: (joint name, translation) pairs
+        """
+        for joint_name, translation in end_effectors:
+            self.add_end_effector(joint_name, mm.seq_to_vec3(translation))
+
     # ===========================================================================
     # Htr -> JointMotion
     # ===========================================================================
-    def to_joint_motion(self, scale=1.0):
+    def to_joint_motion(self, scale=1.0, lazy=False):
+        """
+        :param scale:
+        :param lazy: if True, global transformations are not computed here but when each posture is queried,
+        or at once by JointMotion.update_global_ts
+        :return: JointMotion
+        """
         skeleton = self.to_joint_skeleton(scale)
 
-        joint_motion = motion.JointMotion()
         base_ts = self._make_base_transformations(skeleton)
-        for frame in range(int(self.property_dict["NumFrames"])):
-            joint_posture = motion.JointPosture(skeleton)
-            self._set_local_rs_from_htr(frame, joint_posture, base_ts)
-            joint_posture.update_global_ts()
-            joint_motion.append(joint_posture)
+        num_frames = int(self.property_dict["NumFrames"])
+        root_positions = np.zeros((num_frames, 3))
+        local_rs = np.tile(mm.i_se3(), (num_frames, skeleton.get_len_nodes(), 1, 1))
+        self._set_local_rs_from_htr(num_frames, root_positions, local_rs, skeleton, base_ts)
+        global_ts = [None] * num_frames if lazy else motion.forward_kinematics(skeleton, root_positions, local_rs)
+
+        joint_motion = motion.JointMotion()
+        for frame in range(num_frames):
+            joint_motion.append(motion.JointPosture(skeleton, root_positions[frame], list(local_rs[frame]),
+                                                    global_ts[frame]))
 
         # print(range(len(self.property_dict["NumFrames"])))
 
         joint_motion.fps = float(self.property_dict["DataFrameRate"])
         return joint_motion
 
+    def to_array_joint_motion(self, scale=1.0, use_quaternion=False):
+        """
+        :param scale:
+        :param use_quaternion: see ArrayJointMotion
+        :return: ArrayJointMotion whose global transformations are computed lazily
+        """
+        skeleton = self.to_joint_skeleton(scale)
+
+        base_ts = self._make_base_transformations(skeleton)
+        num_frames = int(self.property_dict["NumFrames"])
+        root_positions = np.zeros((num_frames, 3))
+        local_rs = np.tile(mm.i_so3(), (num_frames, skeleton.get_len_nodes(), 1, 1))
+        self._set_local_rs_from_htr(num_frames, root_positions, local_rs, skeleton, base_ts)
+
+        joint_motion = motion.ArrayJointMotion(skeleton, root_positions, local_rs, use_quaternion, False)
+        joint_motion.fps = float(self.property_dict["DataFrameRate"])
+        return joint_motion
+
     def to_joint_skeleton(self, scale=1.0):
         def _rec_make_skeleton_joint(skeleton_: motion.Skeleton, htr_joint: Htr.Joint, parent=None):
             skeleton_joint = motion.JointNode(htr_joint.name)
@@ -283,23 +345,30 @@ class Htr:
             base_ts.append(np.dot(mm.vec3_to_se3(base_local_p), base_local_r))
         return base_ts
 
-    def _set_local_rs_from_htr(self, frame: int, joint_posture: motion.JointPosture, base_ts: list):
-        skeleton = joint_posture.get_skeleton()
-        for i in range(len(skeleton.get_nodes())):
-            skeleton_joint = skeleton.get_node_at(i)
+    def _set_local_rs_from_htr(self, num_frames: int, root_positions, local_rs, skeleton: motion.Skeleton,
+                               base_ts: list):
+        """
+        set root positions and local rotations of all frames at once
+        :param num_frames:
+        :param root_positions: (F, 3) output
+        :param local_rs: (F, J, 4, 4) or (F, J, 3, 3) output
+        :param skeleton:
+        :param base_ts: base transformations of joints
+        :return:
+        """
+        for i, skeleton_joint in enumerate(skeleton.get_nodes()):
             htr_joint = self.joint_dict[skeleton_joint.label]
+            base_local_r_so3 = mm.se3_to_so3(base_ts[i])
             if htr_joint is self.root:
-                print("root!!!")
-                root_position = mm.se3_to_vec3(np.dot(base_ts[i], mm.vec3_to_se3(htr_joint.translations[frame])))
-                joint_posture.set_root_position(root_position)
+                root_positions[:] = np.dot(htr_joint.translations[:num_frames], base_local_r_so3.T) + \
+                                    mm.se3_to_vec3(base_ts[i])
             # (base_transformation) (local_transformation) = (transformation)
             # XYZ order
-            local_r_so3 = np.dot(np.dot(mm.rot_x(htr_joint.euler_rotations[frame][0] * mm.RAD),
-                                        mm.rot_y(htr_joint.euler_rotations[frame][1] * mm.RAD)),
-                                 mm.rot_z(htr_joint.euler_rotations[frame][2] * mm.RAD))
-            base_local_r_so3 = mm.se3_to_so3(base_ts[i])
-            r_so3 = np.dot(base_local_r_so3, local_r_so3)
-            joint_posture.set_local_r_without_update(i, mm.so3_to_se3(r_so3, mm.o_vec3()))
+            euler_rotations = htr_joint.euler_rotations[:num_frames] * mm.RAD
+            local_r_so3 = np.matmul(np.matmul(mm.rot_x_batch(euler_rotations[:, 0]),
+                                              mm.rot_y_batch(euler_rotations[:, 1])),
+                                    mm.rot_z_batch(euler_rotations[:, 2]))
+            local_rs[:, i, :3, :3] = np.matmul(base_local_r_so3, local_r_so3)
 
 
 if __name__ == '__main__':
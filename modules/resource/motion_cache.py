@@ -0,0 +1,162 @@
+"""
+in-process cache of parsed motions
+
+motions are keyed by the content hash of the motion file and read options, so copies or renames of a file share
+an entry and an edited file misses. entries are evicted in least recently used order when their total size exceeds
+the byte budget. an optional disk tier keeps hmc files of parsed motions across processes
+
+a hit returns a new ArrayJointMotion over read-only arrays of the entry and a copy of its skeleton. the motion copies
+the arrays before its first modification, so callers can edit it without corrupting the cache
+
+motion_loader.load_motion and batch_loader.read_motion_files read source files through the default cache
+of the process unless use_cache is False
+"""
+import collections
+import copy
+import hashlib
+import os
+
+import motion.motion as motion
+import resource.hmc_loader as hmc_loader
+
+DEFAULT_MAX_BYTES = 1 << 30
+HASH_BLOCK_SIZE = 1 << 20
+
+
+class MotionCache:
+    class Entry:
+        def __init__(self, joint_motion):
+            self.skeleton = joint_motion.get_skeleton()
+            self.fps = joint_motion.fps
+            self.motion_name = joint_motion.motion_name
+            self.use_quaternion = joint_motion.is_quaternion_used()
+            self.root_positions = joint_motion.get_root_positions(False).copy()
+            self.local_rs = (joint_motion.get_local_qs(False) if self.use_quaternion
+                             else joint_motion.get_local_rs(False)).copy()
+            self.root_positions.flags.writeable = False
+            self.local_rs.flags.writeable = False
+            self.size = self.root_positions.nbytes + self.local_rs.nbytes
+
+        def to_motion(self):
+            joint_motion = motion.ArrayJointMotion(copy.deepcopy(self.skeleton), self.root_positions, self.local_rs,
+                                                   self.use_quaternion)
+            joint_motion.fps = self.fps
+            joint_motion.motion_name = self.motion_name
+            return joint_motion
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_cache_dir=None):
+        """
+        :param max_bytes: budget of total size of frame arrays of entries in memory
+        :param disk_cache_dir: directory of hmc files of the disk tier. no disk tier if None
+        """
+        self.max_bytes = max_bytes
+        self.disk_cache_dir = disk_cache_dir
+        self._entries = collections.OrderedDict()  # key -> Entry. least recently used first
+        self._size = 0
+        self._content_hashes = {}  # (path, mtime, size) -> content hash. files are hashed only when they change
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_size(self):
+        return self._size
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def read(self, motion_file_path, use_quaternion=False, **read_options):
+        """
+        :param motion_file_path: bvh or htr file path
+        :param use_quaternion: see ArrayJointMotion
+        :param read_options: keyword arguments of the reader such as scale and apply_root_offset
+        :return: ArrayJointMotion
+        """
+        if hmc_loader.get_source_format(motion_file_path) is None:
+            raise ValueError("no source reader for '%s'." % motion_file_path)
+        joint_motion = self.get(motion_file_path, use_quaternion, **read_options)
+        if joint_motion is None:
+            joint_motion = self.put(motion_file_path, hmc_loader.read_source_file(
+                motion_file_path, use_quaternion, **read_options), use_quaternion, **read_options)
+        return joint_motion
+
+    def get(self, motion_file_path, use_quaternion=False, **read_options):
+        """
+        :return: ArrayJointMotion of the entry in memory or in the disk tier. None if missed
+        """
+        key = self.get_key(motion_file_path, use_quaternion, **read_options)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry.to_motion()
+
+        disk_cache_file_path = self._get_disk_cache_file_path(key)
+        if disk_cache_file_path is None or not os.path.exists(disk_cache_file_path):
+            return None
+        entry = MotionCache.Entry(hmc_loader.read_hmc_file(disk_cache_file_path, False))
+        self._put(key, entry)
+        return entry.to_motion()
+
+    def put(self, motion_file_path, joint_motion, use_quaternion=False, **read_options):
+        """
+        add a motion read from the file by other means such as worker processes
+        :param joint_motion: ArrayJointMotion read by hmc_loader.read_source_file with the same options
+        :return: ArrayJointMotion of the new entry. joint_motion is not shared with the cache
+        """
+        key = self.get_key(motion_file_path, use_quaternion, **read_options)
+        disk_cache_file_path = self._get_disk_cache_file_path(key)
+        if disk_cache_file_path is not None:
+            if not os.path.isdir(self.disk_cache_dir):
+                os.makedirs(self.disk_cache_dir)
+            temp_file_path = '%s.%d.tmp' % (disk_cache_file_path, os.getpid())
+            hmc_loader.write_hmc_file(temp_file_path, joint_motion, joint_motion.get_root_positions(False).dtype)
+            os.replace(temp_file_path, disk_cache_file_path)
+
+        entry = MotionCache.Entry(joint_motion)
+        self._put(key, entry)
+        return entry.to_motion()
+
+    def get_key(self, motion_file_path, use_quaternion=False, **read_options):
+        stat = os.stat(motion_file_path)
+        file_key = (os.path.abspath(motion_file_path), stat.st_mtime_ns, stat.st_size)
+        content_hash = self._content_hashes.get(file_key)
+        if content_hash is None:
+            content_hash = hashlib.sha1()
+            with open(motion_file_path, 'rb') as file:
+                for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+                    content_hash.update(block)
+            content_hash = self._content_hashes[file_key] = content_hash.hexdigest()
+        motion_format = hmc_loader.get_source_format(motion_file_path)
+        options_key = repr((motion_format.name if motion_format else None, bool(use_quaternion),
+                            sorted(read_options.items()), hmc_loader.HMC_VERSION))
+        return '%s.%s' % (content_hash, hashlib.sha1(options_key.encode('utf-8')).hexdigest()[:16])
+
+    def _get_disk_cache_file_path(self, key):
+        if self.disk_cache_dir is None:
+            return None
+        return os.path.join(self.disk_cache_dir, '%s.hmc' % key)
+
+    def _put(self, key, entry):
+        self._entries[key] = entry
+        self._size += entry.size
+        # the newest entry is kept even if it exceeds the budget alone
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, evicted_entry = self._entries.popitem(last=False)
+            self._size -= evicted_entry.size
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = MotionCache()
+    return _default_cache
+
+
+def read_motion_file(motion_file_path, use_quaternion=False, **read_options):
+    """
+    read a motion file through the default MotionCache of this process
+    """
+    return get_default_cache().read(motion_file_path, use_quaternion, **read_options)
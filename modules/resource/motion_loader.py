@@ -0,0 +1,161 @@
+"""
+registry of motion file formats
+
+formats are registered by names of their reader modules and functions, so a reader module and its dependencies are
+imported only when a file of the format is read first. a file is matched to a format by magic bytes at its start
+and then by its extension
+
+load_motion is the common entry point of tools and batch jobs
+"""
+import importlib
+import os
+
+# number of bytes read from the start of a file to match magic bytes
+MAGIC_SIZE = 64
+
+# kinds of motions readers return
+JOINT_MOTION = 'joint'
+POINT_MOTION = 'point'
+
+
+class MotionFormat:
+    def __init__(self, name, module_name, reader_name, extensions=(), magic=None, kind=JOINT_MOTION,
+                 array_reader_name=None):
+        """
+        :param name: format name such as 'bvh'
+        :param module_name: module of the reader, imported on first use
+        :param reader_name: reader function of the module. reader(path, **read_options) returns a motion
+        :param extensions: lowercase file extensions including the dot. may have several dots like '.skeleton.xml'
+        :param magic: bytes the file starts with after leading whitespace. None if the format has no magic bytes
+        :param kind: JOINT_MOTION or POINT_MOTION. kind of motions the reader returns
+        :param array_reader_name: function of the module reading a file straight into ArrayJointMotion.
+        array_reader(path, use_quaternion=False, **read_options). None if the reader returns ArrayJointMotion already
+        """
+        self.name = name
+        self.module_name = module_name
+        self.reader_name = reader_name
+        self.extensions = tuple(extensions)
+        self.magic = magic
+        self.kind = kind
+        self.array_reader_name = array_reader_name
+        self._reader = None
+
+    def get_reader(self):
+        if self._reader is None:
+            self._reader = getattr(importlib.import_module(self.module_name), self.reader_name)
+        return self._reader
+
+    def get_array_reader(self):
+        """
+        :return: array_reader, or the reader if the format has no array_reader_name
+        """
+        if self.array_reader_name is None:
+            return self.get_reader()
+        return getattr(importlib.import_module(self.module_name), self.array_reader_name)
+
+    def match_extension(self, path):
+        """
+        :return: length of the matched extension. 0 if not matched
+        """
+        path = path.lower()
+        return max([len(extension) for extension in self.extensions if path.endswith(extension)] + [0])
+
+    def match_magic(self, head):
+        return self.magic is not None and head.lstrip().startswith(self.magic)
+
+
+_motion_formats = []
+
+
+def register_motion_format(name, module_name, reader_name, extensions=(), magic=None, kind=JOINT_MOTION,
+                           array_reader_name=None):
+    """
+    register a format. a registered format of the same name is replaced
+    :return: MotionFormat
+    """
+    motion_format = MotionFormat(name, module_name, reader_name, extensions, magic, kind, array_reader_name)
+    _motion_formats[:] = [registered for registered in _motion_formats if registered.name != name]
+    _motion_formats.append(motion_format)
+    return motion_format
+
+
+def get_motion_formats():
+    return list(_motion_formats)
+
+
+def get_motion_format(name):
+    for motion_format in _motion_formats:
+        if motion_format.name == name:
+            return motion_format
+    raise KeyError("no motion format '%s'." % name)
+
+
+def find_motion_format(motion_file_path, use_magic=True):
+    """
+    :param motion_file_path:
+    :param use_magic: if False, only the extension is matched and the file is not opened
+    :return: MotionFormat or None
+    """
+    if use_magic and os.path.isfile(motion_file_path):
+        with open(motion_file_path, 'rb') as file:
+            head = file.read(MAGIC_SIZE)
+        for motion_format in _motion_formats:
+            if motion_format.match_magic(head):
+                return motion_format
+
+    # the longest matched extension wins, so '.skeleton.xml' is preferred to '.xml'
+    matched_length, matched_format = 0, None
+    for motion_format in _motion_formats:
+        length = motion_format.match_extension(motion_file_path)
+        if length > matched_length:
+            matched_length, matched_format = length, motion_format
+    return matched_format
+
+
+def get_extensions(kind=None):
+    """
+    :param kind: JOINT_MOTION or POINT_MOTION. extensions of all formats if None
+    """
+    return [extension for motion_format in _motion_formats if kind is None or motion_format.kind == kind
+            for extension in motion_format.extensions]
+
+
+def load_motion(motion_file_path, format_name=None, use_cache=True, **read_options):
+    """
+    :param motion_file_path:
+    :param format_name: name of a registered format. found by find_motion_format if None
+    :param use_cache: if True, files of hmc_loader.SOURCE_FORMAT_NAMES are read through the default MotionCache
+    of the process as ArrayJointMotion, so a file loaded again is not parsed again
+    :param read_options: keyword arguments of the reader such as scale
+    :return: motion read by the reader of the format
+    """
+    if format_name is None:
+        motion_format = find_motion_format(motion_file_path)
+        if motion_format is None:
+            raise ValueError("unknown motion file format of '%s'." % motion_file_path)
+    else:
+        motion_format = get_motion_format(format_name)
+
+    if use_cache:
+        # imported on first use like readers, and because motion_cache imports this module through hmc_loader
+        hmc_loader = importlib.import_module('resource.hmc_loader')
+        if hmc_loader.get_source_format(motion_file_path) is motion_format:
+            return importlib.import_module('resource.motion_cache').read_motion_file(motion_file_path,
+                                                                                   **read_options)
+    return motion_format.get_reader()(motion_file_path, **read_options)
+
+
+# ===========================================================================
+# formats
+# ===========================================================================
+register_motion_format('bvh', 'resource.bvh_loader', 'read_bvh_file', ('.bvh',), b'HIERARCHY',
+                       array_reader_name='read_bvh_file_as_array_motion')
+register_motion_format('htr', 'resource.htr_loader', 'read_htr_file', ('.htr',),
+                       array_reader_name='read_htr_file_as_array_motion')
+# magic is hmc_loader.HMC_MAGIC
+register_motion_format('hmc', 'resource.hmc_loader', 'read_hmc_file', ('.hmc',), b'HMC\x00\x00\x00\x00\x01')
+# magic is hmz_loader.HMZ_MAGIC
+register_motion_format('hmz', 'resource.hmz_loader', 'read_hmz_file', ('.hmz',), b'HMZ\x00\x00\x00\x00\x01')
+register_motion_format('trc', 'resource.trc_loader', 'read_trc_file', ('.trc',), b'PathFileType', POINT_MOTION)
+register_motion_format('ogre_skeleton', 'resource.ogre_skeleton_loader', 'read_ogre_skeleton_animation',
+                       ('.skeleton.xml',))
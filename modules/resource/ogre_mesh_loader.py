@@ -0,0 +1,149 @@
+"""
+streaming reader of Ogre mesh xml files (.mesh.xml) into arrays for cpu skinning
+"""
+import os
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+import motion.motion as motion
+import motion.skinning as skinning
+import resource.ogre_skeleton_loader as ogre_skeleton_loader
+
+
+def read_ogre_mesh_file(mesh_file_path, scale=1.0):
+    """
+    :return: OgreMesh
+    """
+    ogre_mesh = OgreMesh()
+    ogre_mesh.parse_ogre_mesh_file(mesh_file_path)
+    ogre_mesh.positions *= scale
+    return ogre_mesh
+
+
+def read_ogre_skin_mesh_files(mesh_file_path, scale=1.0, skeleton_file_path=None,
+                              max_influences=skinning.DEFAULT_MAX_INFLUENCES):
+    """
+    :param mesh_file_path:
+    :param scale:
+    :param skeleton_file_path: skeletonlink of the mesh file in the same directory if None
+    :param max_influences: K of skin arrays
+    :return: ogre_mesh, skin, joint_motions
+    skin : LinearBlendSkin of vertices of ogre_mesh bound to the binding pose of the skeleton
+    joint_motions : list of ArrayJointMotion of animations of the skeleton
+    """
+    ogre_mesh = read_ogre_mesh_file(mesh_file_path, scale)
+    if skeleton_file_path is None:
+        if ogre_mesh.skeleton_link is None:
+            raise ValueError("no skeleton file of '%s'" % mesh_file_path)
+        skeleton_file_path = os.path.join(os.path.dirname(mesh_file_path), ogre_mesh.skeleton_link + '.xml')
+
+    ogre_skeleton = ogre_skeleton_loader.read_ogre_skeleton_file_as_ogre_skeleton(skeleton_file_path)
+    skeleton, initial_rs = ogre_skeleton.to_joint_skeleton(scale)
+    joint_motions = [ogre_skeleton.to_joint_motion(skeleton, initial_rs, animation, scale)
+                     for animation in ogre_skeleton.animations]
+
+    joint_indices, joint_weights = ogre_mesh.get_skin_arrays(max_influences, ogre_skeleton.get_joint_indices(skeleton))
+    bind_global_ts = motion.forward_kinematics(skeleton, np.zeros((1, 3)), np.asarray(initial_rs)[np.newaxis])[0]
+    skin = skinning.LinearBlendSkin(ogre_mesh.positions, joint_indices, joint_weights, bind_global_ts)
+    return ogre_mesh, skin, joint_motions
+
+
+class OgreMesh:
+    def __init__(self):
+        # (V, 3) vertex positions of shared geometry followed by those of submesh geometries
+        self.positions = np.zeros((0, 3))
+        # (N, 3) int array of vertex indices of triangles
+        self.faces = np.zeros((0, 3), int)
+        # material name -> int array of indices of faces of the submesh
+        self.submesh_faces = {}
+        self.skeleton_link = None
+        # vertex bone assignments : (A,) arrays of vertex index, bone id and weight
+        self.assignment_vertices = np.zeros(0, int)
+        self.assignment_bones = np.zeros(0, int)
+        self.assignment_weights = np.zeros(0)
+
+    def get_vertex_num(self):
+        return len(self.positions)
+
+    # ===========================================================================
+    # read functions
+    # ===========================================================================
+    def parse_ogre_mesh_file(self, filepath_or_fileobject):
+        positions = []
+        faces = []
+        submesh_faces = {}
+        assignments = []
+
+        # vertex indices of a submesh having its own geometry start after vertices read before it
+        vertex_base = 0
+        material = None
+
+        for event, element in ElementTree.iterparse(filepath_or_fileobject, ('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if tag == 'submesh':
+                    material = element.get('material')
+                    submesh_faces.setdefault(material, [])
+                    vertex_base = 0 if element.get('usesharedvertices', 'true') == 'true' else len(positions)
+                elif tag == 'sharedgeometry':
+                    vertex_base = len(positions)
+                continue
+
+            if tag == 'position':
+                positions.append((float(element.get('x')), float(element.get('y')), float(element.get('z'))))
+            elif tag == 'face':
+                submesh_faces[material].append(len(faces))
+                faces.append((vertex_base + int(element.get('v1')), vertex_base + int(element.get('v2')),
+                              vertex_base + int(element.get('v3'))))
+            elif tag == 'vertexboneassignment':
+                assignments.append((vertex_base + int(element.get('vertexindex')), int(element.get('boneindex')),
+                                    float(element.get('weight'))))
+            elif tag == 'skeletonlink':
+                self.skeleton_link = element.get('name')
+            elif tag == 'submesh':
+                material = None
+                vertex_base = 0
+            elif tag == 'sharedgeometry':
+                vertex_base = 0
+            if tag in ('vertex', 'face', 'vertexboneassignment'):
+                element.clear()
+
+        self.positions = np.array(positions, float).reshape(-1, 3)
+        self.faces = np.array(faces, int).reshape(-1, 3)
+        self.submesh_faces = {name: np.array(indices, int) for name, indices in submesh_faces.items()}
+        assignments = np.array(assignments, float).reshape(-1, 3)
+        self.assignment_vertices = assignments[:, 0].astype(int)
+        self.assignment_bones = assignments[:, 1].astype(int)
+        self.assignment_weights = assignments[:, 2]
+
+    # ===========================================================================
+    # OgreMesh -> skin arrays
+    # ===========================================================================
+    def get_vertex_bone_weights(self, bone_to_joint=None):
+        """
+        :param bone_to_joint: array of joint index of each bone id, -1 for unused ids. bone ids are used if None
+        :return: list of lists of (joint index, weight) of each vertex
+        """
+        bones = self.assignment_bones
+        if bone_to_joint is not None:
+            bone_to_joint = np.asarray(bone_to_joint, int)
+            unknown = (bones < 0) | (bones >= len(bone_to_joint))
+            unknown[~unknown] = bone_to_joint[bones[~unknown]] < 0
+            if np.any(unknown):
+                raise ValueError("vertex bone assignments refer to bones not in the skeleton: %s"
+                                 % sorted(set(bones[unknown].tolist())))
+            bones = bone_to_joint[bones]
+        vertex_bone_weights = [[] for _ in range(self.get_vertex_num())]
+        for vertex, bone, weight in zip(self.assignment_vertices.tolist(), bones.tolist(),
+                                        self.assignment_weights.tolist()):
+            vertex_bone_weights[vertex].append((bone, weight))
+        return vertex_bone_weights
+
+    def get_skin_arrays(self, max_influences=skinning.DEFAULT_MAX_INFLUENCES, bone_to_joint=None):
+        """
+        :param max_influences: K
+        :param bone_to_joint: see get_vertex_bone_weights
+        :return: (V, K) joint_indices, (V, K) joint_weights. see skinning.get_skin_arrays
+        """
+        return skinning.get_skin_arrays(self.get_vertex_bone_weights(bone_to_joint), max_influences)
@@ -0,0 +1,269 @@
+"""
+streaming reader of Ogre skeleton xml files (.skeleton.xml)
+
+the file is read by iterparse, so no DOM of the whole file is built. keyframes of each track are collected into
+arrays and resampled at evenly spaced frames, their rotations are composed with the binding pose rotations in batch,
+and forward kinematics runs once over all frames of each animation
+
+joints of motions have fixed offsets, so translations of tracks are used only for the root bone
+"""
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+import hmath.mm_math as mm
+import hmath.mm_quaternion as mq
+import motion.motion as motion
+
+# keyframe times are compared in this number of decimals to find the shortest interval of keyframes
+KEY_TIME_DECIMALS = 4
+
+
+def read_ogre_skeleton_file(skeleton_file_path, scale=1.0, fps=None):
+    """
+    :param skeleton_file_path:
+    :param scale:
+    :param fps: see OgreSkeleton.to_joint_motion
+    :return: skeleton, initial_rs, joint_motions
+    initial_rs : list of SO3 of binding pose in order of skeleton nodes
+    joint_motions : list of ArrayJointMotion of animations
+    """
+    ogre_skeleton = OgreSkeleton()
+    ogre_skeleton.parse_ogre_skeleton_file(skeleton_file_path)
+    skeleton, initial_rs = ogre_skeleton.to_joint_skeleton(scale)
+    joint_motions = [ogre_skeleton.to_joint_motion(skeleton, initial_rs, animation, scale, fps)
+                     for animation in ogre_skeleton.animations]
+    return skeleton, initial_rs, joint_motions
+
+
+def read_ogre_skeleton_animation(skeleton_file_path, scale=1.0, animation_name=None, fps=None):
+    """
+    :param skeleton_file_path:
+    :param scale:
+    :param animation_name: the first animation if None
+    :param fps: see OgreSkeleton.to_joint_motion
+    :return: ArrayJointMotion of the animation
+    """
+    ogre_skeleton = read_ogre_skeleton_file_as_ogre_skeleton(skeleton_file_path)
+    animations = [animation for animation in ogre_skeleton.animations
+                  if animation_name is None or animation.name == animation_name]
+    if len(animations) == 0:
+        raise ValueError("no animation '%s' in '%s'" % (animation_name, skeleton_file_path))
+    skeleton, initial_rs = ogre_skeleton.to_joint_skeleton(scale)
+    return ogre_skeleton.to_joint_motion(skeleton, initial_rs, animations[0], scale, fps)
+
+
+def read_ogre_skeleton_file_as_ogre_skeleton(skeleton_file_path):
+    ogre_skeleton = OgreSkeleton()
+    ogre_skeleton.parse_ogre_skeleton_file(skeleton_file_path)
+    return ogre_skeleton
+
+
+class OgreSkeleton:
+    class Bone:
+        def __init__(self, name, bone_id=-1):
+            self.name = name
+            # boneindex of vertex bone assignments of meshes
+            self.id = bone_id
+            self.position = mm.o_vec3()
+            self.rotation_axis = np.array([1., 0., 0.])
+            self.rotation_angle = 0.
+            self.parent_name = None
+
+    class Track:
+        def __init__(self, bone_name):
+            self.bone_name = bone_name
+            # keyframe data : (K,), (K, 3), (K, 3), (K,) arrays
+            self.times = []
+            self.translations = []
+            self.rotation_axes = []
+            self.rotation_angles = []
+
+    class Animation:
+        def __init__(self, name, length):
+            self.name = name
+            self.length = length
+            self.tracks = []
+
+    def __init__(self):
+        # bones in order of the file
+        self.bones = []
+        self.animations = []
+
+    # ===========================================================================
+    # read functions
+    # ===========================================================================
+    def parse_ogre_skeleton_file(self, filepath_or_fileobject):
+        bone_dict = {}
+        bone = None
+        animation = None
+        track = None
+        keyframe = None
+
+        for event, element in ElementTree.iterparse(filepath_or_fileobject, ('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if tag == 'bone':
+                    bone = OgreSkeleton.Bone(element.get('name'), int(element.get('id', len(self.bones))))
+                    bone_dict[bone.name] = bone
+                    self.bones.append(bone)
+                elif tag == 'animation':
+                    animation = OgreSkeleton.Animation(element.get('name'), float(element.get('length', 0.)))
+                    self.animations.append(animation)
+                elif tag == 'track':
+                    track = OgreSkeleton.Track(element.get('bone'))
+                    animation.tracks.append(track)
+                elif tag == 'keyframe':
+                    # translation, rotation axis, rotation angle
+                    keyframe = [(0., 0., 0.), (1., 0., 0.), 0.]
+                    track.times.append(float(element.get('time')))
+                continue
+
+            # attributes are read at 'end' events because they are complete only then
+            if tag == 'boneparent':
+                bone_dict[element.get('bone')].parent_name = element.get('parent')
+            elif keyframe is not None:
+                if tag == 'translate':
+                    keyframe[0] = OgreSkeleton._get_xyz(element)
+                elif tag == 'axis':
+                    keyframe[1] = OgreSkeleton._get_xyz(element)
+                elif tag == 'rotate':
+                    keyframe[2] = float(element.get('angle'))
+                elif tag == 'keyframe':
+                    track.translations.append(keyframe[0])
+                    track.rotation_axes.append(keyframe[1])
+                    track.rotation_angles.append(keyframe[2])
+                    keyframe = None
+                    element.clear()
+            elif bone is not None:
+                if tag == 'position':
+                    bone.position = np.array(OgreSkeleton._get_xyz(element))
+                elif tag == 'axis':
+                    bone.rotation_axis = np.array(OgreSkeleton._get_xyz(element))
+                elif tag == 'rotation':
+                    bone.rotation_angle = float(element.get('angle'))
+                elif tag == 'bone':
+                    bone = None
+            elif tag == 'track':
+                track.times = np.array(track.times, float)
+                track.translations = np.array(track.translations, float).reshape(-1, 3)
+                track.rotation_axes = np.array(track.rotation_axes, float).reshape(-1, 3)
+                track.rotation_angles = np.array(track.rotation_angles, float)
+                track = None
+                element.clear()
+
+    @staticmethod
+    def _get_xyz(element):
+        return float(element.get('x')), float(element.get('y')), float(element.get('z'))
+
+    # ===========================================================================
+    # OgreSkeleton -> Skeleton, JointMotion
+    # ===========================================================================
+    def to_joint_skeleton(self, scale=1.0):
+        """
+        :param scale:
+        :return: skeleton, initial_rs. nodes are added parent first, so their order may differ from bones
+        """
+        roots = [bone for bone in self.bones if bone.parent_name is None]
+        if len(roots) != 1:
+            raise ValueError("ogre skeleton must have one root bone")
+        children_dict = {}
+        for bone in self.bones:
+            children_dict.setdefault(bone.parent_name, []).append(bone)
+
+        skeleton = motion.Skeleton()
+        initial_rs = []
+        stack = [(roots[0], None)]
+        while len(stack) > 0:
+            bone, parent_node = stack.pop()
+            node = motion.JointNode(bone.name, bone.position * scale)
+            if parent_node is None:
+                skeleton.set_root(node)
+            else:
+                skeleton.add_node(node, parent_node)
+            initial_rs.append(mm.exp(bone.rotation_axis, bone.rotation_angle))
+            stack.extend((child, node) for child in reversed(children_dict.get(bone.name, [])))
+        return skeleton, initial_rs
+
+    def get_joint_indices(self, skeleton):
+        """
+        :param skeleton: skeleton made by to_joint_skeleton
+        :return: int array of skeleton node index of each bone id. -1 for unused ids
+        """
+        joint_indices = -np.ones(max([bone.id for bone in self.bones] + [-1]) + 1, int)
+        for bone in self.bones:
+            joint_indices[bone.id] = skeleton.get_index_by_label(bone.name)
+        return joint_indices
+
+    def to_joint_motion(self, skeleton, initial_rs, animation, scale=1.0, fps=None):
+        """
+        frames are evenly spaced from the first to the last keyframe time of all tracks. each track is interpolated at
+        frames between its own keyframes, by slerp for rotations and lerp for translations, and clamped to its first
+        and last keyframes. translations of tracks of bones other than the root are ignored
+        :param skeleton: skeleton made by to_joint_skeleton
+        :param initial_rs: binding pose rotations made by to_joint_skeleton
+        :param animation: one of self.animations
+        :param scale:
+        :param fps: frames per second to resample tracks. if None, the shortest interval between keyframe times of
+        all tracks is a frame
+        :return: ArrayJointMotion with global transformations computed
+        """
+        times = OgreSkeleton._get_frame_times(animation, fps)
+        root_positions = np.zeros((len(times), 3))
+        local_rs = np.tile(np.asarray(initial_rs), (len(times), 1, 1)).reshape(len(times), -1, 3, 3)
+
+        root_name = skeleton.get_root().label
+        for track in animation.tracks:
+            if len(track.times) == 0:
+                continue
+            index = skeleton.get_index_by_label(track.bone_name)
+            translations, rotations = OgreSkeleton._interpolate_track(track, times)
+            if track.bone_name == root_name:
+                root_positions[:] = translations * scale
+            local_rs[:, index] = np.matmul(local_rs[:, index], rotations)
+
+        joint_motion = motion.ArrayJointMotion(skeleton, root_positions, local_rs)
+        joint_motion.motion_name = animation.name
+        if len(times) > 1:
+            joint_motion.fps = (len(times) - 1) / (times[-1] - times[0])
+        joint_motion.update_global_ts()
+        return joint_motion
+
+    @staticmethod
+    def _get_frame_times(animation, fps=None):
+        """
+        :return: (T,) evenly spaced times from the first to the last keyframe time of all tracks
+        """
+        key_times = np.concatenate([track.times for track in animation.tracks] + [np.zeros(0)])
+        if len(key_times) == 0:
+            return key_times
+        first_time, last_time = key_times.min(), key_times.max()
+        if fps is None:
+            # times are rounded, so keyframes of tracks written with rounding errors fall on the same frame
+            intervals = np.diff(np.unique(np.round(key_times, KEY_TIME_DECIMALS)))
+            if len(intervals) == 0:
+                return np.array([first_time])
+            frame_interval = intervals.min()
+        else:
+            frame_interval = 1. / fps
+        frame_num = int(round((last_time - first_time) / frame_interval)) + 1
+        return np.linspace(first_time, last_time, max(frame_num, 2 if last_time > first_time else 1))
+
+    @staticmethod
+    def _interpolate_track(track, times):
+        """
+        :param track: Track having at least one keyframe
+        :param times: (T,) sorted times
+        :return: (T, 3) translations, (T, 3, 3) SO3 of the track at times
+        """
+        key_num = len(track.times)
+        indices = np.clip(np.searchsorted(track.times, times, 'right') - 1, 0, key_num - 1)
+        next_indices = np.minimum(indices + 1, key_num - 1)
+        durations = track.times[next_indices] - track.times[indices]
+        ts = np.clip((times - track.times[indices]) / np.where(durations > 0., durations, 1.), 0., 1.)
+
+        translations = track.translations[indices] + \
+            ts[:, np.newaxis] * (track.translations[next_indices] - track.translations[indices])
+        key_qs = mq.so3_to_quat(mm.exp_batch(track.rotation_axes, track.rotation_angles))
+        rotations = mq.quat_to_so3(mq.slerp(key_qs[indices], key_qs[next_indices], ts))
+        return translations, rotations
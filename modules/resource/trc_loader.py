@@ -0,0 +1,96 @@
+import math
+import re
+
+import numpy as np
+
+import hmath.mm_math as mm
+import motion.motion as motion
+
+# trc files are z-up. rotates them to y-up
+TRC_TO_Y_UP = mm.exp(np.array([1., 0., 0.]), -math.pi / 2.)
+
+
+def read_trc_file(trc_file_path, scale=1.0):
+    trc = Trc()
+    trc.parse_trc_file(trc_file_path)
+    point_motion = trc.to_point_motion(scale)
+    return point_motion
+
+
+def read_trc_file_as_trc(trc_file_path):
+    trc = Trc()
+    trc.parse_trc_file(trc_file_path)
+    return trc
+
+
+class Trc:
+    """
+    A Trc class stores marker names and marker positions read from a trc file.
+
+    line 0 : PathFileType ...
+    line 1, 2 : names and values of header properties such as DataRate, NumFrames and NumMarkers
+    line 3 : Frame# Time (marker name) ...
+    line 4 : X1 Y1 Z1 X2 ...
+    following lines : frame number, time and x, y, z of each marker separated by tabs. missing values are empty fields
+    """
+    HEADER_LINE_NUM = 5
+    EMPTY_FIELD_PATTERN = re.compile(r'(?<=\t)(?=\t|$)', re.MULTILINE)
+
+    def __init__(self):
+        self.property_dict = {}
+        self.marker_names = []
+        # (F, M, 3) array of marker positions. NaN where markers are missing
+        self.positions = np.zeros((0, 0, 3))
+
+    def get_num_frame(self):
+        return len(self.positions)
+
+    # ===========================================================================
+    # read functions
+    # ===========================================================================
+    def parse_trc_file(self, filepath_or_fileobject):
+        if isinstance(filepath_or_fileobject, str):
+            file = open(filepath_or_fileobject)
+        else:
+            file = filepath_or_fileobject
+
+        lines = file.read().splitlines()
+        if len(lines) < Trc.HEADER_LINE_NUM:
+            raise ValueError("trc header missing")
+
+        self.property_dict = dict(zip(lines[1].split(), lines[2].split()))
+        # 'Subject:Marker' -> 'Marker'
+        self.marker_names = [name.split(':')[-1] for name in lines[3].split('\t')[2:] if name.strip() != '']
+        self.parse_trc_data([line for line in lines[Trc.HEADER_LINE_NUM:] if line.strip() != ''])
+
+        if isinstance(filepath_or_fileobject, str):
+            file.close()
+
+    def parse_trc_data(self, lines):
+        """
+        parse data lines into self.positions at once. empty fields and missing trailing fields become NaN
+        :param lines: data lines
+        :return:
+        """
+        column_num = 2 + 3 * len(self.marker_names)
+        padded_lines = []
+        for line in lines:
+            line = line.rstrip()
+            padded_lines.append(line + '\tnan' * (column_num - 1 - line.count('\t')))
+        values = np.fromstring(Trc.EMPTY_FIELD_PATTERN.sub('nan', '\n'.join(padded_lines)), sep=' ')
+        if len(values) != len(lines) * column_num:
+            raise ValueError("invalid trc data")
+        self.positions = values.reshape(len(lines), column_num)[:, 2:].reshape(len(lines), -1, 3)
+
+    # ===========================================================================
+    # Trc -> PointMotion
+    # ===========================================================================
+    def to_point_motion(self, scale=1.0):
+        """
+        :param scale:
+        :return: ArrayPointMotion in y-up coordinates. positions of missing markers are NaN
+        """
+        positions = np.dot(self.positions, TRC_TO_Y_UP.T) * scale
+        point_motion = motion.ArrayPointMotion(self.marker_names, positions)
+        point_motion.fps = float(self.property_dict.get('DataRate', motion.DEFAULT_FPS))
+        return point_motion